@@ -92,6 +92,26 @@ DATABASES = {
     }
 }
 
+# Profilo SQLite per la produzione (GYM_DB_PROFILE=production): WAL così letture
+# (admin, report) e scritture (check-in) non si bloccano a vicenda, BEGIN IMMEDIATE
+# perché le transazioni attendano il lock invece di fallire all'upgrade, attesa
+# fino a 20 secondi sul lock e connessioni persistenti.
+if os.environ.get('GYM_DB_PROFILE') == 'production':
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA busy_timeout=20000;'
+            'PRAGMA mmap_size=134217728;'
+            'PRAGMA cache_size=-20000;'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    }
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('GYM_DB_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -136,6 +156,16 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Consegna dei media (gym.delivery): '' = FileResponse da Django, 'nginx' = X-Accel-Redirect,
+# 'x-sendfile' = header X-Sendfile (Apache mod_xsendfile, lighttpd)
+GYM_SENDFILE_BACKEND = os.environ.get('GYM_SENDFILE_BACKEND', '')
+# Location nginx "internal" che punta a MEDIA_ROOT (solo con backend nginx)
+GYM_SENDFILE_NGINX_PREFIX = os.environ.get('GYM_SENDFILE_NGINX_PREFIX', '/protected-media/')
+# Cache-Control max-age (secondi) dei file serviti da /media/
+GYM_MEDIA_MAX_AGE = int(os.environ.get('GYM_MEDIA_MAX_AGE', '3600'))
+# Foto dei membri (gym.photos): lato massimo in pixel dopo il caricamento e dimensione massima accettata
+GYM_PHOTO_MAX_SIZE = int(os.environ.get('GYM_PHOTO_MAX_SIZE', '800'))
+GYM_PHOTO_MAX_UPLOAD_BYTES = int(os.environ.get('GYM_PHOTO_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -144,6 +174,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # QR Code settings
 QR_CODE_EXPIRATION = 300  # 5 minutes in seconds
+# QR nelle tessere PDF: 'vector' (disegnato come tracciato, nitido e leggero) o 'png' (il file salvato)
+GYM_CARD_QR_FORMAT = os.environ.get('GYM_CARD_QR_FORMAT', 'vector')
+# Tessere per foglio nell'azione admin "Stampa le tessere (più per foglio)": 2, 4, 6 o 9
+# (un altro valore viene portato al più vicino, con un avviso nell'admin)
+GYM_CARDS_PER_SHEET = int(os.environ.get('GYM_CARDS_PER_SHEET', '4'))
+# Cache delle tessere PDF per download e invii (gym.card_cache) e spazio massimo in byte
+GYM_CARD_CACHE_DIR = os.environ.get('GYM_CARD_CACHE_DIR') or MEDIA_ROOT / '.cache' / 'cards'
+GYM_CARD_CACHE_MAX_BYTES = int(os.environ.get('GYM_CARD_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
 
 # =====================
 # Email (Gmail SMTP)
@@ -155,3 +193,49 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '1') == '1'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '30'))
+# Coda delle email (gym.outbox, `manage.py send_outbox`): invii al minuto, tentativi e attesa
+# iniziale in secondi tra un tentativo e il successivo (raddoppia a ogni errore)
+GYM_OUTBOX_PER_MINUTE = int(os.environ.get('GYM_OUTBOX_PER_MINUTE', '20'))
+GYM_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('GYM_OUTBOX_MAX_ATTEMPTS', '5'))
+GYM_OUTBOX_RETRY_DELAY = int(os.environ.get('GYM_OUTBOX_RETRY_DELAY', '60'))
+
+# =====================
+# Scansione QR / kiosk
+# =====================
+# Numero massimo di UUID tenuti nella cache in-process del resolver (gym.resolver)
+GYM_RESOLVER_CACHE_SIZE = int(os.environ.get('GYM_RESOLVER_CACHE_SIZE', '2048'))
+# Secondi dopo cui una voce della cache scade: limita quanto restano visibili
+# le modifiche fatte da altri processi (0 = nessuna scadenza)
+GYM_RESOLVER_CACHE_TTL = float(os.environ.get('GYM_RESOLVER_CACHE_TTL', '30'))
+
+# Capienza massima per area (None = nessun limite)
+GYM_CAPACITY = {
+    'palestra': int(os.environ['GYM_CAPACITY_PALESTRA']) if os.environ.get('GYM_CAPACITY_PALESTRA') else None,
+    'sala': int(os.environ['GYM_CAPACITY_SALA']) if os.environ.get('GYM_CAPACITY_SALA') else None,
+}
+# Ogni quanti secondi il percorso di check-in chiude le sessioni scadute e corregge i contatori
+GYM_OCCUPANCY_EXPIRY_INTERVAL = int(os.environ.get('GYM_OCCUPANCY_EXPIRY_INTERVAL', '60'))
+# Intervallo (secondi) del thread che chiude le sessioni scadute nel processo server; 0 = disattivato
+# (in alternativa schedulare `manage.py sweep_sessions`). Il thread parte solo in runserver,
+# gunicorn, uvicorn, daphne e hypercorn; per altri server impostare GYM_SESSION_SWEEP_IN_PROCESS=1
+GYM_SESSION_SWEEP_INTERVAL = int(os.environ.get('GYM_SESSION_SWEEP_INTERVAL', '0'))
+
+# Scritture del registro accessi serializzate su un thread dedicato (gym.writer)
+GYM_SINGLE_WRITER = os.environ.get('GYM_SINGLE_WRITER', '0') == '1'
+GYM_SINGLE_WRITER_TIMEOUT = int(os.environ.get('GYM_SINGLE_WRITER_TIMEOUT', '30'))
+
+# Accessi negati (solo audit) scritti in differita a blocchi (gym.audit)
+GYM_AUDIT_WRITE_BEHIND = os.environ.get('GYM_AUDIT_WRITE_BEHIND', '0') == '1'
+GYM_AUDIT_FLUSH_INTERVAL = float(os.environ.get('GYM_AUDIT_FLUSH_INTERVAL', '0.25'))
+GYM_AUDIT_FLUSH_SIZE = int(os.environ.get('GYM_AUDIT_FLUSH_SIZE', '200'))
+
+# Tempi per fase delle scansioni (gym.tracing): istogrammi in memoria, /api/scan/stats/
+GYM_SCAN_TRACING = os.environ.get('GYM_SCAN_TRACING', '1') == '1'
+# Se impostata, ogni processo salva qui i propri istogrammi per `manage.py scan_stats`
+GYM_SCAN_TRACE_DIR = os.environ.get('GYM_SCAN_TRACE_DIR') or None
+GYM_SCAN_TRACE_EXPORT_INTERVAL = int(os.environ.get('GYM_SCAN_TRACE_EXPORT_INTERVAL', '30'))
+
+# Broadcaster degli eventi di scansione per la dashboard presenze (SSE).
+# Quello di default vive nel processo; con più worker indicare una classe con la stessa interfaccia.
+GYM_EVENT_BROADCASTER = os.environ.get('GYM_EVENT_BROADCASTER', 'gym.events.LocalBroadcaster')
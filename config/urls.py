@@ -17,9 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from gym.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Media serviti anche in produzione: con GYM_SENDFILE_BACKEND il file lo spedisce il proxy
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
     path('', include('gym.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
@@ -1,12 +1,142 @@
-from django.contrib import admin
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db import transaction
+from django.http import FileResponse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Member, CheckInOut, SalaMember, SalaCheckInOut
+from .models import Member, CheckInOut, SalaMember, SalaCheckInOut, Occupancy, EmailOutbox
+from . import cards, eligibility, occupancy, outbox, policy, qr, renditions
+
+class AccessPolicyAdminMixin:
+    """Colonne di stato per Member e SalaMember calcolate in SQL dalle regole di gym.policy"""
+
+    def get_queryset(self, request):
+        # Un solo "oggi" per tutta la changelist
+        return policy.annotate(super().get_queryset(request), policy.current_date())
+
+    def _rule_label(self, obj, rule):
+        label = getattr(obj, f'{rule.name}_label', None)
+        if label is None:
+            label = rule.label(obj, policy.current_date())
+        color = {rule.labels[0]: 'green', rule.labels[1]: 'red'}.get(label, 'orange')
+        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, label)
+
+    def access_state_colored(self, obj):
+        color = 'green' if obj.access_state == eligibility.ACCESS_OK else 'red'
+        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, obj.get_access_state_display())
+    access_state_colored.short_description = 'Accesso'
+    access_state_colored.admin_order_field = 'access_state'
+
+    def subscription_status(self, obj):
+        active = getattr(obj, 'subscription_ok', None)
+        if active is None:
+            active = obj.is_active
+        if active:
+            return format_html(
+                '<span style="color: green;">✓ Attivo</span>'
+            )
+        return format_html(
+            '<span style="color: red;">✗ Scaduto</span>'
+        )
+    subscription_status.short_description = "Stato Abbonamento"
+    subscription_status.admin_order_field = 'subscription_ok'
+
+    def medical_certificate_status_colored(self, obj):
+        """Mostra lo stato del certificato medico con colori"""
+        return self._rule_label(obj, policy.MEDICAL_CERTIFICATE)
+    medical_certificate_status_colored.short_description = 'Stato Certificato'
+    medical_certificate_status_colored.admin_order_field = 'medical_certificate_ok'
+
+    def registration_fee_status_colored(self, obj):
+        return self._rule_label(obj, policy.REGISTRATION_FEE)
+    registration_fee_status_colored.short_description = 'Iscrizione (20€)'
+    registration_fee_status_colored.admin_order_field = 'registration_fee_ok'
+
+class QRCodePendingFilter(admin.SimpleListFilter):
+    title = 'QR Code'
+    parameter_name = 'qr'
+
+    def lookups(self, request, model_admin):
+        return (('pending', 'In attesa'), ('ready', 'Generato'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'pending':
+            return queryset.filter(qr.pending_filter())
+        if self.value() == 'ready':
+            return queryset.exclude(qr.pending_filter())
+        return queryset
+
+
+def _with_qr_files(members):
+    """Con il QR come immagine nella tessera serve il file: generato al volo se in attesa"""
+    for member in members:
+        qr.ensure_qr_code(member)
+        yield member
+
+
+class QRCodeAdminMixin:
+    """QR code generato su richiesta: nel salvataggio il membro resta "in attesa" """
+    actions = ['generate_qr_codes', 'print_cards', 'print_cards_sheet', 'queue_card_emails']
+
+    def qr_code_preview(self, obj):
+        if obj.qr_code_image:
+            return format_html('<img src="{}" width="100" height="100" />', obj.qr_code_image.url)
+        return format_html('<span style="color: orange;">⏳ In attesa</span>')
+    qr_code_preview.short_description = 'QR Code'
+
+    @admin.action(description="Genera i QR code in attesa")
+    def generate_qr_codes(self, request, queryset):
+        count = 0
+        for member in queryset.filter(qr.pending_filter()).iterator():
+            qr.ensure_qr_code(member)
+            count += 1
+        self.message_user(request, f"QR code generati: {count}")
+
+    @admin.action(description="Stampa le tessere (una per pagina)")
+    def print_cards(self, request, queryset):
+        return self._print_cards(queryset, per_sheet=1)
+
+    @admin.action(description="Stampa le tessere (più per foglio)")
+    def print_cards_sheet(self, request, queryset):
+        configured = getattr(settings, 'GYM_CARDS_PER_SHEET', 4)
+        per_sheet = cards.sheet_size(configured)
+        if per_sheet != configured:
+            # Il PDF è la risposta: l'avviso compare alla pagina successiva dell'admin
+            self.message_user(
+                request,
+                f"GYM_CARDS_PER_SHEET={configured} non valido (ammessi: {', '.join(map(str, cards.SHEET_GRIDS))}): "
+                f"stampate {per_sheet} tessere per foglio",
+                level=messages.WARNING,
+            )
+        return self._print_cards(queryset, per_sheet=per_sheet)
+
+    @admin.action(description="Invia QR code e tessera via email (in coda)")
+    def queue_card_emails(self, request, queryset):
+        queued, skipped = outbox.enqueue_many(queryset.iterator())
+        message = f"Email in coda: {queued}"
+        if skipped:
+            message += f" ({skipped} membri senza email)"
+        self.message_user(request, message)
+
+    def _print_cards(self, queryset, per_sheet):
+        members = queryset.order_by('last_name', 'first_name', 'pk').iterator(chunk_size=200)
+        if cards.card_qr_format() == 'png':
+            members = _with_qr_files(members)
+        # PDF su file temporaneo (cancellato alla chiusura), poi inviato a blocchi
+        output = tempfile.TemporaryFile()
+        cards.write_sheets(members, output, per_sheet=per_sheet)
+        output.seek(0)
+        filename = f"tessere_{self.model._meta.model_name}_{timezone.localdate():%Y%m%d}.pdf"
+        return FileResponse(output, as_attachment=True, filename=filename, content_type='application/pdf')
 
 @admin.register(Member)
-class MemberAdmin(admin.ModelAdmin):
-    list_display = ('last_name', 'first_name', 'email', 'phone', 'subscription_status', 'days_remaining', 'medical_certificate_status_colored', 'medical_certificate_days_remaining', 'registration_fee_status_colored', 'registration_fee_paid_until', 'note', 'photo_preview', 'take_photo_button', 'payment_type', 'receipt_number', 'qr_code_preview', 'download_qr_buttons', 'send_qr_email_button')
-    list_filter = ('subscription_start', 'subscription_end', 'medical_certificate_start', 'medical_certificate_end', 'payment_type', 'created_at')
+class MemberAdmin(AccessPolicyAdminMixin, QRCodeAdminMixin, admin.ModelAdmin):
+    list_display = ('last_name', 'first_name', 'email', 'phone', 'access_state_colored', 'subscription_status', 'days_remaining', 'medical_certificate_status_colored', 'medical_certificate_days_remaining', 'registration_fee_status_colored', 'registration_fee_paid_until', 'note', 'photo_preview', 'take_photo_button', 'payment_type', 'receipt_number', 'qr_code_preview', 'download_qr_buttons', 'send_qr_email_button')
+    list_filter = ('access_state', 'subscription_start', 'subscription_end', 'medical_certificate_start', 'medical_certificate_end', 'payment_type', 'created_at', QRCodePendingFilter)
     search_fields = ('first_name', 'last_name', 'email', 'phone')
     readonly_fields = ('uuid', 'qr_code_preview', 'photo_preview', 'take_photo_button', 'download_qr_buttons', 'created_at', 'updated_at')
     ordering = ['-updated_at']
@@ -37,49 +167,10 @@ class MemberAdmin(admin.ModelAdmin):
         }),
     )
 
-    def subscription_status(self, obj):
-        if obj.is_active:
-            return format_html(
-                '<span style="color: green;">✓ Attivo</span>'
-            )
-        return format_html(
-            '<span style="color: red;">✗ Scaduto</span>'
-        )
-    subscription_status.short_description = "Stato Abbonamento"
-
-    def qr_code_preview(self, obj):
-        if obj.qr_code_image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.qr_code_image.url)
-        return "Nessun QR Code"
-    qr_code_preview.short_description = 'QR Code'
-
-    def medical_certificate_status_colored(self, obj):
-        """Mostra lo stato del certificato medico con colori"""
-        status = obj.medical_certificate_status
-        if status == "Attivo":
-            color = 'green'
-        elif status == "Scaduto":
-            color = 'red'
-        else:
-            color = 'orange'
-        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, status)
-    medical_certificate_status_colored.short_description = 'Stato Certificato'
-
-    def registration_fee_status_colored(self, obj):
-        status = obj.registration_fee_status
-        if status == 'Attiva':
-            color = 'green'
-        elif status == 'Scaduta':
-            color = 'red'
-        else:
-            color = 'orange'
-        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, status)
-    registration_fee_status_colored.short_description = 'Iscrizione (20€)'
-
     def photo_preview(self, obj):
         """Mostra la foto del membro"""
         if obj.photo:
-            return format_html('<img src="{}" width="60" height="60" style="border-radius: 50%; object-fit: cover;" />', obj.photo.url)
+            return format_html('<img src="{}" width="60" height="60" style="border-radius: 50%; object-fit: cover;" loading="lazy" />', renditions.url(obj.photo, 'admin'))
         return "Nessuna foto"
     photo_preview.short_description = 'Foto'
 
@@ -115,12 +206,45 @@ class MemberAdmin(admin.ModelAdmin):
         return "Email non disponibile"
     send_qr_email_button.short_description = 'Invia Email'
 
+class AccessLogAdminForm(forms.ModelForm):
+    """Rifiuta una seconda sessione aperta per lo stesso membro.
+
+    Il vincolo sul DB (al massimo una sessione aperta per membro) non viene
+    validato dal form perché ``check_out`` è in sola lettura: senza questo
+    controllo il salvataggio finirebbe in un IntegrityError.
+    """
+
+    def clean(self):
+        cleaned_data = super().clean()
+        member = cleaned_data.get('member')
+        if member is not None and self.instance._state.adding:
+            model = self._meta.model
+            if model.objects.filter(member=member, check_out__isnull=True).exists():
+                raise forms.ValidationError(
+                    "Il membro ha già una sessione aperta: registrane l'uscita prima di aprirne un'altra."
+                )
+        return cleaned_data
+
+
+class AccessLogAdminMixin:
+    """Una sessione aperta dall'admin occupa un posto come un check-in (le cancellazioni le gestisce gym.occupancy)"""
+    form = AccessLogAdminForm
+
+    def save_model(self, request, obj, form, change):
+        opens_session = not change and obj.check_out is None
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if opens_session:
+                area = next(area for area, model in occupancy.ACCESS_LOG_MODELS.items() if model is self.model)
+                # Senza controllo della capienza: è una correzione manuale
+                occupancy.adjust(area, 1)
+
 @admin.register(CheckInOut)
-class CheckInOutAdmin(admin.ModelAdmin):
-    list_display = ('member', 'check_in', 'check_out', 'duration_display', 'colored_status', 'colored_subscription_status')
-    list_filter = ('check_in', 'check_out')
+class CheckInOutAdmin(AccessLogAdminMixin, admin.ModelAdmin):
+    list_display = ('member', 'check_in', 'check_out', 'auto_checkout', 'duration_display', 'colored_status', 'colored_subscription_status')
+    list_filter = ('check_in', 'check_out', 'auto_checkout')
     search_fields = ('member__first_name', 'member__last_name', 'member__email')
-    readonly_fields = ('check_in', 'check_out')
+    readonly_fields = ('check_in', 'check_out', 'auto_checkout')
 
     def duration_display(self, obj):
         if obj.duration:
@@ -142,9 +266,9 @@ class CheckInOutAdmin(admin.ModelAdmin):
     colored_subscription_status.short_description = 'Abbonamento al Check-in'
 
 @admin.register(SalaMember)
-class SalaMemberAdmin(admin.ModelAdmin):
-    list_display = ('last_name', 'first_name', 'email', 'phone', 'subscription_status', 'days_remaining', 'medical_certificate_status_colored', 'medical_certificate_days_remaining', 'registration_fee_status_colored', 'registration_fee_paid_until', 'course_type', 'note', 'photo_preview', 'take_photo_button', 'payment_type', 'receipt_number', 'qr_code_preview', 'download_qr_buttons', 'send_qr_email_button')
-    list_filter = ('subscription_start', 'subscription_end', 'medical_certificate_start', 'medical_certificate_end', 'payment_type', 'created_at')
+class SalaMemberAdmin(AccessPolicyAdminMixin, QRCodeAdminMixin, admin.ModelAdmin):
+    list_display = ('last_name', 'first_name', 'email', 'phone', 'access_state_colored', 'subscription_status', 'days_remaining', 'medical_certificate_status_colored', 'medical_certificate_days_remaining', 'registration_fee_status_colored', 'registration_fee_paid_until', 'course_type', 'note', 'photo_preview', 'take_photo_button', 'payment_type', 'receipt_number', 'qr_code_preview', 'download_qr_buttons', 'send_qr_email_button')
+    list_filter = ('access_state', 'subscription_start', 'subscription_end', 'medical_certificate_start', 'medical_certificate_end', 'payment_type', 'created_at', QRCodePendingFilter)
     search_fields = ('first_name', 'last_name', 'email', 'phone', 'course_type')
     readonly_fields = ('uuid', 'qr_code_preview', 'photo_preview', 'take_photo_button', 'download_qr_buttons', 'created_at', 'updated_at')
     ordering = ['-updated_at']
@@ -178,49 +302,10 @@ class SalaMemberAdmin(admin.ModelAdmin):
         }),
     )
 
-    def subscription_status(self, obj):
-        if obj.is_active:
-            return format_html(
-                '<span style="color: green;">✓ Attivo</span>'
-            )
-        return format_html(
-            '<span style="color: red;">✗ Scaduto</span>'
-        )
-    subscription_status.short_description = "Stato Abbonamento"
-
-    def qr_code_preview(self, obj):
-        if obj.qr_code_image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.qr_code_image.url)
-        return "Nessun QR Code"
-    qr_code_preview.short_description = 'QR Code'
-
-    def medical_certificate_status_colored(self, obj):
-        """Mostra lo stato del certificato medico con colori"""
-        status = obj.medical_certificate_status
-        if status == "Attivo":
-            color = 'green'
-        elif status == "Scaduto":
-            color = 'red'
-        else:
-            color = 'orange'
-        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, status)
-    medical_certificate_status_colored.short_description = 'Stato Certificato'
-
-    def registration_fee_status_colored(self, obj):
-        status = obj.registration_fee_status
-        if status == 'Attiva':
-            color = 'green'
-        elif status == 'Scaduta':
-            color = 'red'
-        else:
-            color = 'orange'
-        return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, status)
-    registration_fee_status_colored.short_description = 'Iscrizione (20€)'
-
     def photo_preview(self, obj):
         """Mostra la foto del membro"""
         if obj.photo:
-            return format_html('<img src="{}" width="60" height="60" style="border-radius: 50%; object-fit: cover;" />', obj.photo.url)
+            return format_html('<img src="{}" width="60" height="60" style="border-radius: 50%; object-fit: cover;" loading="lazy" />', renditions.url(obj.photo, 'admin'))
         return "Nessuna foto"
     photo_preview.short_description = 'Foto'
 
@@ -257,11 +342,11 @@ class SalaMemberAdmin(admin.ModelAdmin):
     send_qr_email_button.short_description = 'Invia Email'
 
 @admin.register(SalaCheckInOut)
-class SalaCheckInOutAdmin(admin.ModelAdmin):
-    list_display = ('member', 'check_in', 'check_out', 'duration_display', 'colored_status', 'colored_subscription_status')
-    list_filter = ('check_in', 'check_out')
+class SalaCheckInOutAdmin(AccessLogAdminMixin, admin.ModelAdmin):
+    list_display = ('member', 'check_in', 'check_out', 'auto_checkout', 'duration_display', 'colored_status', 'colored_subscription_status')
+    list_filter = ('check_in', 'check_out', 'auto_checkout')
     search_fields = ('member__first_name', 'member__last_name', 'member__email')
-    readonly_fields = ('check_in', 'check_out')
+    readonly_fields = ('check_in', 'check_out', 'auto_checkout')
 
     def duration_display(self, obj):
         if obj.duration:
@@ -280,4 +365,44 @@ class SalaCheckInOutAdmin(admin.ModelAdmin):
         color = 'green' if obj.subscription_status == 'attivo' else 'red'
         label = obj.get_subscription_status_display()
         return format_html('<span style="color: {}; font-weight: bold;">{}</span>', color, label)
-    colored_subscription_status.short_description = 'Abbonamento al Check-in' 
\ No newline at end of file
+    colored_subscription_status.short_description = 'Abbonamento al Check-in'
+
+@admin.register(Occupancy)
+class OccupancyAdmin(admin.ModelAdmin):
+    list_display = ('area', 'count', 'capacity_display', 'updated_at')
+    readonly_fields = ('area', 'count', 'updated_at')
+
+    def capacity_display(self, obj):
+        limit = occupancy.capacity(obj.area)
+        if limit is None:
+            return "Nessun limite"
+        color = 'red' if obj.count >= limit else 'green'
+        return format_html('<span style="color: {}; font-weight: bold;">{} / {}</span>', color, obj.count, limit)
+    capacity_display.short_description = 'Capienza'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'area', 'member_id', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'area')
+    search_fields = ('recipient',)
+    readonly_fields = ('area', 'member_id', 'recipient', 'status', 'attempts', 'next_attempt_at',
+                       'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description="Riprova subito le email selezionate")
+    def retry_now(self, request, queryset):
+        requeued, merged = outbox.requeue(queryset.order_by('-created_at'))
+        message = f"Email rimesse in coda: {requeued}"
+        if merged:
+            message += f" ({merged} già in coda per lo stesso membro, anticipate)"
+        self.message_user(request, message)
+
+    def has_add_permission(self, request):
+        return False
@@ -1,6 +1,40 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Eseguibili dei server in cui avviare il thread che chiude le sessioni scadute
+SERVER_PROGRAMS = {'gunicorn', 'uvicorn', 'daphne', 'hypercorn'}
+
+
 class GymConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gym'
-    verbose_name = 'Gestione Palestra' 
\ No newline at end of file
+    verbose_name = 'Gestione Palestra'
+
+    def ready(self):
+        # Registra i receiver (cache dei membri risolti, tessere in cache, miniature foto, contatori presenze)
+        from . import card_cache, occupancy, renditions, resolver  # noqa: F401
+
+        # Chiusura periodica delle sessioni scadute nel processo server (GYM_SESSION_SWEEP_INTERVAL)
+        if _is_server_process():
+            from . import sweeper
+            sweeper.start_scheduler()
+
+
+def _is_server_process():
+    """True solo nei server noti (runserver, gunicorn, uvicorn, daphne, hypercorn) o con
+    GYM_SESSION_SWEEP_IN_PROCESS=1 (es. uWSGI, mod_wsgi); mai nel processo che ricarica runserver"""
+    if os.environ.get('GYM_SESSION_SWEEP_IN_PROCESS') == '1':
+        return True
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program == '__main__.py':
+        # python -m gunicorn / python -m uvicorn
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVER_PROGRAMS:
+        return True
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    return (
+        program == 'manage.py' and command == 'runserver'
+        and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
+    )
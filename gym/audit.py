@@ -0,0 +1,177 @@
+"""
+Scrittura differita (write-behind) delle righe di solo audit.
+
+Un accesso negato produce una riga già chiusa che serve solo ai report: nessuna
+logica di check-in/check-out la rilegge. Con ``GYM_AUDIT_WRITE_BEHIND`` attivo la
+scansione risponde appena presa la decisione e la riga resta in un buffer in
+memoria, scritto con ``bulk_create`` ogni ``GYM_AUDIT_FLUSH_INTERVAL`` secondi o
+appena si accumulano ``GYM_AUDIT_FLUSH_SIZE`` righe, e comunque all'uscita del
+processo. Le sessioni (check-in riusciti, check-out) restano sincrone.
+
+Ogni scrittura è una transazione: se fallisce per una riga non valida le righe
+vengono riscritte una per volta e quelle ancora rifiutate finiscono nel log e
+vengono scartate; solo gli errori di connessione rimettono le righe nel buffer.
+
+Se il processo viene ucciso senza uscita pulita le righe ancora nel buffer
+(al massimo qualche centinaio di millisecondi di rifiuti) vanno perse.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, close_old_connections, transaction
+
+from . import writer
+
+logger = logging.getLogger(__name__)
+
+# Oltre questo numero di righe in attesa (es. DB irraggiungibile) le più vecchie vengono scartate
+MAX_PENDING_FACTOR = 50
+
+
+def enabled():
+    return getattr(settings, 'GYM_AUDIT_WRITE_BEHIND', False)
+
+
+class AuditBuffer:
+    def __init__(self, interval, size):
+        self.interval = interval
+        self.size = size
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='gym-audit-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Scrittura delle righe di audit non riuscita")
+            finally:
+                close_old_connections()
+
+    def flush(self, direct=False):
+        """Scrive le righe in attesa, un ``bulk_create`` per modello. Restituisce quante."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                if direct:
+                    written, unwritten = _write(rows)
+                else:
+                    written, unwritten = writer.run(_write, rows)
+            except Exception as exc:
+                # Nulla è stato scritto (transazione annullata): le righe tornano in testa al buffer
+                written, unwritten, error = 0, rows, exc
+            else:
+                error = None
+            if unwritten:
+                # DB non raggiungibile o bloccato: si riprova al prossimo giro
+                with self._lock:
+                    self._rows = (unwritten + self._rows)[-self.size * MAX_PENDING_FACTOR:]
+            if error is not None:
+                raise error
+            return written
+
+
+def _write(rows):
+    """Scrive le righe in una transazione; restituisce (scritte, da riprovare).
+
+    Se il blocco fallisce per una riga non valida (es. membro eliminato nel
+    frattempo) le righe vengono riscritte una per volta: quelle che falliscono
+    ancora vengono registrate nel log e scartate, così non bloccano le successive.
+    Da riprovare restano solo le righe non tentate per un errore di connessione.
+    """
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(type(row), []).append(row)
+    try:
+        with transaction.atomic():
+            for model, model_rows in by_model.items():
+                model.objects.bulk_create(model_rows)
+        return len(rows), []
+    except OperationalError:
+        _reset(rows)
+        raise
+    except DatabaseError:
+        _reset(rows)
+        logger.warning("Blocco di %d righe di audit rifiutato: scrittura una per volta", len(rows))
+
+    written = 0
+    for index, row in enumerate(rows):
+        try:
+            with transaction.atomic():
+                type(row).objects.bulk_create([row])
+        except OperationalError:
+            _reset(rows[index:])
+            return written, rows[index:]
+        except DatabaseError:
+            values = {field.attname: getattr(row, field.attname) for field in row._meta.concrete_fields}
+            logger.exception("Riga di audit %s scartata: %s", type(row).__name__, values)
+        else:
+            written += 1
+    return written, []
+
+
+def _reset(rows):
+    # bulk_create annullato dal rollback: le istanze tornano "da inserire"
+    for row in rows:
+        row.pk = None
+        row._state.adding = True
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer(
+                    interval=getattr(settings, 'GYM_AUDIT_FLUSH_INTERVAL', 0.25),
+                    size=getattr(settings, 'GYM_AUDIT_FLUSH_SIZE', 200),
+                )
+    return _buffer
+
+
+def enqueue(row):
+    """Mette in coda una riga di audit non ancora salvata"""
+    get_buffer().add(row)
+
+
+def flush():
+    return get_buffer().flush() if _buffer is not None else 0
+
+
+@atexit.register
+def _flush_at_exit():
+    if _buffer is not None and _buffer.pending():
+        try:
+            # All'uscita il thread scrittore potrebbe essere già fermo: si scrive da qui
+            _buffer.flush(direct=True)
+        except Exception:
+            logger.exception("Righe di audit perse all'uscita")
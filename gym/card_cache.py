@@ -0,0 +1,175 @@
+"""
+Cache su disco delle tessere PDF, indirizzata per contenuto.
+
+Il nome del file è l'impronta di ciò che è stampato sulla tessera
+(``cards.fingerprint``: dati anagrafici, date, stato, foto, parametri del QR,
+versione del layout), quindi una tessera in cache è valida finché l'impronta
+non cambia e non serve altro controllo:
+
+    <GYM_CARD_CACHE_DIR>/<modello>/<uuid>/<impronta>.pdf
+
+Download e invii ripetuti costano una lettura del file invece di un render con
+reportlab. Le versioni superate di un membro vengono eliminate quando se ne
+scrive una nuova e quando il membro viene salvato o eliminato (segnali). Lo
+spazio totale è limitato da ``GYM_CARD_CACHE_MAX_BYTES``: oltre il limite si
+eliminano le tessere usate meno di recente (la data di modifica del file viene
+aggiornata a ogni uso).
+
+La tessera riporta la data di generazione: quella in cache mostra il giorno in
+cui è stata prodotta (al primo download o invio, o da ``regenerate_qr_codes --cards``).
+"""
+import os
+import shutil
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cards
+from .models import Member, SalaMember
+from .regenerate import write_atomic
+
+# ``rendered``: la tessera è stata generata ora (non era in cache)
+CachedCard = namedtuple('CachedCard', 'path fingerprint rendered')
+
+# Dopo una potatura la cache scende a questa frazione del limite
+PRUNE_TARGET = 0.9
+
+_lock = threading.Lock()
+# Byte occupati stimati da questo processo (None = da ricalcolare dal disco)
+_size = None
+
+
+def cache_dir():
+    return str(getattr(settings, 'GYM_CARD_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, '.cache', 'cards')))
+
+
+def max_bytes():
+    return getattr(settings, 'GYM_CARD_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+
+
+def member_dir(member):
+    return os.path.join(cache_dir(), member._meta.model_name, str(member.uuid))
+
+
+def get(member, qr_format=None):
+    """Tessera del membro in cache, renderizzata e salvata se manca"""
+    qr_format = qr_format or cards.card_qr_format()
+    digest = cards.fingerprint(member, qr_format)
+    path = os.path.join(member_dir(member), f'{digest}.pdf')
+    try:
+        # Aggiorna la data di modifica: è l'ordine usato per l'espulsione LRU
+        os.utime(path)
+        return CachedCard(path, digest, False)
+    except FileNotFoundError:
+        pass
+
+    data = cards.render_card(member, qr_format)
+    _remove_versions(member, keep=path)
+    write_atomic(path, data)
+    _add(len(data))
+    return CachedCard(path, digest, True)
+
+
+def card_bytes(member, qr_format=None):
+    with open(get(member, qr_format).path, 'rb') as f:
+        return f.read()
+
+
+def evict(member):
+    """Elimina tutte le tessere in cache del membro"""
+    directory = member_dir(member)
+    freed = _tree_size(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    _add(-freed)
+
+
+def clear():
+    global _size
+    with _lock:
+        shutil.rmtree(cache_dir(), ignore_errors=True)
+        _size = 0
+
+
+def _remove_versions(member, keep):
+    freed = 0
+    try:
+        entries = list(os.scandir(member_dir(member)))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.path == keep or not entry.is_file():
+            continue
+        try:
+            size = entry.stat().st_size
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+        freed += size
+    _add(-freed)
+
+
+def _add(delta):
+    global _size
+    with _lock:
+        if _size is None:
+            _size = _tree_size(cache_dir())
+        else:
+            _size = max(_size + delta, 0)
+        if _size > max_bytes():
+            _size = _prune()
+
+
+def _prune():
+    """Elimina i file usati meno di recente fino a PRUNE_TARGET del limite; restituisce i byte rimasti.
+
+    Ricalcola la dimensione dal disco: corregge anche le stime degli altri processi.
+    """
+    files = []
+    for root, _dirs, names in os.walk(cache_dir()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _mtime, size, _path in files)
+    target = max_bytes() * PRUNE_TARGET
+    for _mtime, size, path in sorted(files):
+        if total <= target:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def _tree_size(directory):
+    total = 0
+    for root, _dirs, names in os.walk(directory):
+        for name in names:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_save, sender=SalaMember)
+def evict_saved_member(sender, instance, update_fields=None, **kwargs):
+    """Un salvataggio che può toccare i dati stampati invalida le tessere del membro"""
+    if update_fields is not None and not (set(update_fields) & cards.CARD_SAVED_FIELDS):
+        return
+    evict(instance)
+
+
+@receiver(post_delete, sender=Member)
+@receiver(post_delete, sender=SalaMember)
+def evict_deleted_member(sender, instance, **kwargs):
+    evict(instance)
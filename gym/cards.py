@@ -0,0 +1,354 @@
+"""
+Tessere PDF dei membri (palestra e sala).
+
+Un solo layout per download ed email, con colori e testi dell'area presi da
+``BRANDING``. La parte fissa della tessera (intestazione, riquadri, cornice del
+QR, piè di pagina) viene disegnata una volta per documento come form XObject e
+richiamata per ogni tessera: in un PDF con molte tessere il contenuto fisso c'è
+una volta sola. Per ogni membro si disegnano solo foto, dati, stati e QR.
+
+Le foto usano la rendition 'print' (``gym.renditions``, JPEG già ritagliato al
+riquadro della tessera), tenuta in una cache LRU e incorporata da reportlab così
+com'è, senza ricomprimerla. I font sono
+quelli standard del PDF: nessun file da caricare o incorporare.
+
+``render_card()`` non tocca il database e lavora anche su un'istanza non
+salvata: la usa ``regenerate_qr_codes`` nei processi worker.
+"""
+import hashlib
+import io
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from . import qr, renditions
+
+# Da incrementare quando cambia il layout: invalida le tessere già generate
+CARD_VERSION = 2
+
+BRANDING = {
+    'member': {
+        'primary_color': (0, 0.3, 0.6),  # Blu scuro
+        'title': "TESSERA PALESTRA LEVEL",
+        'qr_title': "CODICE QR PER CHECK-IN",
+        'footer': "LEVEL - Sistema di Gestione Palestra",
+        'footer_note': "Presenta questo QR code per l'accesso alla palestra",
+        'filename_prefix': 'tessera',
+    },
+    'salamember': {
+        'primary_color': (0.8, 0.2, 0.2),  # Rosso per sala
+        'title': "TESSERA SALA LEVEL",
+        'qr_title': "CODICE QR PER CHECK-IN SALA",
+        'footer': "LEVEL - Sistema di Gestione Sala",
+        'footer_note': "Presenta questo QR code per l'accesso alla sala",
+        'filename_prefix': 'tessera_sala',
+    },
+}
+
+SECONDARY_COLOR = (0.9, 0.9, 0.9)  # Grigio chiaro
+TEXT_COLOR = (0.2, 0.2, 0.2)  # Grigio scuro
+OK_COLOR = (0, 0.6, 0)
+KO_COLOR = (0.8, 0, 0)
+WARNING_COLOR = (0.8, 0.4, 0)  # Arancione per non specificato
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+INFO_TOP = PAGE_HEIGHT - 140
+PHOTO_X, PHOTO_Y, PHOTO_SIZE = 60, INFO_TOP - 100, 80
+INFO_X = 160
+QR_SECTION_Y = INFO_TOP - 220
+QR_SIZE = 250
+QR_X = (PAGE_WIDTH - QR_SIZE) / 2
+QR_Y = QR_SECTION_Y - QR_SIZE - 30
+
+# Tessere per foglio nella stampa in blocco: griglia (colonne, righe)
+SHEET_GRIDS = {1: (1, 1), 2: (1, 2), 4: (2, 2), 6: (2, 3), 9: (3, 3)}
+
+# Miniature delle foto (rendition 'print') tenute in memoria
+PHOTO_CACHE_SIZE = 256
+
+# Campi stampati sulla tessera: entrano nell'impronta insieme agli stati calcolati
+CARD_FIELDS = (
+    'uuid', 'first_name', 'last_name', 'email', 'phone',
+    'subscription_start', 'subscription_end',
+    'medical_certificate_start', 'medical_certificate_end',
+)
+# Campi il cui salvataggio può cambiare la tessera (gli stati dipendono solo dalle date)
+CARD_SAVED_FIELDS = frozenset(CARD_FIELDS) | {'photo', 'qr_code_image'}
+
+
+def card_qr_format():
+    """'vector' (tracciato disegnato nel PDF) oppure 'png' (il file salvato)"""
+    return getattr(settings, 'GYM_CARD_QR_FORMAT', 'vector')
+
+
+def branding(member):
+    return BRANDING[member._meta.model_name]
+
+
+def filename(member):
+    return f"{branding(member)['filename_prefix']}_{member.last_name}_{member.first_name}.pdf"
+
+
+def fingerprint(member, qr_format=None):
+    """Impronta di tutto ciò che finisce sulla tessera, esclusa la data di generazione.
+
+    Per i file (foto, QR come immagine) bastano nome, dimensione e data di modifica:
+    calcolarla costa qualche ``stat``, non la lettura delle foto.
+    """
+    qr_format = qr_format or card_qr_format()
+    parts = [str(CARD_VERSION), member._meta.model_name]
+    parts += [str(getattr(member, name)) for name in CARD_FIELDS]
+    parts += [str(member.is_active), str(member.is_medical_certificate_active)]
+    parts.append(_file_signature(member.photo))
+    if qr_format == 'png':
+        parts.append(_file_signature(member.qr_code_image))
+    parts += [qr.params_key(), qr_format]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _file_signature(field):
+    if not field:
+        return ''
+    try:
+        stat = os.stat(field.path)
+    except OSError:
+        return f'{field.name}:mancante'
+    return f'{field.name}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def render_card(member, qr_format=None):
+    """PDF della tessera. Con il QR in formato 'png' il file deve già esistere (vedi ``qr.ensure_qr_code``)."""
+    return render_cards([member], qr_format)
+
+
+def render_cards(members, qr_format=None):
+    """Un PDF con una tessera per pagina"""
+    buffer = io.BytesIO()
+    write_sheets(members, buffer, qr_format=qr_format)
+    return buffer.getvalue()
+
+
+def sheet_size(per_sheet):
+    """Il numero di tessere per foglio di SHEET_GRIDS più vicino a ``per_sheet`` (a pari distanza il minore)"""
+    return min(SHEET_GRIDS, key=lambda size: (abs(size - per_sheet), size))
+
+
+def write_sheets(members, fileobj, per_sheet=1, qr_format=None):
+    """Scrive in ``fileobj`` un PDF con le tessere, ``per_sheet`` per foglio. Restituisce quante.
+
+    ``members`` può essere un iteratore (es. ``queryset.iterator()``): i membri non
+    restano in memoria. reportlab tiene le pagine già compresse fino al salvataggio,
+    circa 2 KB a tessera: foto e QR ripetuti compaiono una volta sola nel file.
+    """
+    if per_sheet not in SHEET_GRIDS:
+        raise ValueError(f"Tessere per foglio non supportate: {per_sheet} (vedi sheet_size)")
+    columns, rows = SHEET_GRIDS[per_sheet]
+    cell_width, cell_height = PAGE_WIDTH / columns, PAGE_HEIGHT / rows
+    scale = min(cell_width / PAGE_WIDTH, cell_height / PAGE_HEIGHT)
+    p = canvas.Canvas(fileobj, pagesize=letter)
+    renderer = CardRenderer(p, qr_format)
+    count = 0
+    for member in members:
+        slot = count % per_sheet
+        if count and not slot:
+            p.showPage()
+        column, row = slot % columns, slot // columns
+        p.saveState()
+        p.translate(
+            column * cell_width + (cell_width - PAGE_WIDTH * scale) / 2,
+            PAGE_HEIGHT - (row + 1) * cell_height + (cell_height - PAGE_HEIGHT * scale) / 2,
+        )
+        p.scale(scale, scale)
+        renderer.draw(member)
+        if per_sheet > 1:
+            # Bordo di taglio
+            p.setStrokeColorRGB(0.7, 0.7, 0.7)
+            p.setLineWidth(0.5 / scale)
+            p.rect(0, 0, PAGE_WIDTH, PAGE_HEIGHT, fill=False, stroke=True)
+        p.restoreState()
+        count += 1
+    if count:
+        p.showPage()
+    p.save()
+    return count
+
+
+class CardRenderer:
+    """Disegna tessere su un canvas, a pagina intera nel sistema di coordinate corrente.
+
+    Per stampare più tessere per foglio basta traslare/scalare il canvas prima di ``draw``.
+    """
+
+    def __init__(self, canvas, qr_format=None):
+        self.canvas = canvas
+        self.qr_format = qr_format or card_qr_format()
+        self._templates = set()
+
+    def draw(self, member):
+        p = self.canvas
+        brand = branding(member)
+        p.doForm(self._template(member._meta.model_name, brand))
+        self._draw_photo(member, brand)
+        self._draw_info(member)
+        self._draw_qr(member)
+        # Data di generazione
+        p.setFillColorRGB(*brand['primary_color'])
+        p.setFont("Helvetica", 8)
+        p.drawString(40, 20, f"Generato il: {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
+
+    def _template(self, key, brand):
+        name = f'tessera_{key}'
+        if name not in self._templates:
+            p = self.canvas
+            p.beginForm(name)
+            _draw_static(p, brand)
+            p.endForm()
+            self._templates.add(name)
+        return name
+
+    def _draw_photo(self, member, brand):
+        p = self.canvas
+        photo = _photo_thumbnail(renditions.path(member.photo, 'print'))
+        if photo is not None:
+            p.drawImage(ImageReader(io.BytesIO(photo)), PHOTO_X, PHOTO_Y, width=PHOTO_SIZE, height=PHOTO_SIZE)
+            # Cornice foto
+            p.setStrokeColorRGB(*brand['primary_color'])
+            p.setLineWidth(2)
+            p.rect(PHOTO_X, PHOTO_Y, PHOTO_SIZE, PHOTO_SIZE, fill=False, stroke=True)
+        else:
+            # Placeholder per foto (assente o illeggibile)
+            p.setFillColorRGB(*brand['primary_color'])
+            p.rect(PHOTO_X, PHOTO_Y, PHOTO_SIZE, PHOTO_SIZE, fill=True, stroke=False)
+            p.setFillColorRGB(1, 1, 1)
+            p.setFont("Helvetica-Bold", 12)
+            p.drawCentredString(PHOTO_X + PHOTO_SIZE / 2, PHOTO_Y + PHOTO_SIZE / 2, "FOTO")
+
+    def _draw_info(self, member):
+        p = self.canvas
+        p.setFillColorRGB(*TEXT_COLOR)
+
+        # Nome e cognome grande
+        p.setFont("Helvetica-Bold", 18)
+        p.drawString(INFO_X, INFO_TOP - 25, f"{member.first_name} {member.last_name}")
+
+        # Altre informazioni
+        p.setFont("Helvetica", 12)
+        p.drawString(INFO_X, INFO_TOP - 50, f"Email: {member.email}")
+        p.drawString(INFO_X, INFO_TOP - 70, f"Telefono: {member.phone or '-'}")
+        p.drawString(INFO_X, INFO_TOP - 90, f"Abbonamento: {_period(member.subscription_start, member.subscription_end)}")
+
+        # Stato abbonamento con colore
+        p.setFillColorRGB(*(OK_COLOR if member.is_active else KO_COLOR))
+        p.setFont("Helvetica-Bold", 12)
+        p.drawString(INFO_X, INFO_TOP - 110, f"Stato Abbonamento: {'ATTIVO' if member.is_active else 'SCADUTO'}")
+
+        # Certificato Medico
+        if member.medical_certificate_start and member.medical_certificate_end:
+            p.setFillColorRGB(*TEXT_COLOR)
+            p.setFont("Helvetica", 12)
+            p.drawString(INFO_X, INFO_TOP - 130, f"Certificato: {_period(member.medical_certificate_start, member.medical_certificate_end)}")
+            valid = member.is_medical_certificate_active
+            p.setFillColorRGB(*(OK_COLOR if valid else KO_COLOR))
+            p.setFont("Helvetica-Bold", 12)
+            p.drawString(INFO_X, INFO_TOP - 150, f"Stato Certificato: {'VALIDO' if valid else 'SCADUTO'}")
+        else:
+            p.setFillColorRGB(*WARNING_COLOR)
+            p.setFont("Helvetica-Bold", 12)
+            p.drawString(INFO_X, INFO_TOP - 130, "Certificato Medico: NON SPECIFICATO")
+
+    def _draw_qr(self, member):
+        p = self.canvas
+        try:
+            if self.qr_format == 'vector':
+                qr.draw(p, member.uuid, QR_X, QR_Y, QR_SIZE)
+            else:
+                p.drawImage(member.qr_code_image.path, QR_X, QR_Y, width=QR_SIZE, height=QR_SIZE)
+        except Exception:
+            # Placeholder QR
+            p.setFillColorRGB(*SECONDARY_COLOR)
+            p.rect(QR_X, QR_Y, QR_SIZE, QR_SIZE, fill=True, stroke=True)
+            p.setFillColorRGB(*TEXT_COLOR)
+            p.setFont("Helvetica-Bold", 16)
+            p.drawCentredString(QR_X + QR_SIZE / 2, QR_Y + QR_SIZE / 2, "QR CODE")
+
+        # UUID sotto il QR
+        p.setFillColorRGB(*TEXT_COLOR)
+        p.setFont("Helvetica", 10)
+        p.drawCentredString(PAGE_WIDTH / 2, QR_Y - 20, f"ID: {member.uuid}")
+
+
+def _draw_static(p, brand):
+    """Parte della tessera uguale per tutti i membri dell'area"""
+    primary_color = brand['primary_color']
+
+    # Header con sfondo colorato
+    p.setFillColorRGB(*primary_color)
+    p.rect(0, PAGE_HEIGHT - 100, PAGE_WIDTH, 100, fill=True, stroke=False)
+
+    # Titolo principale
+    p.setFillColorRGB(1, 1, 1)  # Bianco
+    p.setFont("Helvetica-Bold", 24)
+    p.drawCentredString(PAGE_WIDTH / 2, PAGE_HEIGHT - 40, brand['title'])
+    p.setFont("Helvetica", 14)
+    p.drawCentredString(PAGE_WIDTH / 2, PAGE_HEIGHT - 65, "Codice QR Personale")
+
+    # Box informazioni con sfondo
+    p.setFillColorRGB(*SECONDARY_COLOR)
+    p.setStrokeColorRGB(0, 0, 0)
+    p.setLineWidth(1)
+    p.rect(40, INFO_TOP - 160, PAGE_WIDTH - 80, 160, fill=True, stroke=True)
+
+    # Separatore
+    p.setStrokeColorRGB(*primary_color)
+    p.setLineWidth(2)
+    p.line(40, INFO_TOP - 190, PAGE_WIDTH - 40, INFO_TOP - 190)
+
+    # Titolo sezione QR e cornice
+    p.setFillColorRGB(*TEXT_COLOR)
+    p.setFont("Helvetica-Bold", 16)
+    p.drawCentredString(PAGE_WIDTH / 2, QR_SECTION_Y, brand['qr_title'])
+    p.setStrokeColorRGB(*primary_color)
+    p.setLineWidth(3)
+    p.rect(QR_X - 5, QR_Y - 5, QR_SIZE + 10, QR_SIZE + 10, fill=False, stroke=True)
+
+    # Footer
+    footer_y = 50
+    p.setFillColorRGB(*primary_color)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawCentredString(PAGE_WIDTH / 2, footer_y + 20, brand['footer'])
+    p.setFont("Helvetica", 10)
+    p.drawCentredString(PAGE_WIDTH / 2, footer_y, brand['footer_note'])
+
+
+def _period(start, end):
+    return f"{_date(start)} - {_date(end)}"
+
+
+def _date(value):
+    return value.strftime('%d/%m/%Y') if value else "n.d."
+
+
+def _photo_thumbnail(path):
+    """JPEG della rendition 'print' della foto; None se assente o illeggibile"""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # mtime e dimensione nella chiave: una foto sostituita non usa la miniatura vecchia
+    return _cached_thumbnail(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=PHOTO_CACHE_SIZE)
+def _cached_thumbnail(path, mtime_ns, size):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,178 @@
+"""
+Decisione d'accesso per una scansione QR, condivisa tra la pagina ``scan_result``
+e l'API JSON usata dal kiosk.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SESSION_MAX_DURATION
+from . import audit, eligibility, events, occupancy, policy, resolver, sweeper, tracing, writer
+from .occupancy import ACCESS_LOG_MODELS
+from .resolver import ResolvedMember
+
+# Risultati di _open_session()
+OPENED = 'opened'
+ALREADY_OPEN = 'already_open'
+AREA_FULL = 'area_full'
+
+
+class _AreaFull(Exception):
+    pass
+
+
+@dataclass
+class ScanOutcome:
+    """Esito di una scansione.
+
+    ``event`` distingue i casi che la UI tratta in modo diverso:
+    checkin, already_checked_in, checkout, denied, full, no_session,
+    not_found, invalid, lookup (nessuna azione richiesta).
+    """
+    status: str
+    message: str
+    event: str
+    resolved: Optional[ResolvedMember] = None
+
+    @property
+    def member(self):
+        return self.resolved.member if self.resolved else None
+
+    @property
+    def member_type(self):
+        return self.resolved.member_type if self.resolved else None
+
+
+def process_scan(member_uuid, action):
+    """Risolve l'UUID ed esegue check-in o check-out."""
+    if not member_uuid:
+        return ScanOutcome('error', 'QR code non valido.', 'invalid')
+    with tracing.stage('resolve'):
+        resolved = resolver.resolve(member_uuid)
+    if resolved is None:
+        return ScanOutcome('error', 'Membro non trovato.', 'not_found')
+    tracing.set_area(resolved.member_type)
+    if action == 'checkin':
+        outcome = check_in(resolved)
+    elif action == 'checkout':
+        outcome = check_out(resolved)
+    else:
+        return ScanOutcome('', '', 'lookup', resolved)
+    events.publish_scan(outcome)
+    return outcome
+
+
+def check_in(resolved):
+    member = resolved.member
+    log_model = ACCESS_LOG_MODELS[resolved.member_type]
+    with tracing.stage('policy'):
+        state = eligibility.current_state(member, policy.current_date())
+    if state != eligibility.ACCESS_OK:
+        # Abbonamento, certificato medico o iscrizione non validi (vedi gym.policy)
+        rule = policy.RULES_BY_STATE[state]
+        with tracing.stage('write'):
+            if audit.enabled():
+                # Riga di solo audit: scritta in differita insieme alle altre
+                now = timezone.now()
+                audit.enqueue(log_model(
+                    member=member,
+                    subscription_status=rule.log_status,
+                    check_in=now,
+                    check_out=now,
+                ))
+            else:
+                writer.run(_log_denied, log_model, member, rule.log_status)
+        return ScanOutcome('error', rule.message, 'denied', resolved)
+    # Accesso consentito: il vincolo sulle sessioni aperte decide se è un doppio check-in
+    with tracing.stage('write'):
+        result = writer.run(_enter, log_model, resolved.member_type, member)
+    if result == ALREADY_OPEN:
+        return ScanOutcome('success', 'Hai già fatto il check-in!', 'already_checked_in', resolved)
+    if result == AREA_FULL:
+        return ScanOutcome('error', 'Capienza massima raggiunta: riprova più tardi.', 'full', resolved)
+    return ScanOutcome('success', 'Check-in effettuato con successo!', 'checkin', resolved)
+
+
+def check_out(resolved):
+    with tracing.stage('write'):
+        closed = writer.run(_close_session, resolved.member_type, resolved.pk)
+    if closed:
+        return ScanOutcome('success', 'Check-out effettuato! A presto!', 'checkout', resolved)
+    return ScanOutcome('error', 'Devi fare il check-in prima di poter fare il check-out.', 'no_session', resolved)
+
+
+def _close_session(area, member_id):
+    """UPDATE condizionale: chiude la sessione aperta solo se non è già scaduta"""
+    log_model = ACCESS_LOG_MODELS[area]
+    now = timezone.now()
+    with transaction.atomic():
+        closed = log_model.objects.filter(
+            member_id=member_id,
+            check_out__isnull=True,
+            check_in__gte=now - SESSION_MAX_DURATION,
+        ).update(check_out=now)
+        occupancy.leave(area, closed)
+    return closed
+
+
+def _log_denied(log_model, member, subscription_status):
+    """Registra un tentativo negato: è solo traccia, non apre una sessione"""
+    log_model.objects.create(
+        member=member,
+        subscription_status=subscription_status,
+        check_out=timezone.now(),
+    )
+
+
+def _enter(log_model, area, member):
+    sweeper.sweep_if_due()
+    return _open_session(log_model, area, member)
+
+
+def _open_session(log_model, area, member):
+    """Apre una sessione per il membro e occupa un posto nell'area.
+
+    Nel caso normale sono un INSERT e l'UPDATE del contatore nella stessa
+    transazione. Solo se il vincolo sulle sessioni aperte scatta si chiude
+    l'eventuale sessione scaduta e si riprova.
+    """
+    try:
+        with transaction.atomic():
+            _insert_session(log_model, area, member)
+        return OPENED
+    except _AreaFull:
+        return AREA_FULL
+    except IntegrityError:
+        pass
+    try:
+        with transaction.atomic():
+            if not _close_stale_session(log_model, area, member.pk):
+                return ALREADY_OPEN
+            _insert_session(log_model, area, member)
+        return OPENED
+    except _AreaFull:
+        return AREA_FULL
+    except IntegrityError:
+        # Un'altra scansione ha aperto la sessione nel frattempo
+        return ALREADY_OPEN
+
+
+def _insert_session(log_model, area, member):
+    log_model.objects.create(member=member, subscription_status='attivo')
+    # Dopo l'INSERT: chi è già dentro riceve "già fatto il check-in", non "area piena"
+    if not occupancy.enter(area):
+        raise _AreaFull
+
+
+def _close_stale_session(log_model, area, member_id):
+    """Chiude la sessione aperta più vecchia di SESSION_MAX_DURATION, fissando l'uscita al limite"""
+    closed = log_model.objects.filter(
+        member_id=member_id,
+        check_out__isnull=True,
+        check_in__lt=timezone.now() - SESSION_MAX_DURATION,
+    ).update(check_out=F('check_in') + SESSION_MAX_DURATION, auto_checkout=True)
+    occupancy.leave(area, closed)
+    return closed
@@ -0,0 +1,192 @@
+"""
+Consegna dei file sotto MEDIA_ROOT (QR code, foto, tessere).
+
+Senza proxy davanti i file partono con ``FileResponse``: il server WSGI, se offre
+``wsgi.file_wrapper`` (gunicorn, uWSGI), li spedisce con ``sendfile`` senza
+passare il contenuto da Python. Con ``GYM_SENDFILE_BACKEND`` la view risponde
+solo con un header e il file lo spedisce il proxy, senza tenere occupato un
+worker Python:
+
+- ``nginx``: ``X-Accel-Redirect`` verso ``GYM_SENDFILE_NGINX_PREFIX``, una
+  ``location internal`` che punta a MEDIA_ROOT;
+- ``x-sendfile``: header ``X-Sendfile`` con il percorso assoluto (Apache con
+  mod_xsendfile, lighttpd).
+
+Solo lo staff vede i file di MEDIA_ROOT (foto, QR, tessere: dati personali e
+credenziali d'accesso). Il kiosk, che non ha login, riceve per le foto un URL
+firmato e a scadenza (``signed_url``), valido solo per quel file.
+
+In entrambi i casi qui si gestiscono ETag/Last-Modified (risposte 304); le
+richieste Range le gestisce il proxy oppure, senza proxy, questo modulo (un solo
+intervallo per richiesta, come fanno i browser per audio, video e PDF).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Validità (secondi) degli URL firmati dati al kiosk
+SIGNED_URL_MAX_AGE = 3600
+
+_signer = signing.TimestampSigner(salt='gym.delivery.media')
+
+
+def backend():
+    return getattr(settings, 'GYM_SENDFILE_BACKEND', '') or None
+
+
+def media_path(name):
+    """Percorso assoluto di un file sotto MEDIA_ROOT; 404 se fuori o nascosto"""
+    if any(part.startswith('.') for part in name.split('/')):
+        raise Http404("File non trovato")
+    try:
+        return safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("File non trovato")
+
+
+def signed_url(storage, name):
+    """URL del file ``name`` accessibile senza login per SIGNED_URL_MAX_AGE secondi"""
+    _name, timestamp, signature = _signer.sign(name).rsplit(':', 2)
+    return f"{storage.url(name)}?s={timestamp}:{signature}"
+
+
+def has_valid_signature(request, name):
+    token = request.GET.get('s')
+    if not token:
+        return False
+    try:
+        _signer.unsign(f"{name}:{token}", max_age=SIGNED_URL_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def serve(request, path, as_attachment=False, filename=None, content_type=None, max_age=None, etag=None):
+    """Risposta per il file ``path`` (assoluto, di norma sotto MEDIA_ROOT).
+
+    ``etag`` sostituisce quello ricavato da data di modifica e dimensione, per i
+    file il cui contenuto è già identificato da un'impronta (tessere in cache).
+    """
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("File non trovato")
+    if not os.path.isfile(path):
+        raise Http404("File non trovato")
+
+    etag = f'"{etag}"' if etag else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(stat.st_mtime)
+    max_age = getattr(settings, 'GYM_MEDIA_MAX_AGE', 3600) if max_age is None else max_age
+    headers['Cache-Control'] = f'private, max-age={max_age}'
+    # Restituisce ``headers`` se nessuna condizione scatta, altrimenti una 304/412 con gli stessi header
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime), response=headers)
+    if conditional is not headers:
+        return conditional
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if backend() and _under_media_root(path):
+        response = _proxy_response(path, content_type)
+    else:
+        response = _python_response(request, path, stat.st_size, etag, content_type)
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        response[header] = headers[header]
+    if as_attachment or filename:
+        response['Content-Disposition'] = content_disposition_header(
+            as_attachment, filename or os.path.basename(path),
+        )
+    return response
+
+
+def serve_field(request, field_file, **kwargs):
+    """Come ``serve`` per un FileField/ImageField; 404 se vuoto"""
+    if not field_file:
+        raise Http404("File non trovato")
+    return serve(request, field_file.path, **kwargs)
+
+
+def _under_media_root(path):
+    """Il proxy vede solo MEDIA_ROOT: gli altri file passano da Python"""
+    root = os.path.abspath(settings.MEDIA_ROOT)
+    return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+
+def _proxy_response(path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if backend() == 'nginx':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        prefix = getattr(settings, 'GYM_SENDFILE_NGINX_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + relative)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def _python_response(request, path, size, etag, content_type):
+    byte_range = _requested_range(request, size, etag)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _requested_range(request, size, etag):
+    """(inizio, fine) inclusi, 'unsatisfiable', oppure None per il file intero"""
+    header = request.headers.get('Range')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return None
+    # If-Range con un ETag diverso: il file è cambiato, si manda tutto
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Più intervalli o sintassi non gestita: il file intero è sempre una risposta valida
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        if int(end) == 0:
+            return 'unsatisfiable'
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        return 'unsatisfiable'
+    if end < start:
+        return None
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,43 @@
+"""
+Stato d'accesso persistito su ``Member``/``SalaMember``.
+
+``access_state`` riassume le verifiche d'accesso in un valore indicizzato
+(ok / abbonamento / certificato / iscrizione) e ``access_valid_until`` indica la
+prima scadenza futura quando lo stato è "ok". Lo stato viene ricalcolato a ogni
+salvataggio del membro e ogni notte da ``refresh_access_state`` con UPDATE
+set-based, così admin e report filtrano e ordinano su una colonna invece di
+valutare le property riga per riga. Le regole stanno in ``gym.policy``.
+"""
+from . import policy
+from .policy import (  # noqa: F401
+    ACCESS_CERTIFICATE_EXPIRED,
+    ACCESS_FEE_UNPAID,
+    ACCESS_OK,
+    ACCESS_STATE_CHOICES,
+    ACCESS_SUBSCRIPTION_EXPIRED,
+)
+
+
+def compute(member, today):
+    """Restituisce ``(stato, valido_fino_al)`` per il membro alla data indicata."""
+    return policy.evaluate(member, today)
+
+
+def current_state(member, today):
+    """Stato alla data indicata, usando quello persistito finché è certamente valido.
+
+    Uno stato "ok" resta tale fino a ``access_valid_until``; negli altri casi (o se
+    il ricalcolo notturno non è ancora passato) si rivalutano le date in memoria.
+    """
+    if (getattr(member, 'access_state', None) == ACCESS_OK
+            and member.access_valid_until and today <= member.access_valid_until):
+        return ACCESS_OK
+    return compute(member, today)[0]
+
+
+def refresh_queryset(queryset, today):
+    """Ricalcola lo stato per tutte le righe del queryset con un solo UPDATE."""
+    return queryset.update(
+        access_state=policy.state_expression(today),
+        access_valid_until=policy.valid_until_expression(today),
+    )
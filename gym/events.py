@@ -0,0 +1,97 @@
+"""
+Eventi di scansione inoltrati in tempo reale alla dashboard presenze (SSE).
+
+Il percorso di check-in chiama ``publish()``; ogni connessione SSE aperta ha la
+propria ``asyncio.Queue`` registrata presso il broadcaster. Il broadcaster di
+default vive nel processo (``LocalBroadcaster``): con più worker si può indicare
+in ``GYM_EVENT_BROADCASTER`` un'altra classe con la stessa interfaccia
+(``subscribe``/``unsubscribe``/``publish``), ad esempio basata su un canale
+condiviso tra processi.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULT_BROADCASTER = 'gym.events.LocalBroadcaster'
+
+# Eventi di scansione che interessano la dashboard
+PUBLISHED_EVENTS = {'checkin', 'checkout', 'denied', 'full'}
+
+
+class LocalBroadcaster:
+    """Fan-out in-process verso le code asyncio dei client SSE."""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Registra un client; va chiamato dal loop che leggerà la coda."""
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    def publish(self, event):
+        """Inoltra l'evento a tutti i client; sicuro da qualunque thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Loop chiuso: il client se n'è andato senza disiscriversi
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _deliver(queue, event):
+        # Un client lento perde gli eventi più vecchi invece di far crescere la coda
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                path = getattr(settings, 'GYM_EVENT_BROADCASTER', DEFAULT_BROADCASTER)
+                _broadcaster = import_string(path)()
+    return _broadcaster
+
+
+def publish(event):
+    get_broadcaster().publish(event)
+
+
+def publish_scan(outcome):
+    """Pubblica l'esito di una scansione dopo il commit della transazione corrente."""
+    if outcome.event not in PUBLISHED_EVENTS or outcome.resolved is None:
+        return
+    member = outcome.member
+    event = {
+        'event': outcome.event,
+        'area': outcome.member_type,
+        'message': outcome.message,
+        'at': timezone.now().isoformat(),
+        'member': {
+            'key': f"{outcome.member_type}-{member.pk}",
+            'first_name': member.first_name,
+            'last_name': member.last_name,
+        },
+    }
+    transaction.on_commit(lambda: publish(event))
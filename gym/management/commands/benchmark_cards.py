@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from gym import cards, qr
+from gym.resolver import MEMBER_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Misura le tessere PDF al secondo: una tessera per documento (download, email) e tante tessere "
+        "in un solo documento (stampa), con e senza foto. Usa membri esistenti e non scrive sul database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=50, help="Membri da usare (default: 50)")
+        parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (default: 3)")
+        parser.add_argument("--qr-format", choices=("vector", "png"), default=None,
+                            help="QR nella tessera (default: GYM_CARD_QR_FORMAT)")
+
+    def handle(self, *args, **options):
+        members = []
+        for model in MEMBER_MODELS.values():
+            remaining = options["members"] - len(members)
+            if remaining > 0:
+                members += list(model.objects.exclude(qr.pending_filter()).order_by("pk")[:remaining])
+        if not members:
+            raise CommandError("Nessun membro con QR generato: lanciare prima generate_pending_qr.")
+        qr_format = options["qr_format"] or cards.card_qr_format()
+
+        # Foto di prova (fotocamera 1280x960) dentro MEDIA_ROOT, eliminata alla fine
+        photo_dir = tempfile.mkdtemp(prefix="benchmark-", dir=settings.MEDIA_ROOT)
+        try:
+            photo_name = os.path.join(os.path.basename(photo_dir), "foto.jpg")
+            Image.effect_noise((1280, 960), 40).convert("RGB").save(os.path.join(photo_dir, "foto.jpg"), quality=85)
+
+            self.stdout.write(f"{len(members)} membri, QR {qr_format}, {options['repeat']} ripetizioni\n")
+            self.stdout.write(f"{'caso':<32} {'tessere/s':>10} {'KB/tessera':>11}")
+            for label, photo in (("senza foto", ""), ("con foto", photo_name)):
+                for member in members:
+                    member.photo.name = photo
+                single = self._measure(options["repeat"], len(members),
+                                       lambda: [cards.render_card(m, qr_format) for m in members])
+                batch = self._measure(options["repeat"], len(members),
+                                      lambda: [cards.render_cards(members, qr_format)])
+                self._row(f"1 per documento, {label}", *single)
+                self._row(f"{len(members)} per documento, {label}", *batch)
+        finally:
+            shutil.rmtree(photo_dir, ignore_errors=True)
+
+    def _measure(self, repeat, count, fn):
+        # Una passata a vuoto: import, font e cache (miniature, moduli QR) non entrano nella misura
+        size = sum(len(pdf) for pdf in fn())
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return count / best, size / count / 1024
+
+    def _row(self, label, per_second, kb):
+        self.stdout.write(f"{label:<32} {per_second:>10.1f} {kb:>11.1f}")
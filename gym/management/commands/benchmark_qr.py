@@ -0,0 +1,63 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gym import cards, qr
+from gym.resolver import MEMBER_MODELS
+
+
+def _legacy_png(data):
+    """PNG come veniva generato prima del formato ottimizzato"""
+    img = qr.make_qr(data).make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta i formati del QR code (PNG precedente, PNG 1 bit ottimizzato, SVG) e il QR nelle "
+        "tessere PDF (immagine PNG o tracciato vettoriale): dimensione media e tempo per membro. "
+        "Usa membri esistenti con il QR già generato e non scrive nulla."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=50, help="Membri da usare (default: 50)")
+        parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (default: 3)")
+
+    def handle(self, *args, **options):
+        members = []
+        for model in MEMBER_MODELS.values():
+            remaining = options["members"] - len(members)
+            if remaining > 0:
+                members += list(model.objects.exclude(qr.pending_filter()).order_by("pk")[:remaining])
+        if not members:
+            raise CommandError("Nessun membro con QR generato: lanciare prima generate_pending_qr.")
+
+        rows = [
+            ("QR PNG (precedente)", self._measure(members, options["repeat"], lambda m: _legacy_png(m.uuid))),
+            ("QR PNG 1 bit", self._measure(members, options["repeat"], lambda m: qr.render_png(m.uuid))),
+            ("QR SVG", self._measure(members, options["repeat"], lambda m: qr.render_svg(m.uuid))),
+            ("Tessera, QR PNG", self._measure(members, options["repeat"], lambda m: cards.render_card(m, 'png'))),
+            ("Tessera, QR vettoriale", self._measure(members, options["repeat"], lambda m: cards.render_card(m, 'vector'))),
+        ]
+
+        self.stdout.write(f"{len(members)} membri, {options['repeat']} ripetizioni\n")
+        self.stdout.write(f"{'formato':<24} {'byte medi':>10} {'ms/membro':>10}")
+        for name, (size, ms) in rows:
+            self.stdout.write(f"{name:<24} {size:>10.0f} {ms:>10.2f}")
+
+    def _measure(self, members, repeat, fn):
+        # Una passata a vuoto: import e font non entrano nella misura
+        sizes = [len(fn(member)) for member in members]
+        best = None
+        for _ in range(repeat):
+            # Moduli del QR ricalcolati a ogni passata, come alla prima tessera di un membro
+            qr.matrix.cache_clear()
+            started = time.perf_counter()
+            for member in members:
+                fn(member)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return sum(sizes) / len(sizes), best * 1000 / len(members)
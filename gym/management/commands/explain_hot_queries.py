@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from gym import policy, sweeper
+from gym.models import SESSION_MAX_DURATION, KioskScan, Member, Occupancy, SalaMember
+from gym.occupancy import ACCESS_LOG_MODELS
+
+
+def hot_queries():
+    """Le query più frequenti del progetto: (descrizione, queryset)"""
+    now = timezone.now()
+    today = policy.current_date()
+    start_of_day = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    queries = []
+    for area, log_model in ACCESS_LOG_MODELS.items():
+        queries += [
+            (f"{area}: sessione aperta del membro", log_model.objects.filter(member_id=1, check_out__isnull=True)),
+            (f"{area}: check-out", log_model.objects.filter(
+                member_id=1, check_out__isnull=True, check_in__gte=now - SESSION_MAX_DURATION,
+            )),
+            (f"{area}: storico del membro", log_model.objects.filter(member_id=1).order_by('-check_in')[:20]),
+            (f"{area}: ingressi di oggi", log_model.objects.filter(check_in__gte=start_of_day)),
+            (f"{area}: ordinamento admin", log_model.objects.order_by('-check_in')[:100]),
+            (f"{area}: sessioni scadute (sweeper)", sweeper.stale_sessions(log_model, now)),
+            (f"{area}: presenti (dashboard)", log_model.objects.filter(
+                check_out__isnull=True, check_in__gte=now - SESSION_MAX_DURATION,
+            ).order_by('check_in')),
+        ]
+    # Filtri data dell'admin (DateFieldListFilter) su "Ultimi 7 giorni": intervallo chiuso
+    week = {'gte': today - timedelta(days=7), 'lt': today + timedelta(days=1)}
+    week_start = start_of_day - timedelta(days=7)
+    for label, member_model in (('membri', Member), ('membri sala', SalaMember)):
+        # Come le esegue la changelist dell'admin: ordinate per -updated_at e paginate
+        queries += [
+            (f"{label}: risoluzione UUID", member_model.objects.filter(uuid='00000000-0000-0000-0000-000000000000')),
+            (f"{label}: ordinamento admin", member_model.objects.all()[:100]),
+            (f"{label}: filtro fine abbonamento", member_model.objects.filter(
+                subscription_end__gte=week['gte'], subscription_end__lt=week['lt'],
+            )[:100]),
+            (f"{label}: filtro fine certificato", member_model.objects.filter(
+                medical_certificate_end__gte=week['gte'], medical_certificate_end__lt=week['lt'],
+            )[:100]),
+            (f"{label}: filtro stato accesso", member_model.objects.filter(access_state=policy.ACCESS_OK)[:100]),
+            (f"{label}: filtro data creazione", member_model.objects.filter(
+                created_at__gte=week_start, created_at__lt=start_of_day + timedelta(days=1),
+            )[:100]),
+        ]
+    queries += [
+        ("contatore presenze", Occupancy.objects.filter(area='palestra')),
+        ("scansioni offline già sincronizzate", KioskScan.objects.filter(scan_id__in=['a', 'b'])),
+    ]
+    return queries
+
+
+def full_scans(plan, ordered_page=False):
+    """Righe del piano che percorrono un'intera tabella o un intero indice.
+
+    Con SQLite sono accettate solo le ricerche ("SEARCH") e le scansioni di un
+    indice di copertura. "SCAN tabella USING INDEX" percorre tutto l'indice
+    nell'ordine richiesto: va bene solo per una pagina senza filtri
+    (``ordered_page``), che si ferma dopo le prime righe. Con un filtro la stessa
+    scansione legge le righe una a una finché non ne trova abbastanza, e vuol
+    dire che l'indice sul campo filtrato non viene usato.
+    """
+    lines = plan.splitlines()
+    if connection.vendor == 'sqlite':
+        return [
+            line for line in lines
+            if 'SCAN ' in line
+            and 'COVERING INDEX' not in line
+            and not ('USING INDEX' in line and ordered_page)
+        ]
+    if connection.vendor == 'postgresql':
+        return [line for line in lines if 'Seq Scan' in line]
+    return []
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue EXPLAIN sulle query più frequenti (check-in, registro accessi, admin) "
+        "e fallisce se una di esse scandisce un'intera tabella."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verbose-plans",
+            action="store_true",
+            help="Mostra il piano completo di ogni query.",
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        for label, queryset in hot_queries():
+            plan = queryset.explain()
+            query = queryset.query
+            scans = full_scans(plan, ordered_page=query.high_mark is not None and not query.where)
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"✗ {label}"))
+                for line in scans:
+                    self.stdout.write(f"    {line.strip()}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✓ {label}"))
+            if options["verbose_plans"]:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} query con scansione completa: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("Nessuna scansione completa."))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gym import qr
+from gym.resolver import MEMBER_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera i PNG dei QR code ancora in attesa (membri creati o importati senza QR). "
+        "Pensato per girare in background, es. da cron dopo un import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Numero massimo di QR da generare")
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        started = time.perf_counter()
+        total = 0
+        for area, model in MEMBER_MODELS.items():
+            pending = model.objects.filter(qr.pending_filter()).order_by("pk")
+            if limit is not None:
+                pending = pending[:max(limit - total, 0)]
+            count = 0
+            for member in pending.iterator():
+                qr.ensure_qr_code(member)
+                count += 1
+            total += count
+            self.stdout.write(f"{area}: {count} QR code generati")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Totale: {total} QR code in {elapsed:.1f}s"))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gym import renditions
+from gym.resolver import MEMBER_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera le miniature delle foto (admin, kiosk, tessera) accanto agli originali. "
+        "Serve per le foto caricate prima delle rendition: quelle nuove le hanno già dal salvataggio."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rigenera anche le miniature già aggiornate")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = failed = 0
+        for area, model in MEMBER_MODELS.items():
+            count = 0
+            for member in model.objects.exclude(photo="").exclude(photo__isnull=True).only("pk", "photo").iterator():
+                if options["force"]:
+                    ok = renditions.generate(member.photo)
+                else:
+                    ok = all(renditions.path(member.photo, name) for name in renditions.RENDITIONS)
+                if ok:
+                    count += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"{area}: foto non leggibile per il membro {member.pk} ({member.photo.name})")
+            total += count
+            self.stdout.write(f"{area}: {count} foto")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Totale: {total} foto in {elapsed:.1f}s, {failed} non leggibili"))
@@ -7,6 +7,7 @@ from django.db import IntegrityError
 from django.utils import timezone
 from dateutil import parser as dateparser
 
+from gym import eligibility
 from gym.models import Member
 
 
@@ -161,6 +162,8 @@ class Command(BaseCommand):
                     if member:
                         # AGGIORNA MEMBRO ESISTENTE
                         Member.objects.filter(pk=member.pk).update(**data)
+                        # update() salta save(): ricalcola lo stato d'accesso a parte
+                        eligibility.refresh_queryset(Member.objects.filter(pk=member.pk), timezone.localdate())
                         updated_count += 1
                     else:
                         # CREA NUOVO MEMBRO
@@ -0,0 +1,270 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from gym import audit, eligibility, policy, resolver, tracing
+from gym.management.commands.scan_stats import write_table
+from gym.models import Occupancy
+from gym.occupancy import ACCESS_LOG_MODELS
+from gym.resolver import MEMBER_MODELS
+from gym.tracing import Histogram
+
+# I membri sintetici si riconoscono dal dominio email e vengono eliminati alla fine
+EMAIL_DOMAIN = 'loadtest.local'
+
+
+class Command(BaseCommand):
+    help = (
+        "Test di carico del check-in: crea una popolazione sintetica e simula N kiosk in parallelo "
+        "(thread) che scansionano QR validi, scaduti e sconosciuti su scan_result e sull'API JSON, "
+        "usando il database configurato. Riporta throughput, percentili, errori 'database is locked' "
+        "e sessioni aperte duplicate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=500, help="Membri sintetici da creare (default: 500)")
+        parser.add_argument("--kiosks", type=int, default=8, help="Kiosk simulati in parallelo (default: 8)")
+        parser.add_argument("--scans", type=int, default=250, help="Scansioni per kiosk (default: 250)")
+        parser.add_argument("--sala-ratio", type=float, default=0.3, help="Quota di membri sala (default: 0.3)")
+        parser.add_argument("--expired-ratio", type=float, default=0.1,
+                            help="Quota di membri con abbonamento scaduto (default: 0.1)")
+        parser.add_argument("--unknown-ratio", type=float, default=0.05,
+                            help="Quota di scansioni con QR sconosciuto (default: 0.05)")
+        parser.add_argument("--api-ratio", type=float, default=0.5,
+                            help="Quota di scansioni inviate all'API JSON invece che a scan_result (default: 0.5)")
+        parser.add_argument("--think-time", type=float, default=0.0,
+                            help="Pausa media in secondi tra due scansioni dello stesso kiosk (default: 0)")
+        parser.add_argument("--seed", type=int, default=None, help="Seme per scansioni riproducibili")
+        parser.add_argument("--keep", action="store_true", help="Non eliminare i membri sintetici alla fine")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="Non chiedere conferma prima di scrivere sul database")
+
+    def handle(self, *args, **options):
+        db_name = connection.settings_dict["NAME"]
+        if options["interactive"]:
+            answer = input(f"Il test scrive membri e accessi su '{db_name}'. Continuare? [s/N] ")
+            if answer.strip().lower() not in ("s", "si", "sì", "y", "yes"):
+                raise CommandError("Test annullato.")
+
+        rng = random.Random(options["seed"])
+        population = self._seed(options, rng)
+        self.stdout.write(
+            f"Creati {len(population)} membri sintetici "
+            f"({sum(1 for p in population if p['expired'])} con abbonamento scaduto)."
+        )
+        resolver.clear()
+        tracing.reset()
+
+        try:
+            result = self._run(population, options, rng)
+            self._report(result, options)
+        finally:
+            if not options["keep"]:
+                self._cleanup()
+
+        if result["locked"] or result["duplicates"]:
+            raise CommandError("Errori di lock o sessioni duplicate: vedi sopra.")
+
+    def _seed(self, options, rng):
+        today = policy.current_date()
+        population = []
+        for area, model in MEMBER_MODELS.items():
+            share = options["sala_ratio"] if area == "sala" else 1 - options["sala_ratio"]
+            rows = []
+            for _ in range(round(options["members"] * share)):
+                member_uuid = uuid.uuid4()
+                expired = rng.random() < options["expired_ratio"]
+                end = today - timedelta(days=1) if expired else today + timedelta(days=30)
+                # bulk_create non passa dai segnali: nessun QR generato
+                rows.append(model(
+                    uuid=member_uuid,
+                    first_name="Carico",
+                    last_name=f"Test {len(population) + len(rows)}",
+                    email=f"{member_uuid}@{EMAIL_DOMAIN}",
+                    subscription_start=today - timedelta(days=60),
+                    subscription_end=end,
+                    medical_certificate_start=today - timedelta(days=60),
+                    medical_certificate_end=today + timedelta(days=300),
+                    registration_fee_paid_until=today + timedelta(days=300),
+                ))
+            model.objects.bulk_create(rows, batch_size=500)
+            eligibility.refresh_queryset(model.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}"), today)
+            population += [
+                {"uuid": str(row.uuid), "area": area, "expired": row.subscription_end < today}
+                for row in rows
+            ]
+        return population
+
+    def _run(self, population, options, rng):
+        inside = set()
+        state_lock = threading.Lock()
+        latency = {"scan_result": Histogram(), "api": Histogram()}
+        events = Counter()
+        errors = Counter()
+        locked = [0]
+        scan_url = reverse("gym:scan_result")
+        api_url = reverse("gym:scan_api")
+        seeds = [rng.random() for _ in range(options["kiosks"])]
+        barrier = threading.Barrier(options["kiosks"])
+
+        def pick_scan(kiosk_rng):
+            if kiosk_rng.random() < options["unknown_ratio"]:
+                return str(uuid.uuid4()), "checkin"
+            member = kiosk_rng.choice(population)
+            with state_lock:
+                is_inside = member["uuid"] in inside
+            # Chi è dentro di solito esce, chi è fuori di solito entra; a volte si sbaglia pulsante
+            if is_inside:
+                action = "checkout" if kiosk_rng.random() < 0.85 else "checkin"
+            else:
+                action = "checkin" if kiosk_rng.random() < 0.9 else "checkout"
+            return member["uuid"], action
+
+        def kiosk(seed):
+            kiosk_rng = random.Random(seed)
+            client = Client(HTTP_HOST="localhost")
+            try:
+                barrier.wait()
+                for _ in range(options["scans"]):
+                    member_uuid, action = pick_scan(kiosk_rng)
+                    use_api = kiosk_rng.random() < options["api_ratio"]
+                    start = time.perf_counter_ns()
+                    try:
+                        if use_api:
+                            response = client.post(api_url, {"uuid": member_uuid, "action": action})
+                            event = response.json()["event"]
+                        else:
+                            response = client.get(scan_url, {"uuid": member_uuid, "action": action})
+                            event = _event_from_page(response, action)
+                    except Exception as exc:
+                        if "database is locked" in str(exc):
+                            with state_lock:
+                                locked[0] += 1
+                        else:
+                            with state_lock:
+                                errors[type(exc).__name__] += 1
+                        continue
+                    finally:
+                        elapsed = (time.perf_counter_ns() - start) // 1000
+                        latency["api" if use_api else "scan_result"].record(elapsed)
+                    with state_lock:
+                        events[event] += 1
+                        if event in ("checkin", "already_checked_in"):
+                            inside.add(member_uuid)
+                        elif event in ("checkout", "no_session"):
+                            inside.discard(member_uuid)
+                    if options["think_time"]:
+                        time.sleep(kiosk_rng.expovariate(1 / options["think_time"]))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=kiosk, args=(seed,)) for seed in seeds]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        # Le righe di audit in differita devono essere sul DB prima dei controlli
+        audit.flush()
+
+        return {
+            "elapsed": elapsed,
+            "latency": latency,
+            "events": events,
+            "errors": errors,
+            "locked": locked[0],
+            "duplicates": _duplicate_open_sessions(),
+            "counter_drift": _counter_drift(),
+        }
+
+    def _report(self, result, options):
+        total = sum(h.total for h in result["latency"].values())
+        self.stdout.write("")
+        self.stdout.write(
+            f"{options['kiosks']} kiosk, {total} scansioni in {result['elapsed']:.2f}s: "
+            f"{total / result['elapsed']:.1f} scansioni/s"
+        )
+        overall = Histogram()
+        for histogram in result["latency"].values():
+            overall.merge(histogram)
+        for name, histogram in list(result["latency"].items()) + [("totale", overall)]:
+            if histogram.total:
+                self.stdout.write(
+                    f"  {name:<12} n={histogram.total:<6} p50={histogram.percentile(50) / 1000:.2f}ms "
+                    f"p95={histogram.percentile(95) / 1000:.2f}ms p99={histogram.percentile(99) / 1000:.2f}ms "
+                    f"max={histogram.max / 1000:.2f}ms"
+                )
+        self.stdout.write("Esiti: " + ", ".join(f"{k}={v}" for k, v in sorted(result["events"].items())))
+
+        stats = tracing.snapshot()
+        if stats:
+            self.stdout.write("")
+            self.stdout.write("Tempi per fase (lato server):")
+            write_table(self.stdout, stats)
+
+        self.stdout.write("")
+        style = self.style.ERROR if result["locked"] else self.style.SUCCESS
+        self.stdout.write(style(f"Errori 'database is locked': {result['locked']}"))
+        if result["errors"]:
+            self.stdout.write(self.style.ERROR(
+                "Altri errori: " + ", ".join(f"{k}={v}" for k, v in result["errors"].items())
+            ))
+        style = self.style.ERROR if result["duplicates"] else self.style.SUCCESS
+        self.stdout.write(style(f"Sessioni aperte duplicate: {result['duplicates']}"))
+        for area, (counter, actual) in result["counter_drift"].items():
+            style = self.style.WARNING if counter != actual else self.style.SUCCESS
+            self.stdout.write(style(f"Contatore {area}: {counter} (sessioni aperte: {actual})"))
+
+    def _cleanup(self):
+        # La cancellazione in cascata dei log aperti libera i contatori (receiver post_delete)
+        for model in MEMBER_MODELS.values():
+            model.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+        resolver.clear()
+        self.stdout.write("Membri sintetici eliminati.")
+
+
+def _event_from_page(response, action):
+    """Esito ricavato dalla pagina HTML di scan_result"""
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    content = response.content.decode()
+    for text, event in (
+        ("Check-out effettuato", "checkout"),
+        ("Hai già fatto il check-in", "already_checked_in"),
+        ("Check-in effettuato", "checkin"),
+        ("Capienza massima", "full"),
+        ("Devi fare il check-in", "no_session"),
+        ("Membro non trovato", "not_found"),
+        (": non hai accesso", "denied"),
+        (": non puoi entrare", "denied"),
+    ):
+        if text in content:
+            return event
+    return f"{action}_sconosciuto"
+
+
+def _duplicate_open_sessions():
+    duplicates = 0
+    for log_model in ACCESS_LOG_MODELS.values():
+        duplicates += log_model.objects.filter(check_out__isnull=True).values("member_id").annotate(
+            n=Count("id"),
+        ).filter(n__gt=1).count()
+    return duplicates
+
+
+def _counter_drift():
+    counters = dict(Occupancy.objects.values_list("area", "count"))
+    return {
+        area: (counters.get(area, 0), log_model.objects.filter(check_out__isnull=True).count())
+        for area, log_model in ACCESS_LOG_MODELS.items()
+    }
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from gym import occupancy, sweeper
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra le presenze correnti per area. "
+        "Con --expire chiude le sessioni scadute, con --recount ricalcola i contatori dal registro accessi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--expire",
+            action="store_true",
+            help="Chiude le sessioni aperte da più di 2 ore e aggiorna i contatori.",
+        )
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help="Ricalcola i contatori contando le sessioni aperte (operazione di manutenzione).",
+        )
+
+    def handle(self, *args, **options):
+        if options["expire"]:
+            closed = sweeper.sweep()
+            for area, count in closed.items():
+                self.stdout.write(f"{area}: {count} sessioni scadute chiuse")
+        if options["recount"]:
+            occupancy.recount()
+            self.stdout.write(self.style.SUCCESS("Contatori ricalcolati."))
+
+        for area, data in occupancy.snapshot().items():
+            limit = data["capacity"] if data["capacity"] is not None else "nessun limite"
+            self.stdout.write(f"{area}: {data['count']} presenti (capienza: {limit})")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from gym import eligibility
+from gym.models import Member, SalaMember
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola lo stato d'accesso (access_state, access_valid_until) di tutti i membri "
+        "con un UPDATE per tabella. Da eseguire ogni notte, dopo la mezzanotte."
+    )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        for model in (Member, SalaMember):
+            updated = eligibility.refresh_queryset(model.objects.all(), today)
+            counts = {state: 0 for state, _ in eligibility.ACCESS_STATE_CHOICES}
+            for row in model.objects.order_by().values('access_state').annotate(n=Count("pk")):
+                counts[row['access_state']] = row['n']
+            summary = ", ".join(f"{state}: {n}" for state, n in counts.items())
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {updated} aggiornati ({summary})")
+        self.stdout.write(self.style.SUCCESS(f"Stato d'accesso ricalcolato al {today:%d/%m/%Y}."))
@@ -0,0 +1,111 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections, transaction
+
+from gym import regenerate
+from gym.resolver import MEMBER_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Rigenera i PNG dei QR code (e con --cards le tessere PDF nella cache di download ed email) "
+        "di tutti i membri, in parallelo su più processi. I file con contenuto invariato non vengono riscritti; "
+        "le scritture sono atomiche. Da lanciare dopo aver cambiato i parametri del QR o la grafica della tessera."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", action="store_true", help="Prepara anche le tessere PDF nella cache (GYM_CARD_CACHE_DIR)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processi worker (default: numero di CPU)")
+        parser.add_argument("--chunk-size", type=int, default=100,
+                            help="Membri per blocco inviato a un worker (default: 100)")
+        parser.add_argument("--force", action="store_true", help="Riscrive i file anche se invariati")
+        parser.add_argument("--area", choices=sorted(MEMBER_MODELS), help="Solo membri di quest'area")
+        parser.add_argument("--progress-interval", type=float, default=2.0,
+                            help="Secondi tra due righe di avanzamento (default: 2)")
+
+    def handle(self, *args, **options):
+        areas = [options["area"]] if options["area"] else list(MEMBER_MODELS)
+        totals = {area: MEMBER_MODELS[area].objects.count() for area in areas}
+        self.grand_total = sum(totals.values())
+        self.done = 0
+        self.counts = Counter()
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+        self.progress_interval = options["progress_interval"]
+
+        workers = max(options["workers"], 1)
+        # I worker non usano il DB: nessuna connessione aperta va ereditata con fork
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=regenerate.init_worker) as executor:
+            # Avvia i processi prima di aprire il cursore che scorre i membri
+            executor.submit(int).result()
+            for area in areas:
+                self._run_area(executor, area, workers, options)
+
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Totale: {self.done} membri in {elapsed:.1f}s ({rate:.1f} membri/s, {workers} worker)"
+        ))
+        self.stdout.write(
+            f"QR: {self.counts['qr_scritti']} scritti, {self.counts['qr_invariati']} invariati"
+            + (f"; tessere: {self.counts['card_scritti']} scritte, {self.counts['card_invariati']} invariate"
+               if options["cards"] else "")
+        )
+
+    def _run_area(self, executor, area, workers, options):
+        model = MEMBER_MODELS[area]
+        label = model._meta.label
+        if options["cards"]:
+            fields = [f.attname for f in model._meta.concrete_fields]
+        else:
+            fields = ["pk", "uuid", "qr_code_image"]
+        rows = model.objects.order_by("pk").values(*fields).iterator(chunk_size=options["chunk_size"] * workers)
+
+        pending = set()
+        chunk = []
+        for values in rows:
+            chunk.append(values)
+            if len(chunk) >= options["chunk_size"]:
+                pending.add(executor.submit(regenerate.regenerate_chunk, label, chunk, options["cards"], options["force"]))
+                chunk = []
+                # Al massimo due blocchi in coda per worker: la memoria resta costante
+                if len(pending) >= workers * 2:
+                    pending = self._collect(model, pending, FIRST_COMPLETED)
+        if chunk:
+            pending.add(executor.submit(regenerate.regenerate_chunk, label, chunk, options["cards"], options["force"]))
+        self._collect(model, pending, ALL_COMPLETED)
+        close_old_connections()
+
+    def _collect(self, model, pending, return_when):
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            counts, renamed = future.result()
+            if renamed:
+                # update() e non save(): nessun segnale, updated_at invariato
+                with transaction.atomic():
+                    for pk, name in renamed:
+                        model.objects.filter(pk=pk).update(qr_code_image=name)
+            self.counts.update(counts)
+            self.done += sum(counts[k] for k in ("qr_scritti", "qr_invariati"))
+        self._progress()
+        return pending
+
+    def _progress(self):
+        now = time.perf_counter()
+        if now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0
+        remaining = (self.grand_total - self.done) / rate if rate else 0
+        self.stdout.write(
+            f"  {self.done}/{self.grand_total} membri, {rate:.1f}/s, "
+            f"{self.counts['qr_scritti'] + self.counts['card_scritti']} file scritti, "
+            f"fine stimata tra {remaining:.0f}s"
+        )
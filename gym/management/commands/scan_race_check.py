@@ -0,0 +1,96 @@
+import threading
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from gym.checkin import ACCESS_LOG_MODELS, process_scan
+from gym.resolver import MEMBER_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica che check-in concorrenti dello stesso membro aprano una sola sessione. "
+        "Lancia N scansioni in parallelo su un membro temporaneo e controlla le righe aperte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Scansioni parallele per round (default: 8)")
+        parser.add_argument("--rounds", type=int, default=5, help="Numero di round check-in/check-out (default: 5)")
+        parser.add_argument(
+            "--area",
+            choices=sorted(MEMBER_MODELS),
+            default="palestra",
+            help="Tipo di membro su cui provare (default: palestra)",
+        )
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        rounds = options["rounds"]
+        area = options["area"]
+        member_model = MEMBER_MODELS[area]
+        log_model = ACCESS_LOG_MODELS[area]
+
+        today = timezone.now().date()
+        member_uuid = str(uuid.uuid4())
+        # bulk_create non passa dai segnali: nessun QR generato per il membro di prova
+        member_model.objects.bulk_create([member_model(
+            uuid=member_uuid,
+            first_name="Test",
+            last_name="Concorrenza",
+            email=f"race-{member_uuid}@placeholder.local",
+            subscription_start=today,
+            subscription_end=today + timedelta(days=30),
+            medical_certificate_start=today,
+            medical_certificate_end=today + timedelta(days=30),
+            registration_fee_paid_until=today + timedelta(days=30),
+        )])
+        member = member_model.objects.get(uuid=member_uuid)
+
+        failures = []
+        try:
+            for round_no in range(1, rounds + 1):
+                for action in ("checkin", "checkout"):
+                    events = self._fire(member_uuid, action, threads)
+                    open_rows = log_model.objects.filter(member=member, check_out__isnull=True).count()
+                    expected = 1 if action == "checkin" else 0
+                    summary = ", ".join(f"{name}={count}" for name, count in sorted(events.items()))
+                    line = f"Round {round_no} {action}: {summary} -> sessioni aperte: {open_rows}"
+                    if open_rows != expected or events.get("error"):
+                        failures.append(line)
+                        self.stdout.write(self.style.ERROR(line))
+                    else:
+                        self.stdout.write(line)
+        finally:
+            member.delete()
+
+        if failures:
+            raise CommandError(f"{len(failures)} round con sessioni aperte inattese.")
+        self.stdout.write(self.style.SUCCESS("Nessuna sessione duplicata."))
+
+    def _fire(self, member_uuid, action, threads):
+        barrier = threading.Barrier(threads)
+        events = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                barrier.wait()
+                event = process_scan(member_uuid, action).event
+            except Exception as exc:
+                self.stderr.write(f"Errore: {exc}")
+                event = "error"
+            finally:
+                connection.close()
+            with lock:
+                events[event] += 1
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return events
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gym import tracing
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra p50/p95/p99 dei tempi per fase delle scansioni, unendo gli istogrammi "
+        "salvati dai processi server in GYM_SCAN_TRACE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Stampa il risultato in JSON.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help=(
+                "Azzera le statistiche dopo averle lette: elimina i file salvati e lascia un marcatore "
+                "che fa azzerare gli istogrammi in memoria a ogni processo server al salvataggio "
+                "successivo (entro GYM_SCAN_TRACE_EXPORT_INTERVAL secondi dalla prima scansione)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if tracing.export_dir() is None:
+            raise CommandError(
+                "GYM_SCAN_TRACE_DIR non impostata: i tempi sono solo in memoria, usa /api/scan/stats/."
+            )
+        stats = tracing.load_exported().snapshot()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+        elif not stats:
+            self.stdout.write("Nessuna scansione registrata.")
+        else:
+            write_table(self.stdout, stats)
+
+        if options["reset"]:
+            tracing.request_reset()
+            self.stdout.write(self.style.SUCCESS("Statistiche azzerate."))
+
+
+def write_table(stdout, stats):
+    """Tabella area/fase con percentili in millisecondi e query per fase"""
+    stdout.write(f"{'area':<10} {'fase':<8} {'n':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'query':>6}")
+    for area, stages in stats.items():
+        for stage in tracing.STAGES:
+            row = stages.get(stage)
+            if not row:
+                continue
+            stdout.write(
+                f"{area:<10} {stage:<8} {row['count']:>7} {row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms "
+                f"{row['p99_ms']:>7.2f}ms {row['max_ms']:>7.2f}ms {row['queries_p50']:>6}"
+            )
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gym import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Invia le email in coda (QR code e tessera) riusando una connessione SMTP per blocco, "
+        "entro il limite di invii al minuto; gli invii falliti vengono ritentati con attesa crescente. "
+        "Senza --once resta attivo e controlla la coda ogni --poll-interval secondi. Da lanciare in un solo processo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Invia le email già dovute ed esce")
+        parser.add_argument("--batch-size", type=int, default=50,
+                            help="Email per connessione SMTP (default: 50)")
+        parser.add_argument("--per-minute", type=int, default=None,
+                            help="Invii al minuto (default: GYM_OUTBOX_PER_MINUTE; 0 = nessun limite)")
+        parser.add_argument("--poll-interval", type=float, default=10.0,
+                            help="Secondi tra due controlli della coda vuota (default: 10)")
+
+    def handle(self, *args, **options):
+        per_minute = outbox.per_minute() if options["per_minute"] is None else options["per_minute"]
+        limiter = outbox.RateLimiter(per_minute)
+        total_sent = total_failed = 0
+        try:
+            while True:
+                close_old_connections()
+                entries = outbox.due(options["batch_size"])
+                if entries:
+                    sent, failed = outbox.send_batch(entries, limiter)
+                    total_sent += sent
+                    total_failed += failed
+                    self.stdout.write(f"{sent} inviate, {failed} non riuscite")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Totale: {total_sent} email inviate, {total_failed} non riuscite"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from gym import sweeper
+from gym.occupancy import ACCESS_LOG_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Chiude d'ufficio le sessioni aperte da più di 2 ore (un UPDATE per tabella) "
+        "e le marca come check-out automatico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Conta le sessioni scadute senza chiuderle.",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            for area, log_model in ACCESS_LOG_MODELS.items():
+                count = sweeper.stale_sessions(log_model).count()
+                self.stdout.write(f"{area}: {count} sessioni scadute da chiudere")
+            return
+
+        closed = sweeper.sweep()
+        for area, count in closed.items():
+            self.stdout.write(f"{area}: {count} sessioni chiuse")
+        self.stdout.write(self.style.SUCCESS(f"Totale sessioni chiuse: {sum(closed.values())}"))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+def close_duplicate_open_sessions(apps, schema_editor):
+    """Chiude le sessioni aperte che violerebbero il vincolo di unicità.
+
+    I tentativi negati (abbonamento scaduto) non sono sessioni e vengono chiusi
+    subito; per gli altri resta aperta solo la sessione più recente di ogni membro.
+    """
+    for model_name in ('CheckInOut', 'SalaCheckInOut'):
+        model = apps.get_model('gym', model_name)
+        open_rows = model.objects.filter(check_out__isnull=True)
+        for row in open_rows.filter(subscription_status='scaduto'):
+            model.objects.filter(pk=row.pk).update(check_out=row.check_in)
+        seen = set()
+        for row in open_rows.order_by('member_id', '-check_in', '-pk'):
+            if row.member_id in seen:
+                model.objects.filter(pk=row.pk).update(check_out=row.check_in)
+            seen.add(row.member_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0013_salamember_course_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='checkinout',
+            constraint=models.UniqueConstraint(condition=models.Q(('check_out__isnull', True)), fields=('member',), name='gym_checkinout_one_open_session'),
+        ),
+        migrations.AddConstraint(
+            model_name='salacheckinout',
+            constraint=models.UniqueConstraint(condition=models.Q(('check_out__isnull', True)), fields=('member',), name='gym_salacheckinout_one_open_session'),
+        ),
+    ]
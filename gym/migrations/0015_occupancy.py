@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_counters(apps, schema_editor):
+    """Crea i contatori partendo dalle sessioni aperte esistenti"""
+    Occupancy = apps.get_model('gym', 'Occupancy')
+    for area, model_name in (('palestra', 'CheckInOut'), ('sala', 'SalaCheckInOut')):
+        model = apps.get_model('gym', model_name)
+        Occupancy.objects.update_or_create(
+            area=area,
+            defaults={'count': model.objects.filter(check_out__isnull=True).count()},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0014_one_open_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occupancy',
+            fields=[
+                ('area', models.CharField(choices=[('palestra', 'Palestra'), ('sala', 'Sala')], max_length=10, primary_key=True, serialize=False, verbose_name='Area')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Presenti')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Aggiornato il')),
+            ],
+            options={
+                'verbose_name': 'Presenze',
+                'verbose_name_plural': 'Presenze',
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
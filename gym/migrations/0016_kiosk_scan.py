@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0015_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KioskScan',
+            fields=[
+                ('scan_id', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='ID scansione')),
+                ('kiosk', models.CharField(blank=True, default='', max_length=100, verbose_name='Kiosk')),
+                ('member_uuid', models.CharField(max_length=64, verbose_name='UUID membro')),
+                ('action', models.CharField(max_length=10, verbose_name='Azione')),
+                ('scanned_at', models.DateTimeField(verbose_name='Scansionato il')),
+                ('result', models.CharField(max_length=20, verbose_name='Esito')),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Sincronizzato il')),
+            ],
+            options={
+                'verbose_name': 'Scansione offline',
+                'verbose_name_plural': 'Scansioni offline',
+                'ordering': ['-scanned_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='checkinout',
+            name='check_in',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Check-in'),
+        ),
+        migrations.AlterField(
+            model_name='salacheckinout',
+            name='check_in',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Check-in'),
+        ),
+    ]
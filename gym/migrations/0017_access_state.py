@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:14
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_access_state(apps, schema_editor):
+    today = timezone.localdate()
+    for model_name in ('Member', 'SalaMember'):
+        model = apps.get_model('gym', model_name)
+        for member in model.objects.all():
+            state, valid_until = 'ok', None
+            if not member.subscription_start <= today <= member.subscription_end:
+                state = 'abbonamento'
+            elif not member.medical_certificate_end or member.medical_certificate_end < today:
+                state = 'certificato'
+            elif not member.registration_fee_paid_until or member.registration_fee_paid_until < today:
+                state = 'iscrizione'
+            else:
+                valid_until = min(member.subscription_end, member.medical_certificate_end, member.registration_fee_paid_until)
+            model.objects.filter(pk=member.pk).update(access_state=state, access_valid_until=valid_until)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0016_kiosk_scan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='access_state',
+            field=models.CharField(choices=[('ok', 'Accesso consentito'), ('abbonamento', 'Abbonamento scaduto'), ('certificato', 'Certificato medico scaduto'), ('iscrizione', 'Iscrizione non pagata')], db_index=True, default='abbonamento', editable=False, max_length=12, verbose_name='Stato accesso'),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='access_valid_until',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Accesso valido fino al'),
+        ),
+        migrations.AddField(
+            model_name='salamember',
+            name='access_state',
+            field=models.CharField(choices=[('ok', 'Accesso consentito'), ('abbonamento', 'Abbonamento scaduto'), ('certificato', 'Certificato medico scaduto'), ('iscrizione', 'Iscrizione non pagata')], db_index=True, default='abbonamento', editable=False, max_length=12, verbose_name='Stato accesso'),
+        ),
+        migrations.AddField(
+            model_name='salamember',
+            name='access_valid_until',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Accesso valido fino al'),
+        ),
+        migrations.RunPython(populate_access_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:18
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_expired_sessions(apps, schema_editor):
+    """Le sessioni già chiuse d'ufficio hanno l'uscita fissata esattamente a check-in + 2 ore"""
+    for model_name in ('CheckInOut', 'SalaCheckInOut'):
+        model = apps.get_model('gym', model_name)
+        model.objects.filter(check_out=F('check_in') + timedelta(seconds=7200)).update(auto_checkout=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0017_access_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkinout',
+            name='auto_checkout',
+            field=models.BooleanField(default=False, verbose_name='Check-out automatico'),
+        ),
+        migrations.AddField(
+            model_name='salacheckinout',
+            name='auto_checkout',
+            field=models.BooleanField(default=False, verbose_name='Check-out automatico'),
+        ),
+        migrations.RunPython(mark_expired_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0018_auto_checkout'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='checkinout',
+            name='member',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='gym.member', verbose_name='Membro'),
+        ),
+        migrations.AlterField(
+            model_name='salacheckinout',
+            name='member',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='gym.salamember', verbose_name='Membro Sala'),
+        ),
+        migrations.AddIndex(
+            model_name='checkinout',
+            index=models.Index(fields=['-check_in'], name='gym_checkinout_checkin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkinout',
+            index=models.Index(fields=['member', '-check_in'], name='gym_checkinout_member_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkinout',
+            index=models.Index(condition=models.Q(('check_out__isnull', True)), fields=['check_in'], name='gym_checkinout_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['-updated_at'], name='gym_member_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['subscription_end'], name='gym_member_sub_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['medical_certificate_end'], name='gym_member_cert_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['created_at'], name='gym_member_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salacheckinout',
+            index=models.Index(fields=['-check_in'], name='gym_salacheckinout_checkin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salacheckinout',
+            index=models.Index(fields=['member', '-check_in'], name='gym_salacheckinout_member_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salacheckinout',
+            index=models.Index(condition=models.Q(('check_out__isnull', True)), fields=['check_in'], name='gym_salacheckinout_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salamember',
+            index=models.Index(fields=['-updated_at'], name='gym_salamember_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salamember',
+            index=models.Index(fields=['subscription_end'], name='gym_salamember_sub_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salamember',
+            index=models.Index(fields=['medical_certificate_end'], name='gym_salamember_cert_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salamember',
+            index=models.Index(fields=['created_at'], name='gym_salamember_created_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0019_access_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('area', models.CharField(choices=[('palestra', 'Palestra'), ('sala', 'Sala')], max_length=10, verbose_name='Area')),
+                ('member_id', models.PositiveIntegerField(verbose_name='ID membro')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Destinatario')),
+                ('status', models.CharField(choices=[('in_attesa', 'In attesa'), ('inviata', 'Inviata'), ('fallita', 'Fallita')], default='in_attesa', max_length=10, verbose_name='Stato')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativi')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Prossimo tentativo')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Ultimo errore')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Creata il')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Inviata il')),
+            ],
+            options={
+                'verbose_name': 'Email in uscita',
+                'verbose_name_plural': 'Email in uscita',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='gym_outbox_due_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'in_attesa')), fields=('area', 'member_id'), name='gym_outbox_one_pending')],
+            },
+        ),
+    ]
@@ -1,15 +1,17 @@
 from django.db import models
 from django.utils import timezone
 from django.core.validators import EmailValidator, RegexValidator
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
 import uuid
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from PIL import Image
+from django.core.files.base import ContentFile
+from datetime import timedelta
+from . import eligibility, policy, qr
+
+# Una sessione senza check-out viene considerata scaduta dopo 2 ore
+SESSION_MAX_DURATION = timedelta(seconds=7200)
 
 class Member(models.Model):
+    QR_FILENAME_PREFIX = 'qr_code'
+
     id = models.AutoField(primary_key=True)
     uuid = models.CharField(max_length=36, unique=True, editable=False)
     first_name = models.CharField(max_length=100, verbose_name="Nome")
@@ -61,11 +63,33 @@ class Member(models.Model):
         verbose_name="Iscrizione pagata fino al"
     )
     note = models.TextField(blank=True, default="", verbose_name="Nota")
+    # Stato d'accesso persistito (vedi gym.eligibility): aggiornato al salvataggio e ogni notte
+    access_state = models.CharField(
+        max_length=12,
+        choices=eligibility.ACCESS_STATE_CHOICES,
+        default=eligibility.ACCESS_SUBSCRIPTION_EXPIRED,
+        db_index=True,
+        editable=False,
+        verbose_name="Stato accesso"
+    )
+    access_valid_until = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Accesso valido fino al"
+    )
 
     class Meta:
         verbose_name = "Membro"
         verbose_name_plural = "Membri"
         ordering = ['-updated_at']
+        indexes = [
+            # Ordinamento di default e filtri dell'admin
+            models.Index(fields=['-updated_at'], name='gym_member_updated_idx'),
+            models.Index(fields=['subscription_end'], name='gym_member_sub_end_idx'),
+            models.Index(fields=['medical_certificate_end'], name='gym_member_cert_end_idx'),
+            models.Index(fields=['created_at'], name='gym_member_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -73,41 +97,30 @@ class Member(models.Model):
     def save(self, *args, **kwargs):
         if not self.uuid:
             self.uuid = str(uuid.uuid4())
+        self.refresh_access_state()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'access_state', 'access_valid_until'}
         super().save(*args, **kwargs)
 
+    def refresh_access_state(self, today=None):
+        """Ricalcola access_state e access_valid_until (senza salvare)"""
+        self.access_state, self.access_valid_until = eligibility.compute(self, today or policy.current_date())
+
     def generate_qr_code(self):
-        """Generate QR code image for the member"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(str(self.uuid))
-        qr.make(fit=True)
-        
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        
-        # Save to ImageField
-        filename = f'qr_code_{self.uuid}.png'
-        self.qr_code_image.save(filename, File(buffer), save=False)
+        """Generate QR code image for the member (solo il file: vedi gym.qr.ensure_qr_code per salvarlo)"""
+        self.qr_code_image.save(qr.filename(self), ContentFile(qr.render_png(self.uuid)), save=False)
 
     @property
     def is_active(self):
         """Check if the subscription is active"""
-        today = timezone.now().date()
-        return self.subscription_start <= today <= self.subscription_end
+        return policy.SUBSCRIPTION.passes(self, policy.current_date())
 
     @property
     def days_remaining(self):
         """Calculate days remaining in subscription"""
         if self.subscription_end:
-            today = timezone.now().date()
+            today = policy.current_date()
             delta = self.subscription_end - today
             return max(0, delta.days)
         return 0
@@ -115,16 +128,13 @@ class Member(models.Model):
     @property
     def is_medical_certificate_active(self):
         """Verifica se il certificato medico è attivo"""
-        if not self.medical_certificate_end:
-            return False
-        today = timezone.now().date()
-        return today <= self.medical_certificate_end
+        return policy.MEDICAL_CERTIFICATE.passes(self, policy.current_date())
 
     @property
     def medical_certificate_days_remaining(self):
         """Calcola i giorni rimanenti del certificato medico"""
         if self.medical_certificate_end:
-            today = timezone.now().date()
+            today = policy.current_date()
             delta = self.medical_certificate_end - today
             return max(0, delta.days)
         return 0
@@ -132,14 +142,12 @@ class Member(models.Model):
     @property
     def medical_certificate_status(self):
         """Restituisce lo stato del certificato medico"""
-        if not self.medical_certificate_end:
-            return "Non specificato"
-        return "Attivo" if self.is_medical_certificate_active else "Scaduto"
+        return policy.MEDICAL_CERTIFICATE.label(self, policy.current_date())
 
     @property
     def can_access_gym(self):
         """Verifica se il membro può accedere alla palestra (abbonamento, certificato e iscrizione validi)"""
-        return self.is_active and self.is_medical_certificate_active and self.is_registration_fee_active
+        return policy.failed_rule(self, policy.current_date()) is None
 
     # =========================
     # Iscrizione annuale (20€)
@@ -150,27 +158,20 @@ class Member(models.Model):
 
     @property
     def is_registration_fee_active(self):
-        if not self.registration_fee_paid_until:
-            return False
-        today = timezone.now().date()
-        return today <= self.registration_fee_paid_until
+        return policy.REGISTRATION_FEE.passes(self, policy.current_date())
 
     @property
     def registration_fee_status(self):
-        if not self.registration_fee_paid_until:
-            return "Non pagata"
-        return "Attiva" if self.is_registration_fee_active else "Scaduta"
-
-@receiver(pre_save, sender=Member)
-def generate_member_qr_code(sender, instance, **kwargs):
-    """Signal to generate QR code before saving"""
-    if not instance.qr_code_image:
-        instance.generate_qr_code()
+        return policy.REGISTRATION_FEE.label(self, policy.current_date())
 
 class CheckInOut(models.Model):
-    member = models.ForeignKey(Member, on_delete=models.CASCADE, verbose_name="Membro")
-    check_in = models.DateTimeField(auto_now_add=True, verbose_name="Check-in")
+    # Indice sul solo FK non necessario: lo copre l'indice composto (member, -check_in)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, db_index=False, verbose_name="Membro")
+    # default invece di auto_now_add: le scansioni sincronizzate offline portano il proprio orario
+    check_in = models.DateTimeField(default=timezone.now, verbose_name="Check-in")
     check_out = models.DateTimeField(null=True, blank=True, verbose_name="Check-out")
+    # True se la sessione è stata chiusa d'ufficio allo scadere di SESSION_MAX_DURATION
+    auto_checkout = models.BooleanField(default=False, verbose_name="Check-out automatico")
     SUBSCRIPTION_STATUS_CHOICES = [
         ('attivo', 'Attivo'),
         ('scaduto', 'Scaduto'),
@@ -186,6 +187,26 @@ class CheckInOut(models.Model):
         verbose_name = "Accesso"
         verbose_name_plural = "Accessi"
         ordering = ['-check_in']
+        constraints = [
+            # Al massimo una sessione aperta per membro: il DB rifiuta il secondo check-in concorrente
+            models.UniqueConstraint(
+                fields=['member'],
+                condition=models.Q(check_out__isnull=True),
+                name='gym_checkinout_one_open_session',
+            ),
+        ]
+        indexes = [
+            # Ordinamento dell'admin, ultimi accessi, ingressi di oggi
+            models.Index(fields=['-check_in'], name='gym_checkinout_checkin_idx'),
+            # Storico del membro dal più recente (copre anche il lookup per FK)
+            models.Index(fields=['member', '-check_in'], name='gym_checkinout_member_idx'),
+            # Sessioni aperte per orario: sweeper e dashboard presenze
+            models.Index(
+                fields=['check_in'],
+                condition=models.Q(check_out__isnull=True),
+                name='gym_checkinout_open_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.member} - {self.check_in.strftime('%d/%m/%Y %H:%M')}"
@@ -202,8 +223,7 @@ class CheckInOut(models.Model):
         """Return True if check-out is not set and not expired (within 2 hours)."""
         if self.check_out:
             return False
-        now = timezone.now()
-        return (now - self.check_in).total_seconds() <= 7200
+        return timezone.now() - self.check_in <= SESSION_MAX_DURATION
 
     @property
     def status_color(self):
@@ -214,6 +234,8 @@ class CheckInOut(models.Model):
 
 class SalaMember(models.Model):
     """Modello per i membri della sala"""
+    QR_FILENAME_PREFIX = 'sala_qr_code'
+
     id = models.AutoField(primary_key=True)
     uuid = models.CharField(max_length=36, unique=True, editable=False)
     first_name = models.CharField(max_length=100, verbose_name="Nome")
@@ -271,11 +293,33 @@ class SalaMember(models.Model):
         verbose_name="Tipo di corso",
     )
     note = models.TextField(blank=True, default="", verbose_name="Nota")
+    # Stato d'accesso persistito (vedi gym.eligibility): aggiornato al salvataggio e ogni notte
+    access_state = models.CharField(
+        max_length=12,
+        choices=eligibility.ACCESS_STATE_CHOICES,
+        default=eligibility.ACCESS_SUBSCRIPTION_EXPIRED,
+        db_index=True,
+        editable=False,
+        verbose_name="Stato accesso"
+    )
+    access_valid_until = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Accesso valido fino al"
+    )
 
     class Meta:
         verbose_name = "Membro Sala"
         verbose_name_plural = "Membri Sala"
         ordering = ['-updated_at']
+        indexes = [
+            # Ordinamento di default e filtri dell'admin
+            models.Index(fields=['-updated_at'], name='gym_salamember_updated_idx'),
+            models.Index(fields=['subscription_end'], name='gym_salamember_sub_end_idx'),
+            models.Index(fields=['medical_certificate_end'], name='gym_salamember_cert_end_idx'),
+            models.Index(fields=['created_at'], name='gym_salamember_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -283,41 +327,30 @@ class SalaMember(models.Model):
     def save(self, *args, **kwargs):
         if not self.uuid:
             self.uuid = str(uuid.uuid4())
+        self.refresh_access_state()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'access_state', 'access_valid_until'}
         super().save(*args, **kwargs)
 
+    def refresh_access_state(self, today=None):
+        """Ricalcola access_state e access_valid_until (senza salvare)"""
+        self.access_state, self.access_valid_until = eligibility.compute(self, today or policy.current_date())
+
     def generate_qr_code(self):
-        """Generate QR code image for the sala member"""
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(str(self.uuid))
-        qr.make(fit=True)
-        
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        
-        # Save to ImageField
-        filename = f'sala_qr_code_{self.uuid}.png'
-        self.qr_code_image.save(filename, File(buffer), save=False)
+        """Generate QR code image for the sala member (solo il file: vedi gym.qr.ensure_qr_code per salvarlo)"""
+        self.qr_code_image.save(qr.filename(self), ContentFile(qr.render_png(self.uuid)), save=False)
 
     @property
     def is_active(self):
         """Check if the subscription is active"""
-        today = timezone.now().date()
-        return self.subscription_start <= today <= self.subscription_end
+        return policy.SUBSCRIPTION.passes(self, policy.current_date())
 
     @property
     def days_remaining(self):
         """Calculate days remaining in subscription"""
         if self.subscription_end:
-            today = timezone.now().date()
+            today = policy.current_date()
             delta = self.subscription_end - today
             return max(0, delta.days)
         return 0
@@ -325,16 +358,13 @@ class SalaMember(models.Model):
     @property
     def is_medical_certificate_active(self):
         """Verifica se il certificato medico è attivo"""
-        if not self.medical_certificate_end:
-            return False
-        today = timezone.now().date()
-        return today <= self.medical_certificate_end
+        return policy.MEDICAL_CERTIFICATE.passes(self, policy.current_date())
 
     @property
     def medical_certificate_days_remaining(self):
         """Calcola i giorni rimanenti del certificato medico"""
         if self.medical_certificate_end:
-            today = timezone.now().date()
+            today = policy.current_date()
             delta = self.medical_certificate_end - today
             return max(0, delta.days)
         return 0
@@ -342,14 +372,12 @@ class SalaMember(models.Model):
     @property
     def medical_certificate_status(self):
         """Restituisce lo stato del certificato medico"""
-        if not self.medical_certificate_end:
-            return "Non specificato"
-        return "Attivo" if self.is_medical_certificate_active else "Scaduto"
+        return policy.MEDICAL_CERTIFICATE.label(self, policy.current_date())
 
     @property
     def can_access_sala(self):
         """Verifica se il membro può accedere alla sala (abbonamento, certificato e iscrizione validi)"""
-        return self.is_active and self.is_medical_certificate_active and self.is_registration_fee_active
+        return policy.failed_rule(self, policy.current_date()) is None
 
     # =========================
     # Iscrizione annuale (20€)
@@ -360,28 +388,21 @@ class SalaMember(models.Model):
 
     @property
     def is_registration_fee_active(self):
-        if not self.registration_fee_paid_until:
-            return False
-        today = timezone.now().date()
-        return today <= self.registration_fee_paid_until
+        return policy.REGISTRATION_FEE.passes(self, policy.current_date())
 
     @property
     def registration_fee_status(self):
-        if not self.registration_fee_paid_until:
-            return "Non pagata"
-        return "Attiva" if self.is_registration_fee_active else "Scaduta"
-
-@receiver(pre_save, sender=SalaMember)
-def generate_sala_member_qr_code(sender, instance, **kwargs):
-    """Signal to generate QR code before saving"""
-    if not instance.qr_code_image:
-        instance.generate_qr_code()
+        return policy.REGISTRATION_FEE.label(self, policy.current_date())
 
 class SalaCheckInOut(models.Model):
     """Modello per i check-in/check-out dei membri di sala"""
-    member = models.ForeignKey(SalaMember, on_delete=models.CASCADE, verbose_name="Membro Sala")
-    check_in = models.DateTimeField(auto_now_add=True, verbose_name="Check-in")
+    # Indice sul solo FK non necessario: lo copre l'indice composto (member, -check_in)
+    member = models.ForeignKey(SalaMember, on_delete=models.CASCADE, db_index=False, verbose_name="Membro Sala")
+    # default invece di auto_now_add: le scansioni sincronizzate offline portano il proprio orario
+    check_in = models.DateTimeField(default=timezone.now, verbose_name="Check-in")
     check_out = models.DateTimeField(null=True, blank=True, verbose_name="Check-out")
+    # True se la sessione è stata chiusa d'ufficio allo scadere di SESSION_MAX_DURATION
+    auto_checkout = models.BooleanField(default=False, verbose_name="Check-out automatico")
     SUBSCRIPTION_STATUS_CHOICES = [
         ('attivo', 'Attivo'),
         ('scaduto', 'Scaduto'),
@@ -397,6 +418,26 @@ class SalaCheckInOut(models.Model):
         verbose_name = "Accesso Sala"
         verbose_name_plural = "Accessi Sala"
         ordering = ['-check_in']
+        constraints = [
+            # Al massimo una sessione aperta per membro: il DB rifiuta il secondo check-in concorrente
+            models.UniqueConstraint(
+                fields=['member'],
+                condition=models.Q(check_out__isnull=True),
+                name='gym_salacheckinout_one_open_session',
+            ),
+        ]
+        indexes = [
+            # Ordinamento dell'admin, ultimi accessi, ingressi di oggi
+            models.Index(fields=['-check_in'], name='gym_salacheckinout_checkin_idx'),
+            # Storico del membro dal più recente (copre anche il lookup per FK)
+            models.Index(fields=['member', '-check_in'], name='gym_salacheckinout_member_idx'),
+            # Sessioni aperte per orario: sweeper e dashboard presenze
+            models.Index(
+                fields=['check_in'],
+                condition=models.Q(check_out__isnull=True),
+                name='gym_salacheckinout_open_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.member} - {self.check_in.strftime('%d/%m/%Y %H:%M')}"
@@ -413,11 +454,97 @@ class SalaCheckInOut(models.Model):
         """Return True if check-out is not set and not expired (within 2 hours)."""
         if self.check_out:
             return False
-        now = timezone.now()
-        return (now - self.check_in).total_seconds() <= 7200
+        return timezone.now() - self.check_in <= SESSION_MAX_DURATION
 
     @property
     def status_color(self):
         if self.is_active:
             return 'green'
-        return 'red' 
\ No newline at end of file
+        return 'red' 
+
+class Occupancy(models.Model):
+    """Presenze correnti per area, aggiornate insieme a check-in e check-out"""
+    AREA_CHOICES = [
+        ('palestra', 'Palestra'),
+        ('sala', 'Sala'),
+    ]
+    area = models.CharField(max_length=10, choices=AREA_CHOICES, primary_key=True, verbose_name="Area")
+    count = models.PositiveIntegerField(default=0, verbose_name="Presenti")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Aggiornato il")
+
+    class Meta:
+        verbose_name = "Presenze"
+        verbose_name_plural = "Presenze"
+
+    def __str__(self):
+        return f"{self.get_area_display()}: {self.count}"
+
+
+class KioskScan(models.Model):
+    """Scansione registrata offline da un kiosk e sincronizzata in seguito.
+
+    L'id è generato dal kiosk: una scansione già sincronizzata viene ignorata
+    se il kiosk la reinvia.
+    """
+    scan_id = models.CharField(max_length=64, primary_key=True, verbose_name="ID scansione")
+    kiosk = models.CharField(max_length=100, blank=True, default="", verbose_name="Kiosk")
+    member_uuid = models.CharField(max_length=64, verbose_name="UUID membro")
+    action = models.CharField(max_length=10, verbose_name="Azione")
+    scanned_at = models.DateTimeField(verbose_name="Scansionato il")
+    result = models.CharField(max_length=20, verbose_name="Esito")
+    synced_at = models.DateTimeField(default=timezone.now, verbose_name="Sincronizzato il")
+
+    class Meta:
+        verbose_name = "Scansione offline"
+        verbose_name_plural = "Scansioni offline"
+        ordering = ['-scanned_at']
+
+    def __str__(self):
+        return f"{self.scan_id} ({self.action})"
+
+
+class EmailOutbox(models.Model):
+    """Email con QR code e tessera in attesa di invio da ``manage.py send_outbox``.
+
+    Il messaggio viene composto al momento dell'invio: allegati e indirizzo sono
+    quelli attuali del membro, non quelli del momento in cui è stato messo in coda.
+    """
+    STATUS_PENDING = 'in_attesa'
+    STATUS_SENT = 'inviata'
+    STATUS_FAILED = 'fallita'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'In attesa'),
+        (STATUS_SENT, 'Inviata'),
+        (STATUS_FAILED, 'Fallita'),
+    ]
+    AREA_CHOICES = Occupancy.AREA_CHOICES
+
+    area = models.CharField(max_length=10, choices=AREA_CHOICES, verbose_name="Area")
+    member_id = models.PositiveIntegerField(verbose_name="ID membro")
+    recipient = models.EmailField(verbose_name="Destinatario")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Stato")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativi")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Prossimo tentativo")
+    last_error = models.TextField(blank=True, default="", verbose_name="Ultimo errore")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Creata il")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Inviata il")
+
+    class Meta:
+        verbose_name = "Email in uscita"
+        verbose_name_plural = "Email in uscita"
+        ordering = ['-created_at']
+        constraints = [
+            # Al massimo un'email in attesa per membro: niente doppioni nella coda né doppi invii
+            models.UniqueConstraint(
+                fields=['area', 'member_id'],
+                condition=models.Q(status='in_attesa'),
+                name='gym_outbox_one_pending',
+            ),
+        ]
+        indexes = [
+            # Coda del worker: email in attesa già dovute, in ordine di scadenza
+            models.Index(fields=['status', 'next_attempt_at'], name='gym_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} ({self.get_status_display()})"
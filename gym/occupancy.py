@@ -0,0 +1,96 @@
+"""
+Contatore delle presenze per area mantenuto in modo incrementale.
+
+Ogni check-in riuscito incrementa la riga ``Occupancy`` dell'area nella stessa
+transazione dell'INSERT, ogni check-out la decrementa: leggere o verificare la
+capienza costa una riga, mai un COUNT sul registro accessi. Le sessioni rimaste
+aperte oltre ``SESSION_MAX_DURATION`` le chiude ``gym.sweeper``, che le sottrae
+dal contatore; ``recount()`` ricalcola da zero per la manutenzione. Anche le
+sessioni aperte o cancellate dall'admin aggiornano il contatore; le modifiche
+fatte direttamente sul DB (shell, import) richiedono ``recount()``
+(``manage.py occupancy --recount``).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CheckInOut, Occupancy, SalaCheckInOut
+
+ACCESS_LOG_MODELS = {
+    'palestra': CheckInOut,
+    'sala': SalaCheckInOut,
+}
+
+def capacity(area):
+    return getattr(settings, 'GYM_CAPACITY', {}).get(area)
+
+
+def enter(area):
+    """Incrementa il contatore; False se l'area è piena (nessuna modifica)."""
+    counters = Occupancy.objects.filter(area=area)
+    limit = capacity(area)
+    if limit is not None:
+        counters = counters.filter(count__lt=limit)
+    if counters.update(count=F('count') + 1, updated_at=timezone.now()) == 1:
+        return True
+    # Nessuna riga aggiornata: area piena, oppure riga dell'area mai creata (DB nuovo)
+    return _create_counter(area) and enter(area)
+
+
+def leave(area, n=1):
+    if n:
+        Occupancy.objects.filter(area=area).update(
+            count=Greatest(F('count') - n, 0),
+            updated_at=timezone.now(),
+        )
+
+
+def adjust(area, delta):
+    """Applica una variazione netta senza controllare la capienza (sincronizzazione offline, admin)"""
+    if delta > 0:
+        updated = Occupancy.objects.filter(area=area).update(count=F('count') + delta, updated_at=timezone.now())
+        if not updated and _create_counter(area):
+            adjust(area, delta)
+    elif delta < 0:
+        leave(area, -delta)
+
+
+def _create_counter(area):
+    """Crea la riga del contatore se manca; True se l'ha creata"""
+    _counter, created = Occupancy.objects.get_or_create(area=area, defaults={'count': 0})
+    return created
+
+
+def snapshot():
+    """Presenze e capienza per area: ``{area: {'count': n, 'capacity': c}}``"""
+    counts = dict(Occupancy.objects.values_list('area', 'count'))
+    return {
+        area: {'count': counts.get(area, 0), 'capacity': capacity(area)}
+        for area in ACCESS_LOG_MODELS
+    }
+
+
+def recount():
+    """Ricalcola i contatori contando le sessioni aperte (solo manutenzione)."""
+    counts = {}
+    for area, log_model in ACCESS_LOG_MODELS.items():
+        with transaction.atomic():
+            counts[area] = log_model.objects.filter(check_out__isnull=True).count()
+            Occupancy.objects.update_or_create(
+                area=area,
+                defaults={'count': counts[area], 'updated_at': timezone.now()},
+            )
+    return counts
+
+
+@receiver(post_delete, sender=CheckInOut)
+@receiver(post_delete, sender=SalaCheckInOut)
+def release_deleted_session(sender, instance, **kwargs):
+    """Una sessione aperta cancellata (anche in cascata col membro) libera il posto"""
+    if instance.check_out is None:
+        area = 'sala' if sender is SalaCheckInOut else 'palestra'
+        leave(area)
@@ -0,0 +1,228 @@
+"""
+Coda delle email con QR code e tessera (modello ``EmailOutbox``).
+
+Admin e view mettono in coda e rispondono subito; ``manage.py send_outbox``
+compone i messaggi (tessera dalla cache, ``gym.card_cache``) e li spedisce
+riusando una sola connessione SMTP per molti messaggi (``get_connection`` +
+``send_messages``), entro ``GYM_OUTBOX_PER_MINUTE`` invii al minuto. Un invio
+fallito viene ritentato con attesa crescente (``GYM_OUTBOX_RETRY_DELAY``
+raddoppiato a ogni tentativo) fino a ``GYM_OUTBOX_MAX_ATTEMPTS`` tentativi.
+
+Il worker è pensato come processo unico: due worker in parallelo potrebbero
+inviare due volte la stessa email.
+"""
+import smtplib
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import card_cache, cards, qr
+from .models import EmailOutbox
+from .resolver import MEMBER_MODELS
+
+# Testi per area: la chiave è quella di MEMBER_MODELS
+TEMPLATES = {
+    'palestra': {
+        'subject': "La tua tessera e QR code - Palestra LEVEL",
+        'access': "per l'accesso rapido",
+        'qr_prefix': "qr_code",
+    },
+    'sala': {
+        'subject': "La tua tessera e QR code - Sala LEVEL",
+        'access': "per l'accesso rapido alla sala",
+        'qr_prefix': "qr_code_sala",
+    },
+}
+
+# Errori che riguardano la connessione e non il singolo messaggio: si riapre la connessione
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def per_minute():
+    return getattr(settings, 'GYM_OUTBOX_PER_MINUTE', 20)
+
+
+def max_attempts():
+    return getattr(settings, 'GYM_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """Attesa prima del tentativo successivo al numero ``attempts``"""
+    base = getattr(settings, 'GYM_OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 3600))
+
+
+def area_of(member):
+    return next(area for area, model in MEMBER_MODELS.items() if isinstance(member, model))
+
+
+def enqueue(member):
+    """Mette in coda l'email del membro; None se non ha un indirizzo.
+
+    Se c'è già un'email in attesa per il membro non ne crea un'altra.
+    """
+    if not member.email:
+        return None
+    entry, _created = EmailOutbox.objects.get_or_create(
+        area=area_of(member),
+        member_id=member.pk,
+        status=EmailOutbox.STATUS_PENDING,
+        defaults={'recipient': member.email},
+    )
+    return entry
+
+
+def enqueue_many(members):
+    """Mette in coda le email dei membri; restituisce (in coda, senza indirizzo)"""
+    queued = skipped = 0
+    for member in members:
+        if enqueue(member) is None:
+            skipped += 1
+        else:
+            queued += 1
+    return queued, skipped
+
+
+def requeue(entries):
+    """Rimette in coda subito le email indicate; restituisce (rimesse in coda, già in coda).
+
+    Se il membro ha già un'altra email in attesa non se ne crea una seconda:
+    si anticipa quella.
+    """
+    requeued = merged = 0
+    now = timezone.now()
+    for entry in entries:
+        if entry.status == EmailOutbox.STATUS_SENT:
+            continue
+        pending = EmailOutbox.objects.filter(
+            area=entry.area, member_id=entry.member_id, status=EmailOutbox.STATUS_PENDING,
+        ).exclude(pk=entry.pk)
+        if pending.update(next_attempt_at=now):
+            merged += 1
+            continue
+        entry.status = EmailOutbox.STATUS_PENDING
+        entry.attempts = 0
+        entry.next_attempt_at = now
+        entry.save(update_fields=['status', 'attempts', 'next_attempt_at'])
+        requeued += 1
+    return requeued, merged
+
+
+def build_message(member, connection=None):
+    """Email con il QR code PNG e la tessera PDF in allegato"""
+    text = TEMPLATES[area_of(member)]
+    qr.ensure_qr_code(member)
+    body = (
+        f"Ciao {member.first_name},\n\n"
+        "in allegato trovi:\n"
+        f"- Il tuo QR code personale (PNG) {text['access']}\n"
+        "- La tua tessera completa (PDF) con tutte le informazioni\n\n"
+        "Conserva entrambi i file e porta la tessera PDF stampata o il QR code sul telefono.\n\n"
+        "A presto,\nLEVEL"
+    )
+    email = EmailMessage(
+        subject=text['subject'],
+        body=body,
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None) or settings.EMAIL_HOST_USER,
+        to=[member.email],
+        connection=connection,
+    )
+    with open(member.qr_code_image.path, 'rb') as f:
+        email.attach(
+            filename=f"{text['qr_prefix']}_{member.last_name}_{member.first_name}.png",
+            content=f.read(),
+            mimetype='image/png',
+        )
+    email.attach(
+        filename=cards.filename(member),
+        content=card_cache.card_bytes(member),
+        mimetype='application/pdf',
+    )
+    return email
+
+
+def due(limit):
+    return list(
+        EmailOutbox.objects.filter(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'pk')[:limit]
+    )
+
+
+class RateLimiter:
+    """Al massimo ``limit`` invii in una finestra mobile di 60 secondi"""
+
+    def __init__(self, limit, clock=time.monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.clock = clock
+        self.sleep = sleep
+        self._sent = deque()
+
+    def wait(self):
+        if self.limit <= 0:
+            return
+        while True:
+            now = self.clock()
+            while self._sent and now - self._sent[0] >= 60:
+                self._sent.popleft()
+            if len(self._sent) < self.limit:
+                self._sent.append(now)
+                return
+            self.sleep(60 - (now - self._sent[0]))
+
+
+def send_batch(entries, limiter, connection=None):
+    """Invia le email indicate su una sola connessione; restituisce (inviate, fallite)"""
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    try:
+        for entry in entries:
+            try:
+                model = MEMBER_MODELS[entry.area]
+                member = model.objects.filter(pk=entry.member_id).first()
+                if member is None or not member.email:
+                    _give_up(entry, "Membro eliminato o senza email")
+                    failed += 1
+                    continue
+                message = build_message(member, connection)
+                limiter.wait()
+                # Apre la connessione al primo invio e la tiene aperta per i successivi
+                connection.open()
+                connection.send_messages([message])
+            except CONNECTION_ERRORS as exc:
+                _retry(entry, exc)
+                failed += 1
+                connection.close()
+            except Exception as exc:
+                _retry(entry, exc)
+                failed += 1
+            else:
+                entry.status = EmailOutbox.STATUS_SENT
+                entry.recipient = member.email
+                entry.attempts += 1
+                entry.sent_at = timezone.now()
+                entry.last_error = ""
+                entry.save(update_fields=['status', 'recipient', 'attempts', 'sent_at', 'last_error'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _retry(entry, exc):
+    entry.attempts += 1
+    entry.last_error = f"{type(exc).__name__}: {exc}"
+    if entry.attempts >= max_attempts():
+        entry.status = EmailOutbox.STATUS_FAILED
+    else:
+        entry.next_attempt_at = timezone.now() + retry_delay(entry.attempts)
+    entry.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _give_up(entry, reason):
+    entry.status = EmailOutbox.STATUS_FAILED
+    entry.last_error = reason
+    entry.save(update_fields=['status', 'last_error'])
@@ -0,0 +1,93 @@
+"""
+Caricamento delle foto dei membri: un solo percorso per webcam e file, palestra e sala.
+
+L'immagine arriva in binario (multipart o corpo grezzo della richiesta), viene
+scritta in un file temporaneo a blocchi e normalizzata: orientamento EXIF
+applicato, ridotta entro ``GYM_PHOTO_MAX_SIZE`` pixel di lato, convertita in RGB
+e salvata come JPEG senza metadati. La foto precedente e le sue miniature
+vengono eliminate; le nuove miniature le crea ``gym.renditions`` al salvataggio.
+"""
+import io
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import renditions
+
+CHUNK_SIZE = 64 * 1024
+JPEG_QUALITY = 85
+
+
+class PhotoError(Exception):
+    """Immagine assente, troppo grande o non leggibile"""
+
+
+def max_size():
+    return getattr(settings, 'GYM_PHOTO_MAX_SIZE', 800)
+
+
+def max_upload_bytes():
+    return getattr(settings, 'GYM_PHOTO_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+
+
+def spool(stream, length=None):
+    """Copia ``stream`` in un file temporaneo a blocchi, entro il limite di dimensione"""
+    limit = max_upload_bytes()
+    if length is not None and length > limit:
+        raise PhotoError("Immagine troppo grande")
+    tmp = tempfile.TemporaryFile()
+    written = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        written += len(chunk)
+        if written > limit:
+            tmp.close()
+            raise PhotoError("Immagine troppo grande")
+        tmp.write(chunk)
+    if not written:
+        tmp.close()
+        raise PhotoError("Nessuna immagine ricevuta")
+    tmp.seek(0)
+    return tmp
+
+
+def normalize(fileobj):
+    """JPEG ridotto, con l'orientamento applicato e senza metadati"""
+    pixels = max_size()
+    try:
+        with Image.open(fileobj) as image:
+            # Per i JPEG la decodifica avviene già a scala ridotta
+            image.draft('RGB', (pixels, pixels))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail((pixels, pixels), Image.LANCZOS)
+            buffer = io.BytesIO()
+            # Nessun exif/icc_profile passato a save(): i metadati non vengono copiati
+            image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise PhotoError("Immagine non leggibile") from exc
+    return buffer.getvalue()
+
+
+def replace(member, fileobj):
+    """Normalizza l'immagine e la salva come foto del membro, eliminando la precedente"""
+    content = normalize(fileobj)
+    previous = member.photo.name if member.photo else None
+    name = f"{member._meta.model_name}_{member.pk}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+    member.photo.save(name, ContentFile(content), save=False)
+    member.save(update_fields=['photo', 'updated_at'])
+    if previous and previous != member.photo.name:
+        _delete(member.photo.storage, previous)
+    return member.photo
+
+
+def _delete(storage, name):
+    for old in [name] + [renditions.rendition_name(name, r) for r in renditions.RENDITIONS]:
+        try:
+            storage.delete(old)
+        except OSError:
+            pass
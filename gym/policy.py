@@ -0,0 +1,160 @@
+"""
+Regole d'accesso definite una sola volta.
+
+Ogni regola è un intervallo di date sul membro (abbonamento, certificato medico,
+iscrizione annuale). Dalla stessa definizione derivano:
+
+- la valutazione in Python, con un unico "oggi" per tutte le regole
+  (kiosk, property dei modelli, sincronizzazione offline);
+- le espressioni ``Q``/``Case`` equivalenti, per calcolare gli stati in SQL
+  (changelist dell'admin, report, ricalcolo di ``access_state``).
+
+Le regole sono in ordine di priorità: il primo controllo fallito decide lo stato.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db.models import BooleanField, Case, CharField, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+ACCESS_OK = 'ok'
+ACCESS_SUBSCRIPTION_EXPIRED = 'abbonamento'
+ACCESS_CERTIFICATE_EXPIRED = 'certificato'
+ACCESS_FEE_UNPAID = 'iscrizione'
+
+ACCESS_STATE_CHOICES = [
+    (ACCESS_OK, 'Accesso consentito'),
+    (ACCESS_SUBSCRIPTION_EXPIRED, 'Abbonamento scaduto'),
+    (ACCESS_CERTIFICATE_EXPIRED, 'Certificato medico scaduto'),
+    (ACCESS_FEE_UNPAID, 'Iscrizione non pagata'),
+]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Il membro passa la regola se ``start_field <= oggi <= end_field``."""
+    name: str
+    state: str
+    end_field: str
+    start_field: Optional[str] = None
+    # Messaggio mostrato al kiosk quando la regola blocca l'ingresso
+    message: str = ''
+    # Valore di subscription_status registrato sull'accesso negato
+    log_status: str = 'attivo'
+    # Etichette per l'admin: (valida, scaduta, data mancante)
+    labels: tuple = ('Attivo', 'Scaduto', 'Non specificato')
+
+    def passes(self, member, today):
+        end = getattr(member, self.end_field)
+        if not end or end < today:
+            return False
+        if self.start_field:
+            start = getattr(member, self.start_field)
+            return bool(start) and start <= today
+        return True
+
+    def q(self, today):
+        """Condizione SQL equivalente a ``passes()``."""
+        condition = Q(**{f'{self.end_field}__gte': today})
+        if self.start_field:
+            condition &= Q(**{f'{self.start_field}__lte': today})
+        return condition
+
+    def label(self, member, today):
+        if not getattr(member, self.end_field):
+            return self.labels[2]
+        return self.labels[0] if self.passes(member, today) else self.labels[1]
+
+    def label_expression(self, today):
+        """Espressione SQL equivalente a ``label()``."""
+        return Case(
+            When(**{f'{self.end_field}__isnull': True}, then=Value(self.labels[2])),
+            When(self.q(today), then=Value(self.labels[0])),
+            default=Value(self.labels[1]),
+            output_field=CharField(),
+        )
+
+
+SUBSCRIPTION = Rule(
+    name='subscription',
+    state=ACCESS_SUBSCRIPTION_EXPIRED,
+    start_field='subscription_start',
+    end_field='subscription_end',
+    message='Abbonamento scaduto: non hai accesso.',
+    log_status='scaduto',
+)
+MEDICAL_CERTIFICATE = Rule(
+    name='medical_certificate',
+    state=ACCESS_CERTIFICATE_EXPIRED,
+    end_field='medical_certificate_end',
+    message='Certificato medico scaduto: non puoi entrare.',
+)
+REGISTRATION_FEE = Rule(
+    name='registration_fee',
+    state=ACCESS_FEE_UNPAID,
+    end_field='registration_fee_paid_until',
+    message='Iscrizione annuale non pagata: non puoi entrare.',
+    labels=('Attiva', 'Scaduta', 'Non pagata'),
+)
+
+RULES = (SUBSCRIPTION, MEDICAL_CERTIFICATE, REGISTRATION_FEE)
+RULES_BY_STATE = {rule.state: rule for rule in RULES}
+
+
+def current_date():
+    """L'"oggi" da condividere fra tutte le valutazioni di una richiesta."""
+    return timezone.localdate()
+
+
+def failed_rule(member, today):
+    """La prima regola non rispettata, o ``None`` se l'accesso è consentito."""
+    for rule in RULES:
+        if not rule.passes(member, today):
+            return rule
+    return None
+
+
+def evaluate(member, today):
+    """Restituisce ``(stato, valido_fino_al)``; la data è valorizzata solo se lo stato è "ok"."""
+    rule = failed_rule(member, today)
+    if rule:
+        return rule.state, None
+    return ACCESS_OK, min(getattr(member, rule.end_field) for rule in RULES)
+
+
+def ok_condition(today):
+    condition = Q()
+    for rule in RULES:
+        condition &= rule.q(today)
+    return condition
+
+
+def state_expression(today):
+    """Espressione SQL equivalente a ``evaluate()[0]``."""
+    return Case(
+        *[When(~rule.q(today), then=Value(rule.state)) for rule in RULES],
+        default=Value(ACCESS_OK),
+        output_field=CharField(),
+    )
+
+
+def valid_until_expression(today):
+    """Espressione SQL equivalente a ``evaluate()[1]``."""
+    return Case(
+        When(ok_condition(today), then=Least(*[rule.end_field for rule in RULES])),
+        default=None,
+    )
+
+
+def annotate(queryset, today):
+    """Aggiunge ``<regola>_ok``, ``<regola>_label`` e ``access_status`` calcolati in SQL."""
+    annotations = {'access_status': state_expression(today)}
+    for rule in RULES:
+        annotations[f'{rule.name}_ok'] = Case(
+            When(rule.q(today), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+        annotations[f'{rule.name}_label'] = rule.label_expression(today)
+    return queryset.annotate(**annotations)
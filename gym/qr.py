@@ -0,0 +1,152 @@
+"""
+QR code dei membri (palestra e sala).
+
+Il PNG del QR non viene più generato nel salvataggio del membro: salvare resta
+una sola scrittura sul DB e un import di migliaia di membri non crea migliaia di
+file. Un membro senza ``qr_code_image`` è "in attesa"; il file viene creato alla
+prima richiesta che ne ha bisogno (download, email, tessera) con
+``ensure_qr_code()`` oppure in blocco da ``manage.py generate_pending_qr``.
+
+Per le pagine che mostrano il QR c'è la view ``qr_image``: l'URL contiene UUID e
+parametri di render, quindi l'immagine non cambia mai a parità di URL e può
+restare in cache nel browser; lato server i PNG restano in una cache LRU.
+
+Formati: PNG a 1 bit ottimizzato per il file salvato, le email e le pagine; SVG
+per chi lo vuole vettoriale; nelle tessere PDF il QR viene disegnato direttamente
+come tracciato (``draw``), nitido a qualsiasi scala e senza immagini da comprimere.
+"""
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.core.files.base import ContentFile
+from django.db.models import Q
+
+# Parametri del QR: cambiandoli vanno rigenerati i file (regenerate_qr_codes)
+QR_VERSION = 1
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+# Da incrementare quando cambia il modo di produrre i file a parità di parametri
+QR_RENDER_REVISION = 2
+
+QR_FORMATS = ('png', 'svg')
+QR_CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# PNG tenuti in memoria dalla view qr_image (circa 1 KB l'uno)
+QR_CACHE_SIZE = 2048
+
+
+def make_qr(data):
+    qr = qrcode.QRCode(
+        version=QR_VERSION,
+        error_correction=QR_ERROR_CORRECTION,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
+    )
+    qr.add_data(str(data))
+    qr.make(fit=True)
+    return qr
+
+
+def render_png(data):
+    """PNG a 1 bit (bianco e nero) del QR code per il dato indicato (di solito l'UUID del membro)"""
+    img = make_qr(data).make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_svg(data):
+    """SVG del QR code: un solo tracciato, dimensione indipendente dalla risoluzione"""
+    img = make_qr(data).make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def render(data, fmt='png'):
+    return render_svg(data) if fmt == 'svg' else render_png(data)
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def matrix(data):
+    """Moduli del QR, bordo compreso, come tuple di righe di booleani"""
+    return tuple(tuple(row) for row in make_qr(data).get_matrix())
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def path_operators(data):
+    """Operatori PDF dei moduli scuri, in unità di modulo con l'origine in basso a sinistra.
+
+    I moduli adiacenti di una riga diventano un solo rettangolo (``re``) e tutti
+    i rettangoli un solo riempimento (``f``). Il testo è già pronto: ``draw`` non
+    formatta più centinaia di coordinate a ogni tessera.
+    """
+    modules = matrix(str(data))
+    n = len(modules)
+    ops = []
+    for row_index, row in enumerate(modules):
+        row_y = n - 1 - row_index
+        start = None
+        for col, dark in enumerate(row + (False,)):
+            if dark and start is None:
+                start = col
+            elif not dark and start is not None:
+                ops.append(f'{start} {row_y} {col - start} 1 re')
+                start = None
+    ops.append('f')
+    return '\n'.join(ops)
+
+
+def draw(canvas, data, x, y, size):
+    """Disegna il QR su un canvas reportlab nel quadrato (x, y, size), come tracciato vettoriale"""
+    n = len(matrix(str(data)))
+    canvas.saveState()
+    # Sfondo bianco: la zona di rispetto serve ai lettori anche su sfondi colorati
+    canvas.setFillColorRGB(1, 1, 1)
+    canvas.rect(x, y, size, size, fill=True, stroke=False)
+    canvas.translate(x, y)
+    canvas.scale(size / n, size / n)
+    canvas.setFillColorRGB(0, 0, 0)
+    canvas.addLiteral(path_operators(str(data)))
+    canvas.restoreState()
+
+
+def params_key():
+    """Parametri di render in forma compatta, parte dell'URL dell'immagine"""
+    return f'v{QR_VERSION}-e{QR_ERROR_CORRECTION}-b{QR_BOX_SIZE}-m{QR_BORDER}-r{QR_RENDER_REVISION}'
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def cached_render(data, params, fmt='png'):
+    """Come ``render`` ma memorizzato per (dato, parametri, formato)"""
+    return render(data, fmt)
+
+
+def etag(data, params, fmt='png'):
+    """ETag forte: l'immagine dipende solo da dato, parametri e formato, non serve generarla"""
+    return hashlib.sha256(f'{data}|{params}|{fmt}'.encode()).hexdigest()[:32]
+
+
+def filename(member):
+    return f'{member.QR_FILENAME_PREFIX}_{member.uuid}.png'
+
+
+def is_pending(member):
+    return not member.qr_code_image
+
+
+def pending_filter():
+    return Q(qr_code_image='') | Q(qr_code_image__isnull=True)
+
+
+def ensure_qr_code(member):
+    """Genera il PNG se manca e salva solo il campo ``qr_code_image``. Restituisce il FieldFile."""
+    if is_pending(member):
+        member.qr_code_image.save(filename(member), ContentFile(render_png(member.uuid)), save=False)
+        # update() e non save(): nessun segnale, updated_at invariato
+        type(member).objects.filter(pk=member.pk).update(qr_code_image=member.qr_code_image.name)
+    return member.qr_code_image
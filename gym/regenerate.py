@@ -0,0 +1,96 @@
+"""
+Rigenerazione in blocco di QR e tessere: la parte che gira nei processi worker.
+
+Le tessere finiscono nella cache usata da download ed email (``gym.card_cache``),
+che così è già pronta dopo un cambio di grafica o di parametri del QR.
+
+Il modulo non importa i modelli a livello di modulo, così resta importabile in un
+processo avviato con ``spawn`` (Windows, macOS) prima di ``django.setup()``.
+I worker non toccano il database: ricevono i valori dei campi, ricostruiscono
+un'istanza non salvata e restituiscono al processo principale i nomi dei file da
+aggiornare sul DB.
+
+Ogni PNG viene riscritto solo se il contenuto cambia (impronta SHA-256) e sempre
+in modo atomico: file temporaneo nella stessa cartella e ``os.replace``, così un
+download concorrente o un'interruzione non lasciano mai un file a metà.
+"""
+import hashlib
+import os
+import tempfile
+
+import django
+from django.apps import apps
+
+from . import qr
+
+WRITTEN = 'scritti'
+UNCHANGED = 'invariati'
+
+
+def init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def file_sha256(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def regenerate_qr(member, force=False):
+    """Scrive il PNG del QR se diverso da quello su disco. Restituisce (nome, esito)."""
+    field = member.qr_code_image.field
+    name = field.generate_filename(member, qr.filename(member))
+    path = field.storage.path(name)
+    png = qr.render_png(member.uuid)
+    if not force and file_sha256(path) == hashlib.sha256(png).hexdigest():
+        return name, UNCHANGED
+    write_atomic(path, png)
+    return name, WRITTEN
+
+
+def regenerate_card(member, force=False):
+    """Mette in cache la tessera se non c'è già quella con l'impronta attuale dei dati"""
+    # Importa i modelli: solo dopo django.setup() nel worker
+    from . import card_cache
+
+    if force:
+        card_cache.evict(member)
+    return WRITTEN if card_cache.get(member).rendered else UNCHANGED
+
+
+def regenerate_chunk(model_label, rows, with_cards=False, force=False):
+    """Rigenera un blocco di membri (dizionari di valori dei campi).
+
+    Restituisce i contatori per esito e le coppie ``(pk, nome)`` dei membri il cui
+    ``qr_code_image`` sul DB va aggiornato.
+    """
+    model = apps.get_model(model_label)
+    counts = {'qr_' + WRITTEN: 0, 'qr_' + UNCHANGED: 0, 'card_' + WRITTEN: 0, 'card_' + UNCHANGED: 0}
+    renamed = []
+    for values in rows:
+        member = model(**values)
+        name, outcome = regenerate_qr(member, force)
+        counts['qr_' + outcome] += 1
+        if member.qr_code_image.name != name:
+            renamed.append((member.pk, name))
+            member.qr_code_image.name = name
+        if with_cards:
+            counts['card_' + regenerate_card(member, force)] += 1
+    return counts, renamed
@@ -0,0 +1,99 @@
+"""
+Miniature delle foto dei membri, generate una volta e salvate accanto all'originale.
+
+Admin, kiosk e tessera mostrano la foto in piccolo: invece di spedire o decodificare
+ogni volta lo scatto originale della webcam, per ciascun uso c'è una rendition JPEG
+quadrata di dimensione fissa:
+
+    member_photos/member_1_20250101_120000.png
+    member_photos/member_1_20250101_120000.admin.jpg
+    member_photos/member_1_20250101_120000.kiosk.jpg
+    member_photos/member_1_20250101_120000.print.jpg
+
+Le rendition vengono create al salvataggio di una nuova foto (segnale ``post_save``);
+per le foto caricate prima, o se una rendition manca o è più vecchia
+dell'originale, alla prima richiesta (``python manage.py generate_photo_renditions``
+le crea tutte in anticipo).
+"""
+import io
+import os
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from . import delivery, regenerate
+
+# Lato in pixel per uso: il doppio della dimensione mostrata per gli schermi ad alta densità
+RENDITIONS = {
+    'admin': 120,    # anteprima 60px nell'admin
+    'kiosk': 200,    # foto 100px al kiosk
+    'print': 240,    # riquadro 80pt della tessera, 3 px per punto
+}
+JPEG_QUALITY = 82
+# Rendition usate dove non c'è login (kiosk): servite con URL firmato, vedi gym.delivery
+PUBLIC_RENDITIONS = {'kiosk'}
+
+
+def rendition_name(name, rendition):
+    return f"{os.path.splitext(name)[0]}.{rendition}.jpg"
+
+
+def generate(field_file):
+    """Scrive tutte le rendition della foto; False se l'originale manca o non è leggibile"""
+    if not field_file:
+        return False
+    storage = field_file.storage
+    try:
+        with Image.open(storage.path(field_file.name)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for rendition, pixels in RENDITIONS.items():
+                thumbnail = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                regenerate.write_atomic(storage.path(rendition_name(field_file.name, rendition)), buffer.getvalue())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def path(field_file, rendition):
+    """Percorso della rendition, generata se manca o è superata; None senza foto utilizzabile"""
+    if not field_file:
+        return None
+    storage = field_file.storage
+    target = storage.path(rendition_name(field_file.name, rendition))
+    if _is_fresh(storage.path(field_file.name), target) or generate(field_file):
+        return target
+    return None
+
+
+def url(field_file, rendition):
+    """URL della rendition; l'originale se non si riesce a generarla, None senza foto.
+
+    Le rendition mostrate al kiosk, che non ha login, hanno un URL firmato.
+    """
+    if not field_file:
+        return None
+    name = field_file.name if path(field_file, rendition) is None else rendition_name(field_file.name, rendition)
+    if rendition in PUBLIC_RENDITIONS:
+        return delivery.signed_url(field_file.storage, name)
+    return field_file.storage.url(name)
+
+
+def _is_fresh(original, target):
+    try:
+        return os.stat(target).st_mtime_ns >= os.stat(original).st_mtime_ns
+    except OSError:
+        return False
+
+
+# Mittenti indicati per nome: il modulo resta importabile prima di django.setup() (worker di regenerate)
+@receiver(post_save, sender='gym.Member')
+@receiver(post_save, sender='gym.SalaMember')
+def generate_saved_photo(sender, instance, update_fields=None, **kwargs):
+    """Rendition della foto appena caricata (solo se mancano o sono superate)"""
+    if update_fields is not None and 'photo' not in update_fields:
+        return
+    if instance.photo:
+        path(instance.photo, 'print')
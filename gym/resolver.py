@@ -0,0 +1,186 @@
+"""
+Risoluzione UUID -> membro (palestra o sala) con una sola query e cache LRU in-process.
+
+La scansione di un QR deve capire a quale tabella appartiene il codice: invece di
+provare ``Member`` e poi ``SalaMember`` (due query e un'eccezione), una UNION
+restituisce in un colpo solo il tipo, la chiave primaria e le date rilevanti per
+l'accesso. La riga letta, compresi i codici sconosciuti, resta in una cache LRU di
+dimensione limitata che i segnali ``post_save``/``post_delete`` dei due modelli
+invalidano. Ogni chiamata costruisce dalla riga un'istanza nuova: chi la modifica
+non tocca quella degli altri chiamanti.
+
+La cache vive nel processo: con più processi server ognuno ha la propria copia,
+invalidata solo dai salvataggi fatti in quel processo. Per i salvataggi fatti
+altrove ogni voce scade dopo ``GYM_RESOLVER_CACHE_TTL`` secondi.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Union
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Value
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Member, SalaMember
+
+# Campi caricati per la decisione d'accesso e per la scheda mostrata al kiosk
+RESOLVER_FIELDS = (
+    'id',
+    'uuid',
+    'first_name',
+    'last_name',
+    'photo',
+    'note',
+    'subscription_start',
+    'subscription_end',
+    'medical_certificate_end',
+    'registration_fee_paid_until',
+    'access_state',
+    'access_valid_until',
+)
+
+MEMBER_MODELS = {
+    'palestra': Member,
+    'sala': SalaMember,
+}
+
+
+@dataclass(frozen=True)
+class ResolvedMember:
+    """Esito della risoluzione di un UUID."""
+    member_type: str
+    pk: int
+    subscription_start: date
+    subscription_end: date
+    medical_certificate_end: Optional[date]
+    registration_fee_paid_until: Optional[date]
+    member: Union[Member, SalaMember]
+
+    @property
+    def model(self):
+        return MEMBER_MODELS[self.member_type]
+
+
+class LRUCache:
+    """Cache LRU thread-safe di dimensione limitata; con ``ttl`` le voci scadono dopo ``ttl`` secondi."""
+
+    def __init__(self, maxsize, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and self.clock() >= expires:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = self.clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Sentinella per i codici sconosciuti, così anche i QR non validi non toccano il DB
+_NOT_FOUND = object()
+
+_cache = LRUCache(
+    getattr(settings, 'GYM_RESOLVER_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'GYM_RESOLVER_CACHE_TTL', 30),
+)
+
+
+def _lookup_queryset(member_uuid):
+    char = models.CharField()
+    palestra = Member.objects.filter(uuid=member_uuid).annotate(
+        kind=Value('palestra', output_field=char),
+        course=Value('', output_field=char),
+    ).values_list(*RESOLVER_FIELDS, 'kind', 'course').order_by()
+    sala = SalaMember.objects.filter(uuid=member_uuid).annotate(
+        kind=Value('sala', output_field=char),
+        course=F('course_type'),
+    ).values_list(*RESOLVER_FIELDS, 'kind', 'course').order_by()
+    return palestra.union(sala, all=True)
+
+
+def _build(row):
+    values = dict(zip(RESOLVER_FIELDS, row[:len(RESOLVER_FIELDS)]))
+    member_type, course = row[len(RESOLVER_FIELDS):]
+    model = MEMBER_MODELS[member_type]
+    if member_type == 'sala':
+        values['course_type'] = course
+    # Istanza con i soli campi caricati: gli altri vengono letti su richiesta.
+    # from_db() vuole i valori nell'ordine dei campi del modello.
+    field_names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    member = model.from_db('default', field_names, [values[name] for name in field_names])
+    return ResolvedMember(
+        member_type=member_type,
+        pk=values['id'],
+        subscription_start=values['subscription_start'],
+        subscription_end=values['subscription_end'],
+        medical_certificate_end=values['medical_certificate_end'],
+        registration_fee_paid_until=values['registration_fee_paid_until'],
+        member=member,
+    )
+
+
+def resolve(member_uuid):
+    """Restituisce il ``ResolvedMember`` per l'UUID indicato, o ``None`` se sconosciuto."""
+    if not member_uuid:
+        return None
+    row = _cache.get(member_uuid)
+    if row is None:
+        # Un UUID è univoco in ciascuna tabella; se per errore compare in entrambe
+        # vince il membro palestra, come nella vecchia ricerca sequenziale.
+        rows = sorted(_lookup_queryset(member_uuid), key=lambda row: row[len(RESOLVER_FIELDS)] != 'palestra')
+        row = rows[0] if rows else _NOT_FOUND
+        _cache.set(member_uuid, row)
+    # In cache c'è la riga (una tupla), non l'istanza: ogni chiamante riceve la sua
+    return None if row is _NOT_FOUND else _build(row)
+
+
+def invalidate(member_uuid):
+    if member_uuid:
+        _cache.delete(member_uuid)
+
+
+def clear():
+    _cache.clear()
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_save, sender=SalaMember)
+@receiver(post_delete, sender=Member)
+@receiver(post_delete, sender=SalaMember)
+def invalidate_resolved_member(sender, instance, **kwargs):
+    """Rimuove dalla cache il membro salvato o eliminato"""
+    invalidate(instance.uuid)
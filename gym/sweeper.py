@@ -0,0 +1,97 @@
+"""
+Chiusura in blocco delle sessioni rimaste aperte oltre ``SESSION_MAX_DURATION``.
+
+Chi dimentica il check-out lascia una riga con ``check_out`` NULL: il sweeper la
+chiude d'ufficio con un solo UPDATE per tabella, fissando l'uscita a check-in + 2
+ore e marcandola con ``auto_checkout``. Così l'insieme delle sessioni aperte resta
+piccolo e i contatori di ``occupancy`` restano allineati.
+
+Si può eseguire con ``manage.py sweep_sessions`` (cron) oppure nel processo
+server impostando ``GYM_SESSION_SWEEP_INTERVAL`` (secondi). In più il check-in
+lancia un passaggio al massimo ogni ``GYM_OCCUPANCY_EXPIRY_INTERVAL`` secondi.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import occupancy
+from .models import SESSION_MAX_DURATION
+from .occupancy import ACCESS_LOG_MODELS
+
+logger = logging.getLogger(__name__)
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+_scheduler = None
+
+
+def stale_sessions(log_model, now=None):
+    cutoff = (now or timezone.now()) - SESSION_MAX_DURATION
+    return log_model.objects.filter(check_out__isnull=True, check_in__lt=cutoff)
+
+
+def sweep(now=None):
+    """Chiude le sessioni scadute e le toglie dal contatore. Restituisce i chiusi per area."""
+    closed = {}
+    for area, log_model in ACCESS_LOG_MODELS.items():
+        with transaction.atomic():
+            closed[area] = stale_sessions(log_model, now).update(
+                check_out=F('check_in') + SESSION_MAX_DURATION,
+                auto_checkout=True,
+            )
+            occupancy.leave(area, closed[area])
+    return closed
+
+
+def sweep_if_due():
+    """Esegue sweep() al massimo una volta ogni GYM_OCCUPANCY_EXPIRY_INTERVAL secondi"""
+    global _last_sweep
+    interval = getattr(settings, 'GYM_OCCUPANCY_EXPIRY_INTERVAL', 60)
+    now = time.monotonic()
+    if now - _last_sweep < interval or not _sweep_lock.acquire(blocking=False):
+        return None
+    try:
+        _last_sweep = now
+        return sweep()
+    finally:
+        _sweep_lock.release()
+
+
+class SweepScheduler(threading.Thread):
+    """Thread daemon che chiama sweep() ogni ``interval`` secondi"""
+
+    def __init__(self, interval):
+        super().__init__(name='gym-session-sweeper', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            close_old_connections()
+            try:
+                closed = sweep()
+                if any(closed.values()):
+                    logger.info("Sessioni scadute chiuse: %s", closed)
+            except Exception:
+                logger.exception("Chiusura sessioni scadute non riuscita")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_scheduler():
+    """Avvia il thread periodico se GYM_SESSION_SWEEP_INTERVAL è impostato (una sola volta per processo)"""
+    global _scheduler
+    interval = getattr(settings, 'GYM_SESSION_SWEEP_INTERVAL', 0)
+    if not interval or _scheduler is not None:
+        return _scheduler
+    _scheduler = SweepScheduler(interval)
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,160 @@
+"""
+Sincronizzazione delle scansioni registrate dal kiosk mentre era offline.
+
+Le scansioni arrivano a blocchi con l'orario del kiosk e un id generato dal
+client. Vengono riprodotte in ordine cronologico in memoria e scritte con
+``bulk_create``/``bulk_update`` in un'unica transazione: dopo una riconnessione
+il lock di scrittura di SQLite viene preso una volta per blocco, non una per
+scansione. Gli id già visti vengono ignorati, quindi reinviare un blocco è sicuro.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import occupancy, policy, resolver
+from .models import SESSION_MAX_DURATION, KioskScan
+from .occupancy import ACCESS_LOG_MODELS
+
+MAX_BATCH_SIZE = 500
+ACTIONS = ('checkin', 'checkout')
+
+
+class SyncError(ValueError):
+    pass
+
+
+@dataclass
+class PendingScan:
+    scan_id: str
+    member_uuid: str
+    action: str
+    scanned_at: datetime
+
+
+def parse_scans(payload):
+    """Valida le scansioni ricevute dal kiosk e le ordina per orario."""
+    if not isinstance(payload, list):
+        raise SyncError("'scans' deve essere una lista.")
+    if len(payload) > MAX_BATCH_SIZE:
+        raise SyncError(f"Massimo {MAX_BATCH_SIZE} scansioni per richiesta.")
+    now = timezone.now()
+    scans = []
+    for item in payload:
+        if not isinstance(item, dict):
+            raise SyncError("Scansione non valida.")
+        scan_id = str(item.get('id') or '').strip()
+        action = item.get('action')
+        scanned_at = parse_datetime(str(item.get('scanned_at') or ''))
+        if not scan_id or len(scan_id) > 64 or action not in ACTIONS or scanned_at is None:
+            raise SyncError(f"Scansione non valida: {scan_id or '?'}")
+        if timezone.is_naive(scanned_at):
+            scanned_at = timezone.make_aware(scanned_at)
+        # Un orologio del tablet avanti non può creare accessi nel futuro
+        scanned_at = min(scanned_at, now)
+        scans.append(PendingScan(scan_id, str(item.get('uuid') or '').strip(), action, scanned_at))
+    scans.sort(key=lambda scan: scan.scanned_at)
+    return scans
+
+
+def sync_scans(scans, kiosk=''):
+    """Riproduce le scansioni offline. Restituisce ``{scan_id: esito}``."""
+    results = {}
+    with transaction.atomic():
+        seen = set(KioskScan.objects.filter(
+            scan_id__in=[scan.scan_id for scan in scans],
+        ).values_list('scan_id', flat=True))
+
+        pending = []
+        for scan in scans:
+            if scan.scan_id in seen:
+                results.setdefault(scan.scan_id, 'duplicate')
+                continue
+            seen.add(scan.scan_id)
+            resolved = resolver.resolve(scan.member_uuid) if scan.member_uuid else None
+            if resolved is None:
+                results[scan.scan_id] = 'not_found'
+            pending.append((scan, resolved))
+
+        # Sessioni aperte dei membri coinvolti: una query per area
+        open_sessions = {}
+        for area, log_model in ACCESS_LOG_MODELS.items():
+            member_ids = {resolved.pk for _, resolved in pending if resolved and resolved.member_type == area}
+            if member_ids:
+                for access in log_model.objects.filter(member_id__in=member_ids, check_out__isnull=True):
+                    open_sessions[(area, access.member_id)] = access
+
+        new_rows = {area: [] for area in ACCESS_LOG_MODELS}
+        closed_rows = {area: [] for area in ACCESS_LOG_MODELS}
+        occupancy_delta = {area: 0 for area in ACCESS_LOG_MODELS}
+
+        def close(area, access, check_out, auto=False):
+            access.check_out = check_out
+            access.auto_checkout = auto
+            occupancy_delta[area] -= 1
+            if access.pk:
+                closed_rows[area].append(access)
+
+        for scan, resolved in pending:
+            if resolved is None:
+                continue
+            area = resolved.member_type
+            log_model = ACCESS_LOG_MODELS[area]
+            key = (area, resolved.pk)
+            current = open_sessions.get(key)
+            if current and scan.scanned_at - current.check_in > SESSION_MAX_DURATION:
+                # Sessione scaduta prima di questa scansione
+                close(area, current, current.check_in + SESSION_MAX_DURATION, auto=True)
+                del open_sessions[key]
+                current = None
+
+            if scan.action == 'checkin':
+                # Le regole si valutano al giorno della scansione, non a quello della sincronizzazione
+                rule = policy.failed_rule(resolved, timezone.localtime(scan.scanned_at).date())
+                if rule:
+                    new_rows[area].append(log_model(
+                        member_id=resolved.pk,
+                        check_in=scan.scanned_at,
+                        check_out=scan.scanned_at,
+                        subscription_status=rule.log_status,
+                    ))
+                    results[scan.scan_id] = 'denied'
+                elif current:
+                    results[scan.scan_id] = 'already_checked_in'
+                else:
+                    # Offline il membro è già entrato: la capienza non si applica a posteriori
+                    access = log_model(member_id=resolved.pk, check_in=scan.scanned_at, subscription_status='attivo')
+                    new_rows[area].append(access)
+                    open_sessions[key] = access
+                    occupancy_delta[area] += 1
+                    results[scan.scan_id] = 'checkin'
+            else:
+                if current and scan.scanned_at >= current.check_in:
+                    close(area, current, scan.scanned_at)
+                    del open_sessions[key]
+                    results[scan.scan_id] = 'checkout'
+                else:
+                    results[scan.scan_id] = 'no_session'
+
+        for area, log_model in ACCESS_LOG_MODELS.items():
+            # Prima le chiusure, poi gli inserimenti: il vincolo sulle sessioni aperte resta valido
+            if closed_rows[area]:
+                log_model.objects.bulk_update(closed_rows[area], ['check_out', 'auto_checkout'])
+            if new_rows[area]:
+                log_model.objects.bulk_create(new_rows[area])
+            occupancy.adjust(area, occupancy_delta[area])
+
+        KioskScan.objects.bulk_create([
+            KioskScan(
+                scan_id=scan.scan_id,
+                kiosk=kiosk,
+                member_uuid=scan.member_uuid,
+                action=scan.action,
+                scanned_at=scan.scanned_at,
+                result=results[scan.scan_id],
+            )
+            for scan, _ in pending
+        ])
+    return results
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from gym.models import CheckInOut, Member, Occupancy, SalaCheckInOut, SalaMember
+
+
+class AccessLogAdminAddTests(TestCase):
+    """Sessioni aperte a mano dall'admin"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+        dates = {'subscription_start': date(2020, 1, 1), 'subscription_end': date(2099, 12, 31)}
+        self.member = Member.objects.create(first_name='Mario', last_name='Rossi', **dates)
+        self.sala_member = SalaMember.objects.create(first_name='Anna', last_name='Bianchi', **dates)
+
+    def add(self, model, member):
+        url = reverse(f'admin:gym_{model._meta.model_name}_add')
+        return self.client.post(url, {'member': member.pk, 'subscription_status': 'attivo'})
+
+    def test_first_open_session_is_counted(self):
+        response = self.add(CheckInOut, self.member)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Occupancy.objects.get(area='palestra').count, 1)
+
+    def test_second_open_session_is_rejected(self):
+        for model, member, area in (
+            (CheckInOut, self.member, 'palestra'),
+            (SalaCheckInOut, self.sala_member, 'sala'),
+        ):
+            with self.subTest(area=area):
+                model.objects.create(member=member)
+                response = self.add(model, member)
+                # Il form torna con l'errore invece di un 500 per IntegrityError
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, "ha già una sessione aperta")
+                self.assertEqual(model.objects.filter(member=member, check_out__isnull=True).count(), 1)
+                self.assertFalse(Occupancy.objects.filter(area=area, count__gt=0).exists())
@@ -0,0 +1,334 @@
+"""
+Tempi per fase della scansione QR, raccolti in istogrammi in memoria.
+
+Ogni scansione misura le fasi ``resolve`` (UUID -> membro), ``policy`` (regole
+d'accesso), ``write`` (scrittura sul registro accessi), ``render`` (risposta) e
+il totale, insieme al numero di query SQL eseguite in ciascuna fase. I valori
+finiscono in istogrammi log-lineari in stile HDR, uno per area e fase: memoria
+fissa, inserimento O(1) e percentili con errore relativo di circa il 3%.
+
+Le query fatte dal thread scrittore (``gym.writer``) per conto della scansione
+vengono contate nella fase in corso, di solito ``write``.
+
+Gli istogrammi vivono nel processo. ``/api/scan/stats/`` mostra quelli del
+processo che risponde; con ``GYM_SCAN_TRACE_DIR`` ogni processo salva
+periodicamente i propri in un file JSON e ``manage.py scan_stats`` li unisce.
+``scan_stats --reset`` lascia nella cartella un marcatore: ogni processo, al
+salvataggio o alla lettura successiva, azzera i propri istogrammi.
+Con ``GYM_SCAN_TRACING = False`` le fasi sono dei ``nullcontext``.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+STAGES = ('resolve', 'policy', 'write', 'render', 'total')
+PERCENTILES = (50, 95, 99)
+# Area registrata quando il codice non corrisponde a nessun membro
+NO_AREA = 'nessuna'
+
+_current = ContextVar('gym_scan_trace', default=None)
+
+
+class Histogram:
+    """Istogramma log-lineare: ``2**SUB_BITS`` bucket lineari per ogni potenza di due."""
+    SUB_BITS = 6
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def bucket(cls, value):
+        shift = max(value.bit_length() - cls.SUB_BITS, 0)
+        return (shift << cls.SUB_BITS) + (value >> shift)
+
+    @classmethod
+    def bucket_value(cls, index):
+        """Limite superiore (incluso) dei valori che cadono nel bucket"""
+        shift = index >> cls.SUB_BITS
+        base = index & ((1 << cls.SUB_BITS) - 1)
+        return ((base + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self.bucket(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.total += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other):
+        with self._lock:
+            for index, count in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + count
+            self.total += other.total
+            self.sum += other.sum
+            self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        with self._lock:
+            if not self.total:
+                return 0
+            rank = max(1, -(-self.total * p // 100))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(self.bucket_value(index), self.max)
+            return self.max
+
+    def to_dict(self):
+        with self._lock:
+            return {'counts': dict(self.counts), 'total': self.total, 'sum': self.sum, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.total = data['total']
+        histogram.sum = data['sum']
+        histogram.max = data['max']
+        return histogram
+
+
+class Registry:
+    """Istogrammi dei tempi (microsecondi) e delle query per ``(area, fase)``"""
+
+    def __init__(self):
+        self.latency = {}
+        self.queries = {}
+        self._lock = threading.Lock()
+
+    def _get(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram())
+        return histogram
+
+    def record(self, area, stage, micros, queries):
+        self._get(self.latency, (area, stage)).record(micros)
+        self._get(self.queries, (area, stage)).record(queries)
+
+    def merge(self, other):
+        for table, other_table in ((self.latency, other.latency), (self.queries, other.queries)):
+            for key, histogram in other_table.items():
+                self._get(table, key).merge(histogram)
+
+    def clear(self):
+        with self._lock:
+            self.latency.clear()
+            self.queries.clear()
+
+    def snapshot(self):
+        """``{area: {fase: {count, p50_ms, p95_ms, p99_ms, max_ms, queries_p50, queries_max}}}``"""
+        result = {}
+        for (area, stage), histogram in sorted(self.latency.items()):
+            queries = self.queries.get((area, stage)) or Histogram()
+            row = {'count': histogram.total}
+            for p in PERCENTILES:
+                row[f'p{p}_ms'] = round(histogram.percentile(p) / 1000, 3)
+            row['max_ms'] = round(histogram.max / 1000, 3)
+            row['queries_p50'] = queries.percentile(50)
+            row['queries_max'] = queries.max
+            result.setdefault(area, {})[stage] = row
+        return result
+
+    def to_dict(self):
+        return {
+            'latency': [[area, stage, h.to_dict()] for (area, stage), h in list(self.latency.items())],
+            'queries': [[area, stage, h.to_dict()] for (area, stage), h in list(self.queries.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        registry = cls()
+        for area, stage, histogram in data.get('latency', []):
+            registry.latency[(area, stage)] = Histogram.from_dict(histogram)
+        for area, stage, histogram in data.get('queries', []):
+            registry.queries[(area, stage)] = Histogram.from_dict(histogram)
+        return registry
+
+
+registry = Registry()
+
+
+class ScanTrace:
+    """Tempi e query di una singola scansione"""
+
+    def __init__(self):
+        self.area = NO_AREA
+        self.query_count = 0
+        self.stages = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: conta le query senza toccarle
+        self.query_count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name):
+        queries = self.query_count
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            micros = (time.perf_counter_ns() - start) // 1000
+            previous = self.stages.get(name, (0, 0))
+            self.stages[name] = (previous[0] + micros, previous[1] + self.query_count - queries)
+
+
+def enabled():
+    return getattr(settings, 'GYM_SCAN_TRACING', True)
+
+
+@contextmanager
+def trace_scan():
+    """Misura una scansione; dentro al blocco ``stage()`` e ``set_area()`` la arricchiscono."""
+    if not enabled():
+        yield None
+        return
+    trace = ScanTrace()
+    token = _current.set(trace)
+    try:
+        with connection.execute_wrapper(trace), trace.stage('total'):
+            yield trace
+    finally:
+        _current.reset(token)
+        for name, (micros, queries) in trace.stages.items():
+            registry.record(trace.area, name, micros, queries)
+        _export_if_due()
+
+
+def stage(name):
+    """Context manager per una fase della scansione in corso (nullcontext se non tracciata)"""
+    trace = _current.get()
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def count_queries():
+    """Conta nella scansione in corso le query di questo thread (per il thread scrittore)"""
+    trace = _current.get()
+    return connection.execute_wrapper(trace) if trace is not None else nullcontext()
+
+
+def set_area(area):
+    trace = _current.get()
+    if trace is not None:
+        trace.area = area
+
+
+def snapshot():
+    _apply_reset()
+    return registry.snapshot()
+
+
+def reset():
+    registry.clear()
+
+
+# Esportazione su file per unire gli istogrammi di più processi
+
+_export_lock = threading.Lock()
+_last_export = 0.0
+# Marcatore scritto da ``scan_stats --reset``: la sua data di modifica è l'istante dell'azzeramento
+RESET_MARKER = 'scan_trace.reset'
+# Ultimo azzeramento applicato: i processi avviati dopo il marcatore non hanno nulla da azzerare
+_reset_seen = time.time()
+
+
+def export_dir():
+    path = getattr(settings, 'GYM_SCAN_TRACE_DIR', None)
+    return Path(path) if path else None
+
+
+def request_reset():
+    """Elimina gli istogrammi salvati e chiede a ogni processo di azzerare i propri"""
+    directory = export_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / RESET_MARKER).write_text(str(time.time()))
+    for path in directory.glob('scan_trace_*.json'):
+        path.unlink(missing_ok=True)
+    registry.clear()
+
+
+def _apply_reset():
+    """Azzera gli istogrammi del processo se dopo l'ultimo azzeramento è comparso un marcatore"""
+    global _reset_seen
+    directory = export_dir()
+    if directory is None:
+        return
+    try:
+        requested = (directory / RESET_MARKER).stat().st_mtime
+    except OSError:
+        return
+    if requested > _reset_seen:
+        _reset_seen = requested
+        registry.clear()
+
+
+def export():
+    directory = export_dir()
+    if directory is None:
+        return None
+    # Prima di riscrivere il file: un processo non deve ripristinare statistiche azzerate
+    _apply_reset()
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / f'scan_trace_{os.getpid()}.json'
+    tmp = target.with_suffix('.tmp')
+    tmp.write_text(json.dumps(registry.to_dict()))
+    os.replace(tmp, target)
+    return target
+
+
+def _export_if_due():
+    global _last_export
+    if export_dir() is None:
+        return
+    interval = getattr(settings, 'GYM_SCAN_TRACE_EXPORT_INTERVAL', 30)
+    now = time.monotonic()
+    if now - _last_export < interval or not _export_lock.acquire(blocking=False):
+        return
+    try:
+        _last_export = now
+        export()
+    except OSError:
+        pass
+    finally:
+        _export_lock.release()
+
+
+def load_exported():
+    """Unisce gli istogrammi salvati da tutti i processi"""
+    merged = Registry()
+    directory = export_dir()
+    if directory is None or not directory.exists():
+        return merged
+    for path in sorted(directory.glob('scan_trace_*.json')):
+        try:
+            merged.merge(Registry.from_dict(json.loads(path.read_text())))
+        except (OSError, ValueError, KeyError):
+            continue
+    return merged
+
+
+@atexit.register
+def _export_at_exit():
+    if registry.latency and export_dir() is not None:
+        try:
+            export()
+        except OSError:
+            pass
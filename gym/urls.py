@@ -7,11 +7,19 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('scan/', views.scan, name='scan'),
     path('scan-result/', views.scan_result, name='scan_result'),
+    path('api/scan/', views.scan_api, name='scan_api'),
+    path('api/scan/sync/', views.scan_sync_api, name='scan_sync_api'),
+    path('api/scan/csrf/', views.scan_csrf_api, name='scan_csrf_api'),
+    path('api/scan/stats/', views.scan_stats_api, name='scan_stats_api'),
+    path('presenze/', views.presence_dashboard, name='presence_dashboard'),
+    path('presenze/stream/', views.presence_stream, name='presence_stream'),
     path('member/<int:member_id>/qr/', views.generate_qr, name='generate_qr'),
+    path('qr/<uuid:member_uuid>/<str:params>.<str:fmt>', views.qr_image, name='qr_image'),
     path('download-qr/<int:member_id>/', views.download_qr_code, name='download_qr'),
     path('send-qr-email/<int:member_id>/', views.send_qr_email, name='send_qr_email'),
     path('take-photo/<int:member_id>/', views.take_photo, name='take_photo'),
     path('save-photo/<int:member_id>/', views.save_photo, name='save_photo'),
+    path('photo/<str:area>/<int:member_id>/', views.upload_photo, name='upload_photo'),
     
     # URL per membri di sala
     path('sala-member/<int:member_id>/qr/', views.generate_sala_qr, name='generate_sala_qr'),
@@ -1,20 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
 from django.utils import timezone
 from django.contrib import messages
-from .models import Member, CheckInOut, SalaMember, SalaCheckInOut
-import qrcode
+from .models import Member, SalaMember
+from .checkin import process_scan
 import io
 import base64
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import etag, require_GET, require_http_methods
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.middleware.csrf import get_token
 from django.urls import reverse
 from django.contrib.admin.views.decorators import staff_member_required
-from django.core.mail import EmailMessage
-from django.conf import settings
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.utils import ImageReader
-from PIL import Image
+import asyncio
+import json
+import os
+from . import card_cache, cards, delivery, events, outbox, photos, qr, renditions, resolver, sync, tracing, writer
+from .models import SESSION_MAX_DURATION
+from .occupancy import ACCESS_LOG_MODELS
 
 def home(request):
     """Home page with scan button"""
@@ -29,535 +34,275 @@ def scan_result(request):
     """Handle QR code scan results and check-in/check-out actions"""
     member_uuid = request.GET.get("uuid")
     action = request.GET.get("action")  # 'checkin' or 'checkout'
+    with tracing.trace_scan():
+        outcome = process_scan(member_uuid, action)
+        with tracing.stage('render'):
+            return _render_scan_result(request, outcome)
+
+def _render_scan_result(request, outcome):
+    if outcome.event == 'checkout':
+        return render(request, "gym/see_you_later.html", {"member": outcome.member})
     context = {}
-    if member_uuid:
-        try:
-            # Cerca prima nei membri palestra
-            try:
-                member = Member.objects.get(uuid=member_uuid)
-                member_type = 'palestra'
-            except Member.DoesNotExist:
-                # Se non trovato, cerca nei membri sala
-                member = SalaMember.objects.get(uuid=member_uuid)
-                member_type = 'sala'
-            
-            context['member'] = member
-            context['member_type'] = member_type
-            if action == 'checkin':
-                # Verifica abbonamento
-                if not member.is_active:
-                    if member_type == 'palestra':
-                        CheckInOut.objects.create(
-                            member=member,
-                            subscription_status='scaduto'
-                        )
-                    else:  # sala
-                        SalaCheckInOut.objects.create(
-                            member=member,
-                            subscription_status='scaduto'
-                        )
-                    context['status'] = 'error'
-                    context['message'] = 'Abbonamento scaduto: non hai accesso.'
-                # Verifica certificato medico
-                elif not member.is_medical_certificate_active:
-                    if member_type == 'palestra':
-                        CheckInOut.objects.create(
-                            member=member,
-                            subscription_status='attivo'
-                        )
-                    else:  # sala
-                        SalaCheckInOut.objects.create(
-                            member=member,
-                            subscription_status='attivo'
-                        )
-                    context['status'] = 'error'
-                    context['message'] = 'Certificato medico scaduto: non puoi entrare.'
-                # Abbonamento e certificato validi
-                else:
-                    # Verifica se ha già fatto check-in
-                    if member_type == 'palestra':
-                        active_access = CheckInOut.objects.filter(
-                            member=member, 
-                            check_out__isnull=True
-                        ).order_by('-check_in').first()
-                    else:  # sala
-                        active_access = SalaCheckInOut.objects.filter(
-                            member=member, 
-                            check_out__isnull=True
-                        ).order_by('-check_in').first()
-                    
-                    if active_access and active_access.is_active:
-                        context['status'] = 'success'
-                        context['message'] = 'Hai già fatto il check-in!'
-                    else:
-                        if member_type == 'palestra':
-                            CheckInOut.objects.create(
-                                member=member,
-                                subscription_status='attivo'
-                            )
-                        else:  # sala
-                            SalaCheckInOut.objects.create(
-                                member=member,
-                                subscription_status='attivo'
-                            )
-                        context['status'] = 'success'
-                        context['message'] = 'Check-in effettuato con successo!'
-            elif action == 'checkout':
-                # Find last active access
-                if member_type == 'palestra':
-                    active_access = CheckInOut.objects.filter(member=member, check_out__isnull=True).order_by('-check_in').first()
-                else:  # sala
-                    active_access = SalaCheckInOut.objects.filter(member=member, check_out__isnull=True).order_by('-check_in').first()
-                
-                if active_access and active_access.is_active:
-                    active_access.check_out = timezone.now()
-                    active_access.save()
-                    return render(request, "gym/see_you_later.html", {"member": member})
-                else:
-                    context['status'] = 'error'
-                    context['message'] = 'Devi fare il check-in prima di poter fare il check-out.'
-            else:
-                context['member_uuid'] = member.uuid
-        except (Member.DoesNotExist, SalaMember.DoesNotExist):
-            context['status'] = 'error'
-            context['message'] = 'Membro non trovato.'
+    if outcome.resolved:
+        context['member'] = outcome.member
+        context['member_type'] = outcome.member_type
+        context['photo_url'] = renditions.url(outcome.member.photo, 'kiosk')
+    if outcome.event == 'lookup':
+        context['member_uuid'] = outcome.member.uuid
     else:
-        context['status'] = 'error'
-        context['message'] = 'QR code non valido.'
+        context['status'] = outcome.status
+        context['message'] = outcome.message
     return render(request, "gym/scan_result.html", context)
 
+@require_http_methods(["POST"])
+def scan_api(request):
+    """Versione JSON di scan_result per il kiosk: nessun cambio pagina tra una scansione e l'altra"""
+    with tracing.trace_scan():
+        outcome = process_scan(request.POST.get("uuid"), request.POST.get("action"))
+        with tracing.stage('render'):
+            return JsonResponse(_scan_payload(outcome))
+
+def _scan_payload(outcome):
+    data = {
+        'status': outcome.status,
+        'event': outcome.event,
+        'message': outcome.message,
+        'member': None,
+    }
+    member = outcome.member
+    if member:
+        data['member'] = {
+            'first_name': member.first_name,
+            'last_name': member.last_name,
+            'member_type': outcome.member_type,
+            'subscription_start': member.subscription_start.isoformat(),
+            'subscription_end': member.subscription_end.isoformat(),
+            'days_remaining': member.days_remaining,
+            'course_type': getattr(member, 'course_type', ''),
+            'note': member.note,
+            'photo_url': renditions.url(member.photo, 'kiosk'),
+        }
+    return data
+
+@staff_member_required
+def scan_stats_api(request):
+    """Percentili dei tempi per fase della scansione (istogrammi di questo processo)"""
+    return JsonResponse({
+        'enabled': tracing.enabled(),
+        'pid': os.getpid(),
+        'stats': tracing.snapshot(),
+    })
+
+@require_GET
+@never_cache
+@ensure_csrf_cookie
+def scan_csrf_api(request):
+    """Token CSRF aggiornato per il kiosk: la pagina resta aperta per giorni e il cookie può cambiare"""
+    return JsonResponse({'csrf_token': get_token(request)})
+
+@require_http_methods(["POST"])
+def scan_sync_api(request):
+    """Riceve a blocchi le scansioni registrate dal kiosk mentre era offline"""
+    try:
+        payload = json.loads(request.body)
+        scans = sync.parse_scans(payload.get('scans'))
+    except (ValueError, AttributeError) as exc:
+        return JsonResponse({'success': False, 'message': str(exc)}, status=400)
+    results = writer.run(sync.sync_scans, scans, kiosk=str(payload.get('kiosk') or '')[:100])
+    return JsonResponse({'success': True, 'results': results})
+
+@staff_member_required
+def presence_dashboard(request):
+    """Dashboard "chi è dentro" aggiornata in tempo reale via SSE"""
+    cutoff = timezone.now() - SESSION_MAX_DURATION
+    inside = []
+    recent = []
+    for area, log_model in ACCESS_LOG_MODELS.items():
+        open_sessions = log_model.objects.filter(
+            check_out__isnull=True,
+            check_in__gte=cutoff,
+        ).select_related('member').order_by('check_in')
+        for access in open_sessions:
+            inside.append({
+                'key': f"{area}-{access.member_id}",
+                'area': area,
+                'first_name': access.member.first_name,
+                'last_name': access.member.last_name,
+                'check_in': access.check_in.isoformat(),
+            })
+        for access in log_model.objects.select_related('member').order_by('-check_in')[:20]:
+            recent.append({'area': area, 'access': access})
+    recent.sort(key=lambda row: row['access'].check_in, reverse=True)
+    return render(request, 'gym/presence_dashboard.html', {
+        'inside': inside,
+        'recent': recent[:20],
+        'session_max_seconds': int(SESSION_MAX_DURATION.total_seconds()),
+    })
+
+@staff_member_required
+async def presence_stream(request):
+    """Flusso SSE degli eventi di scansione; richiede un server ASGI"""
+    if not isinstance(request, ASGIRequest):
+        # Sotto WSGI il flusso terrebbe occupato un worker per ogni dashboard aperta,
+        # sottraendolo al kiosk: la pagina ripiega sul ricaricamento periodico
+        return HttpResponse("Flusso in diretta disponibile solo con un server ASGI", status=503,
+                            content_type='text/plain; charset=utf-8')
+    broadcaster = events.get_broadcaster()
+
+    async def stream():
+        queue = broadcaster.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Commento SSE: tiene viva la connessione attraverso i proxy
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: scan\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def generate_qr(request, member_id):
     """Generate QR code for a member"""
     member = get_object_or_404(Member, id=member_id)
-    
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(str(member.uuid))
-    qr.make(fit=True)
-
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    # Convert to base64 for display
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    qr_image = base64.b64encode(buffer.getvalue()).decode()
 
     return render(request, 'gym/qr_code.html', {
         'member': member,
-        'qr_image': qr_image
+        'qr_url': _qr_image_url(member),
     })
 
+def _qr_image_url(member, fmt='png'):
+    return reverse('gym:qr_image', kwargs={'member_uuid': member.uuid, 'params': qr.params_key(), 'fmt': fmt})
+
+def _qr_image_etag(request, member_uuid, params, fmt):
+    return qr.etag(member_uuid, params, fmt)
+
+@require_GET
+@etag(_qr_image_etag)
+def qr_image(request, member_uuid, params, fmt):
+    """Immagine del QR code (PNG o SVG): a parità di URL non cambia mai, il browser la tiene in cache"""
+    if fmt not in qr.QR_FORMATS:
+        raise Http404("Formato non supportato")
+    if params != qr.params_key():
+        # Parametri cambiati dopo che la pagina è stata generata
+        return redirect('gym:qr_image', member_uuid=member_uuid, params=qr.params_key(), fmt=fmt)
+    if resolver.resolve(str(member_uuid)) is None:
+        raise Http404("Membro non trovato")
+    response = HttpResponse(qr.cached_render(str(member_uuid), params, fmt), content_type=qr.QR_CONTENT_TYPES[fmt])
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+def serve_media(request, path):
+    """File sotto MEDIA_ROOT (foto, QR): solo staff, o con l'URL firmato dato al kiosk"""
+    if not (request.user.is_active and request.user.is_staff) and not delivery.has_valid_signature(request, path):
+        raise PermissionDenied
+    return delivery.serve(request, delivery.media_path(path))
+
 @staff_member_required
 def download_qr_code(request, member_id):
     """Download QR code in PNG or PDF format"""
     member = get_object_or_404(Member, id=member_id)
     format_type = request.GET.get('format', 'png').lower()
     
-    if not member.qr_code_image:
-        # Generate QR code if not exists
-        member.generate_qr_code()
-        member.save()
+    # QR generato alla prima richiesta se ancora in attesa
+    qr.ensure_qr_code(member)
     
     if format_type == 'pdf':
-        # Create PDF with QR code
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="tessera_{member.last_name}_{member.first_name}.pdf"'
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        # Colori
-        primary_color = (0, 0.3, 0.6)  # Blu scuro
-        secondary_color = (0.9, 0.9, 0.9)  # Grigio chiaro
-        text_color = (0.2, 0.2, 0.2)  # Grigio scuro
-        
-        # Header con sfondo colorato
-        p.setFillColorRGB(*primary_color)
-        p.rect(0, height - 100, width, 100, fill=True, stroke=False)
-        
-        # Titolo principale
-        p.setFillColorRGB(1, 1, 1)  # Bianco
-        p.setFont("Helvetica-Bold", 24)
-        p.drawCentredString(width/2, height - 40, "TESSERA PALESTRA LEVEL")
-        
-        p.setFont("Helvetica", 14)
-        p.drawCentredString(width/2, height - 65, "Codice QR Personale")
-        
-        # Sezione informazioni membro
-        y_start = height - 140
-        
-        # Box informazioni con sfondo (più alto per includere certificato medico)
-        p.setFillColorRGB(*secondary_color)
-        p.rect(40, y_start - 160, width - 80, 160, fill=True, stroke=True)
-        
-        # Foto del membro (se presente)
-        photo_x = 60
-        photo_y = y_start - 100
-        if member.photo:
-            try:
-                photo = ImageReader(member.photo.path)
-                p.drawImage(photo, photo_x, photo_y, width=80, height=80, mask='auto')
-                # Cornice foto
-                p.setStrokeColorRGB(*primary_color)
-                p.setLineWidth(2)
-                p.rect(photo_x, photo_y, 80, 80, fill=False, stroke=True)
-            except:
-                # Se errore nella foto, mostra placeholder
-                p.setFillColorRGB(*primary_color)
-                p.rect(photo_x, photo_y, 80, 80, fill=True, stroke=False)
-                p.setFillColorRGB(1, 1, 1)
-                p.setFont("Helvetica-Bold", 12)
-                p.drawCentredString(photo_x + 40, photo_y + 40, "FOTO")
-        else:
-            # Placeholder per foto
-            p.setFillColorRGB(*primary_color)
-            p.rect(photo_x, photo_y, 80, 80, fill=True, stroke=False)
-            p.setFillColorRGB(1, 1, 1)
-            p.setFont("Helvetica-Bold", 12)
-            p.drawCentredString(photo_x + 40, photo_y + 40, "FOTO")
-        
-        # Informazioni membro a destra della foto
-        info_x = 160
-        p.setFillColorRGB(*text_color)
-        
-        # Nome e cognome grande
-        p.setFont("Helvetica-Bold", 18)
-        p.drawString(info_x, y_start - 25, f"{member.first_name} {member.last_name}")
-        
-        # Altre informazioni
-        p.setFont("Helvetica", 12)
-        p.drawString(info_x, y_start - 50, f"📧 Email: {member.email}")
-        p.drawString(info_x, y_start - 70, f"📱 Telefono: {member.phone}")
-        
-        # Abbonamento
-        p.drawString(info_x, y_start - 90, f"📅 Abbonamento: {member.subscription_start} → {member.subscription_end}")
-        
-        # Stato abbonamento con colore
-        status_text = "🟢 ATTIVO" if member.is_active else "🔴 SCADUTO"
-        status_color = (0, 0.6, 0) if member.is_active else (0.8, 0, 0)
-        p.setFillColorRGB(*status_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(info_x, y_start - 110, f"Stato Abbonamento: {status_text}")
-        
-        # Certificato Medico
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica", 12)
-        if member.medical_certificate_start and member.medical_certificate_end:
-            p.drawString(info_x, y_start - 130, f"🏥 Certificato: {member.medical_certificate_start} → {member.medical_certificate_end}")
-            
-            # Stato certificato medico con colore
-            cert_status_text = "🟢 VALIDO" if member.is_medical_certificate_active else "🔴 SCADUTO"
-            cert_status_color = (0, 0.6, 0) if member.is_medical_certificate_active else (0.8, 0, 0)
-            p.setFillColorRGB(*cert_status_color)
-            p.setFont("Helvetica-Bold", 12)
-            p.drawString(info_x, y_start - 150, f"Stato Certificato: {cert_status_text}")
-        else:
-            p.setFillColorRGB(0.8, 0.4, 0)  # Arancione per non specificato
-            p.setFont("Helvetica-Bold", 12)
-            p.drawString(info_x, y_start - 130, "🟠 Certificato Medico: NON SPECIFICATO")
-        
-        # Separatore (spostato più in basso)
-        p.setStrokeColorRGB(*primary_color)
-        p.setLineWidth(2)
-        p.line(40, y_start - 190, width - 40, y_start - 190)
-        
-        # Sezione QR Code - Grande e centrato (spostata più in basso)
-        qr_section_y = y_start - 220
-        
-        # Titolo sezione QR
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawCentredString(width/2, qr_section_y, "CODICE QR PER CHECK-IN")
-        
-        # QR Code grande centrato
-        if member.qr_code_image:
-            qr_size = 250  # QR code più grande
-            qr_x = (width - qr_size) / 2  # Centrato
-            qr_y = qr_section_y - qr_size - 30
-            
-            try:
-                qr_image = ImageReader(member.qr_code_image.path)
-                p.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
-                
-                # Cornice QR
-                p.setStrokeColorRGB(*primary_color)
-                p.setLineWidth(3)
-                p.rect(qr_x - 5, qr_y - 5, qr_size + 10, qr_size + 10, fill=False, stroke=True)
-            except:
-                # Placeholder QR
-                p.setFillColorRGB(*secondary_color)
-                p.rect(qr_x, qr_y, qr_size, qr_size, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica-Bold", 16)
-                p.drawCentredString(qr_x + qr_size/2, qr_y + qr_size/2, "QR CODE")
-        
-        # UUID sotto il QR
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, qr_y - 20, f"ID: {member.uuid}")
-        
-        # Footer
-        footer_y = 50
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(width/2, footer_y + 20, "LEVEL - Sistema di Gestione Palestra")
-        
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, footer_y, "Presenta questo QR code per l'accesso alla palestra")
-        
-        # Data di generazione
-        from datetime import datetime
-        p.setFont("Helvetica", 8)
-        p.drawString(40, 20, f"Generato il: {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
-        
-        p.showPage()
-        p.save()
-        
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        response.write(pdf_data)
-        return response
+        # Tessera dalla cache: si renderizza solo se i dati stampati sono cambiati
+        card = card_cache.get(member)
+        return delivery.serve(
+            request, card.path, content_type='application/pdf', as_attachment=True,
+            filename=cards.filename(member), etag=card.fingerprint,
+        )
         
     else:  # PNG format
-        response = HttpResponse(content_type='image/png')
-        response['Content-Disposition'] = f'attachment; filename="qr_code_{member.last_name}_{member.first_name}.png"'
-        
-        if member.qr_code_image:
-            with open(member.qr_code_image.path, 'rb') as f:
-                response.write(f.read())
-        
-        return response
+        return delivery.serve_field(
+            request, member.qr_code_image, content_type="image/png", as_attachment=True,
+            filename=f"qr_code_{member.last_name}_{member.first_name}.png",
+        )
 
 @staff_member_required
 def take_photo(request, member_id):
     """Interfaccia per scattare foto live con webcam"""
     member = get_object_or_404(Member, id=member_id)
-    return render(request, 'gym/take_photo.html', {'member': member})
-
-@staff_member_required
-def save_photo(request, member_id):
-    """Salva la foto scattata"""
-    if request.method == 'POST':
-        member = get_object_or_404(Member, id=member_id)
-        
-        # Ricevi l'immagine base64 dal frontend
-        image_data = request.POST.get('image_data')
-        if image_data:
-            # Rimuovi il prefix "data:image/png;base64,"
-            format, imgstr = image_data.split(';base64,')
-            ext = format.split('/')[-1]
-            
-            # Decodifica l'immagine
-            img_data = base64.b64decode(imgstr)
-            
-            # Crea il file
-            img_name = f"member_{member.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
-            
-            # Salva nel campo photo
-            from django.core.files.base import ContentFile
-            member.photo.save(img_name, ContentFile(img_data), save=True)
-            
-            return JsonResponse({'success': True, 'message': 'Foto salvata con successo!'})
-        
-        return JsonResponse({'success': False, 'message': 'Errore nel salvare la foto'})
-    
-    return JsonResponse({'success': False, 'message': 'Metodo non consentito'}) 
+    return _render_take_photo(request, member, 'palestra', 'admin:gym_member_change')
 
+def _render_take_photo(request, member, area, change_url):
+    return render(request, 'gym/take_photo.html', {
+        'member': member,
+        'upload_url': reverse('gym:upload_photo', args=[area, member.id]),
+        'back_url': reverse(change_url, args=[member.id]),
+    })
 
 @staff_member_required
-def send_qr_email(request, member_id):
-    """Invia una mail al membro con il suo QR code PNG e la tessera PDF in allegato."""
-    member = get_object_or_404(Member, id=member_id)
+@require_http_methods(["POST"])
+def upload_photo(request, area, member_id):
+    """Carica la foto del membro: file multipart (campo ``photo``) o immagine nel corpo della richiesta"""
+    model = resolver.MEMBER_MODELS.get(area)
+    if model is None:
+        raise Http404("Area sconosciuta")
+    member = get_object_or_404(model, id=member_id)
+    try:
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('photo')
+            if upload is None:
+                raise photos.PhotoError("Nessuna immagine ricevuta")
+            if upload.size > photos.max_upload_bytes():
+                raise photos.PhotoError("Immagine troppo grande")
+            with upload.open('rb') as f:
+                photo = photos.replace(member, f)
+        else:
+            length = request.META.get('CONTENT_LENGTH')
+            with photos.spool(request, int(length) if length else None) as f:
+                photo = photos.replace(member, f)
+    except photos.PhotoError as exc:
+        return JsonResponse({'success': False, 'message': str(exc)}, status=400)
+    return JsonResponse({
+        'success': True,
+        'message': 'Foto salvata con successo!',
+        'photo_url': renditions.url(photo, 'admin'),
+    })
 
+def _save_data_url_photo(request, model, member_id):
+    """Vecchio formato: immagine in base64 (data URL) nel campo ``image_data``"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Metodo non consentito'})
+    member = get_object_or_404(model, id=member_id)
+    image_data = request.POST.get('image_data')
+    if not image_data:
+        return JsonResponse({'success': False, 'message': 'Nessuna immagine ricevuta'})
     try:
-        # Assicurati che esista un'immagine del QR
-        if not member.qr_code_image:
-            member.generate_qr_code()
-            member.save()
-
-        if not member.email:
-            messages.error(request, "Il membro non ha un'email valida.")
-            return redirect(reverse('admin:gym_member_change', args=[member.id]))
-
-        subject = "La tua tessera e QR code - Palestra LEVEL"
-        body = (
-            f"Ciao {member.first_name},\n\n"
-            "in allegato trovi:\n"
-            "- Il tuo QR code personale (PNG) per l'accesso rapido\n"
-            "- La tua tessera completa (PDF) con tutte le informazioni\n\n"
-            "Conserva entrambi i file e porta la tessera PDF stampata o il QR code sul telefono.\n\n"
-            "A presto,\nLEVEL"
-        )
+        photos.replace(member, io.BytesIO(base64.b64decode(image_data.split(',')[-1])))
+    except (photos.PhotoError, ValueError) as exc:
+        return JsonResponse({'success': False, 'message': f'Errore nel salvare la foto: {exc}'})
+    return JsonResponse({'success': True, 'message': 'Foto salvata con successo!'})
 
-        email = EmailMessage(
-            subject=subject,
-            body=body,
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None) or settings.EMAIL_HOST_USER,
-            to=[member.email],
-        )
+@staff_member_required
+def save_photo(request, member_id):
+    """Salva la foto inviata come data URL (client precedenti a upload_photo)"""
+    return _save_data_url_photo(request, Member, member_id)
 
-        # Allega il QR PNG
-        with open(member.qr_code_image.path, 'rb') as f:
-            email.attach(
-                filename=f"qr_code_{member.last_name}_{member.first_name}.png",
-                content=f.read(),
-                mimetype='image/png'
-            )
-
-        # Genera e allega la tessera PDF
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.utils import ImageReader
-        import io
-        
-        # Crea PDF della tessera
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        # Colori
-        primary_color = (0, 0.3, 0.6)  # Blu scuro
-        secondary_color = (0.9, 0.9, 0.9)  # Grigio chiaro
-        text_color = (0.2, 0.2, 0.2)  # Grigio scuro
-        
-        # Header con sfondo colorato
-        p.setFillColorRGB(*primary_color)
-        p.rect(0, height - 100, width, 100, fill=True, stroke=False)
-        
-        # Titolo principale
-        p.setFillColorRGB(1, 1, 1)  # Bianco
-        p.setFont("Helvetica-Bold", 24)
-        p.drawCentredString(width/2, height - 40, "TESSERA PALESTRA LEVEL")
-        
-        p.setFont("Helvetica", 14)
-        p.drawCentredString(width/2, height - 65, "Codice QR Personale")
-        
-        # Sezione informazioni membro
-        y_start = height - 140
-        
-        # Box informazioni con sfondo (più alto per includere certificato medico)
-        p.setFillColorRGB(*secondary_color)
-        p.rect(40, y_start - 160, width - 80, 160, fill=True, stroke=True)
-        
-        # Foto del membro (se presente)
-        photo_x = 60
-        photo_y = y_start - 100
-        if member.photo:
-            try:
-                photo_image = ImageReader(member.photo.path)
-                p.drawImage(photo_image, photo_x, photo_y, width=80, height=100)
-            except:
-                # Placeholder foto
-                p.setFillColorRGB(*secondary_color)
-                p.rect(photo_x, photo_y, 80, 100, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica", 10)
-                p.drawCentredString(photo_x + 40, photo_y + 50, "FOTO")
-        
-        # Informazioni membro
-        info_x = 160
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(info_x, y_start - 20, f"{member.first_name} {member.last_name}")
-        
-        p.setFont("Helvetica", 12)
-        p.drawString(info_x, y_start - 40, f"ID: {member.uuid}")
-        p.drawString(info_x, y_start - 60, f"Email: {member.email}")
-        p.drawString(info_x, y_start - 80, f"Telefono: {member.phone}")
-        
-        # Data inizio abbonamento
-        if member.subscription_start:
-            p.drawString(info_x, y_start - 100, f"Abbonamento dal: {member.subscription_start.strftime('%d/%m/%Y')}")
-        
-        # Certificato medico
-        cert_status = "✓ Presente" if member.medical_certificate_end else "✗ Non presente"
-        cert_color = (0, 0.6, 0) if member.medical_certificate_end else (0.8, 0, 0)
-        p.setFillColorRGB(*cert_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(info_x, y_start - 120, f"Certificato Medico: {cert_status}")
-        
-        # Data scadenza abbonamento
-        if member.subscription_end:
-            p.setFillColorRGB(*text_color)
-            p.setFont("Helvetica", 12)
-            p.drawString(info_x, y_start - 140, f"Abbonamento valido fino al: {member.subscription_end.strftime('%d/%m/%Y')}")
-        
-        # Sezione QR Code
-        qr_section_y = y_start - 200
-        
-        # Titolo sezione QR
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawCentredString(width/2, qr_section_y, "CODICE QR PER CHECK-IN")
-        
-        # QR Code grande centrato
-        if member.qr_code_image:
-            qr_size = 250  # QR code più grande
-            qr_x = (width - qr_size) / 2  # Centrato
-            qr_y = qr_section_y - qr_size - 30
-            
-            try:
-                qr_image = ImageReader(member.qr_code_image.path)
-                p.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
-                
-                # Cornice QR
-                p.setStrokeColorRGB(*primary_color)
-                p.setLineWidth(3)
-                p.rect(qr_x - 5, qr_y - 5, qr_size + 10, qr_size + 10, fill=False, stroke=True)
-            except:
-                # Placeholder QR
-                p.setFillColorRGB(*secondary_color)
-                p.rect(qr_x, qr_y, qr_size, qr_size, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica-Bold", 16)
-                p.drawCentredString(qr_x + qr_size/2, qr_y + qr_size/2, "QR CODE")
-        
-        # UUID sotto il QR
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, qr_y - 20, f"ID: {member.uuid}")
-        
-        # Footer
-        footer_y = 50
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(width/2, footer_y + 20, "LEVEL - Sistema di Gestione Palestra")
-        
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, footer_y, "Presenta questo QR code per l'accesso alla palestra")
-        
-        # Data di generazione
-        from datetime import datetime
-        p.setFont("Helvetica", 8)
-        p.drawString(40, 20, f"Generato il: {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
-        
-        p.showPage()
-        p.save()
-        
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        # Allega la tessera PDF
-        email.attach(
-            filename=f"tessera_{member.last_name}_{member.first_name}.pdf",
-            content=pdf_data,
-            mimetype='application/pdf'
-        )
 
-        email.send(fail_silently=False)
-        messages.success(request, f"Email inviata a {member.email} con QR code e tessera PDF.")
-    except Exception as exc:
-        messages.error(request, f"Errore nell'invio dell'email: {exc}")
+@staff_member_required
+def send_qr_email(request, member_id):
+    """Mette in coda la mail al membro con il suo QR code PNG e la tessera PDF in allegato."""
+    member = get_object_or_404(Member, id=member_id)
+    return _queue_email(request, member, 'admin:gym_member_change')
 
-    return redirect(reverse('admin:gym_member_change', args=[member.id]))
+def _queue_email(request, member, change_url):
+    # L'invio lo fa `manage.py send_outbox`: la richiesta non aspetta il server SMTP
+    if outbox.enqueue(member) is None:
+        messages.error(request, "Il membro non ha un'email valida.")
+    else:
+        messages.success(request, f"Email con QR code e tessera PDF in coda per {member.email}.")
+    return redirect(reverse(change_url, args=[member.id]))
 
 # =========================
 # FUNZIONI PER MEMBRI DI SALA
@@ -566,28 +311,10 @@ def send_qr_email(request, member_id):
 def generate_sala_qr(request, member_id):
     """Generate QR code for a sala member"""
     member = get_object_or_404(SalaMember, id=member_id)
-    
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(str(member.uuid))
-    qr.make(fit=True)
-
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    # Convert to base64 for display
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    qr_image = base64.b64encode(buffer.getvalue()).decode()
 
     context = {
         'member': member,
-        'qr_image': qr_image
+        'qr_url': _qr_image_url(member),
     }
     
     return render(request, "gym/sala_qr_code.html", context)
@@ -598,380 +325,36 @@ def download_sala_qr_code(request, member_id):
     member = get_object_or_404(SalaMember, id=member_id)
     format_type = request.GET.get('format', 'png').lower()
     
-    if not member.qr_code_image:
-        # Generate QR code if not exists
-        member.generate_qr_code()
-        member.save()
+    # QR generato alla prima richiesta se ancora in attesa
+    qr.ensure_qr_code(member)
     
     if format_type == 'pdf':
-        # Create PDF with QR code
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="tessera_sala_{member.last_name}_{member.first_name}.pdf"'
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        # Colori per sala (rosso)
-        primary_color = (0.8, 0.2, 0.2)  # Rosso per sala
-        secondary_color = (0.9, 0.9, 0.9)  # Grigio chiaro
-        text_color = (0.2, 0.2, 0.2)  # Grigio scuro
-        
-        # Header con sfondo colorato
-        p.setFillColorRGB(*primary_color)
-        p.rect(0, height - 100, width, 100, fill=True, stroke=False)
-        
-        # Titolo principale
-        p.setFillColorRGB(1, 1, 1)  # Bianco
-        p.setFont("Helvetica-Bold", 24)
-        p.drawCentredString(width/2, height - 40, "TESSERA SALA LEVEL")
-        
-        p.setFont("Helvetica", 14)
-        p.drawCentredString(width/2, height - 65, "Codice QR Personale")
-        
-        # Sezione informazioni membro
-        y_start = height - 140
-        
-        # Box informazioni con sfondo
-        p.setFillColorRGB(*secondary_color)
-        p.rect(40, y_start - 160, width - 80, 160, fill=True, stroke=True)
-        
-        # Foto del membro (se presente)
-        photo_x = 60
-        photo_y = y_start - 100
-        if member.photo:
-            try:
-                photo_image = ImageReader(member.photo.path)
-                p.drawImage(photo_image, photo_x, photo_y, width=80, height=100)
-            except:
-                # Placeholder foto
-                p.setFillColorRGB(*secondary_color)
-                p.rect(photo_x, photo_y, 80, 100, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica", 10)
-                p.drawCentredString(photo_x + 40, photo_y + 50, "FOTO")
-        
-        # Informazioni membro
-        info_x = 160
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(info_x, y_start - 20, f"{member.first_name} {member.last_name}")
-        
-        p.setFont("Helvetica", 12)
-        p.drawString(info_x, y_start - 40, f"ID: {member.uuid}")
-        p.drawString(info_x, y_start - 60, f"Email: {member.email}")
-        p.drawString(info_x, y_start - 80, f"Telefono: {member.phone}")
-        
-        # Data inizio abbonamento
-        if member.subscription_start:
-            p.drawString(info_x, y_start - 100, f"Abbonamento dal: {member.subscription_start.strftime('%d/%m/%Y')}")
-        
-        # Certificato medico
-        cert_status = "✓ Presente" if member.medical_certificate_end else "✗ Non presente"
-        cert_color = (0, 0.6, 0) if member.medical_certificate_end else (0.8, 0, 0)
-        p.setFillColorRGB(*cert_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(info_x, y_start - 120, f"Certificato Medico: {cert_status}")
-        
-        # Data scadenza abbonamento
-        if member.subscription_end:
-            p.setFillColorRGB(*text_color)
-            p.setFont("Helvetica", 12)
-            p.drawString(info_x, y_start - 140, f"Abbonamento valido fino al: {member.subscription_end.strftime('%d/%m/%Y')}")
-        
-        # Sezione QR Code
-        qr_section_y = y_start - 200
-        
-        # Titolo sezione QR
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawCentredString(width/2, qr_section_y, "CODICE QR PER CHECK-IN SALA")
-        
-        # QR Code grande centrato
-        if member.qr_code_image:
-            qr_size = 250
-            qr_x = (width - qr_size) / 2
-            qr_y = qr_section_y - qr_size - 30
-            
-            try:
-                qr_image = ImageReader(member.qr_code_image.path)
-                p.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
-                
-                # Cornice QR
-                p.setStrokeColorRGB(*primary_color)
-                p.setLineWidth(3)
-                p.rect(qr_x - 5, qr_y - 5, qr_size + 10, qr_size + 10, fill=False, stroke=True)
-            except:
-                # Placeholder QR
-                p.setFillColorRGB(*secondary_color)
-                p.rect(qr_x, qr_y, qr_size, qr_size, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica-Bold", 16)
-                p.drawCentredString(qr_x + qr_size/2, qr_y + qr_size/2, "QR CODE")
-        
-        # UUID sotto il QR
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, qr_y - 20, f"ID: {member.uuid}")
-        
-        # Footer
-        footer_y = 50
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(width/2, footer_y + 20, "LEVEL - Sistema di Gestione Sala")
-        
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, footer_y, "Presenta questo QR code per l'accesso alla sala")
-        
-        # Data di generazione
-        from datetime import datetime
-        p.setFont("Helvetica", 8)
-        p.drawString(40, 20, f"Generato il: {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
-        
-        p.showPage()
-        p.save()
-        
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        response.write(pdf_data)
-        return response
+        # Tessera dalla cache: si renderizza solo se i dati stampati sono cambiati
+        card = card_cache.get(member)
+        return delivery.serve(
+            request, card.path, content_type='application/pdf', as_attachment=True,
+            filename=cards.filename(member), etag=card.fingerprint,
+        )
         
     else:  # PNG format
-        response = HttpResponse(content_type='image/png')
-        response['Content-Disposition'] = f'attachment; filename="qr_code_sala_{member.last_name}_{member.first_name}.png"'
-        
-        if member.qr_code_image:
-            with open(member.qr_code_image.path, 'rb') as f:
-                response.write(f.read())
-        
-        return response
+        return delivery.serve_field(
+            request, member.qr_code_image, content_type="image/png", as_attachment=True,
+            filename=f"qr_code_sala_{member.last_name}_{member.first_name}.png",
+        )
 
 @staff_member_required
 def send_sala_qr_email(request, member_id):
-    """Invia una mail al membro di sala con il suo QR code PNG e la tessera PDF in allegato."""
+    """Mette in coda la mail al membro di sala con il suo QR code PNG e la tessera PDF in allegato."""
     member = get_object_or_404(SalaMember, id=member_id)
-
-    try:
-        # Assicurati che esista un'immagine del QR
-        if not member.qr_code_image:
-            member.generate_qr_code()
-            member.save()
-
-        if not member.email:
-            messages.error(request, "Il membro non ha un'email valida.")
-            return redirect(reverse('admin:gym_salamember_change', args=[member.id]))
-
-        subject = "La tua tessera e QR code - Sala LEVEL"
-        body = (
-            f"Ciao {member.first_name},\n\n"
-            "in allegato trovi:\n"
-            "- Il tuo QR code personale (PNG) per l'accesso rapido alla sala\n"
-            "- La tua tessera completa (PDF) con tutte le informazioni\n\n"
-            "Conserva entrambi i file e porta la tessera PDF stampata o il QR code sul telefono.\n\n"
-            "A presto,\nLEVEL"
-        )
-
-        email = EmailMessage(
-            subject=subject,
-            body=body,
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None) or settings.EMAIL_HOST_USER,
-            to=[member.email],
-        )
-
-        # Allega il QR PNG
-        with open(member.qr_code_image.path, 'rb') as f:
-            email.attach(
-                filename=f"qr_code_sala_{member.last_name}_{member.first_name}.png",
-                content=f.read(),
-                mimetype='image/png'
-            )
-
-        # Genera e allega la tessera PDF (stesso codice della funzione download_sala_qr_code)
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
-        # Colori per sala (rosso)
-        primary_color = (0.8, 0.2, 0.2)  # Rosso per sala
-        secondary_color = (0.9, 0.9, 0.9)  # Grigio chiaro
-        text_color = (0.2, 0.2, 0.2)  # Grigio scuro
-        
-        # Header con sfondo colorato
-        p.setFillColorRGB(*primary_color)
-        p.rect(0, height - 100, width, 100, fill=True, stroke=False)
-        
-        # Titolo principale
-        p.setFillColorRGB(1, 1, 1)  # Bianco
-        p.setFont("Helvetica-Bold", 24)
-        p.drawCentredString(width/2, height - 40, "TESSERA SALA LEVEL")
-        
-        p.setFont("Helvetica", 14)
-        p.drawCentredString(width/2, height - 65, "Codice QR Personale")
-        
-        # Sezione informazioni membro
-        y_start = height - 140
-        
-        # Box informazioni con sfondo
-        p.setFillColorRGB(*secondary_color)
-        p.rect(40, y_start - 160, width - 80, 160, fill=True, stroke=True)
-        
-        # Foto del membro (se presente)
-        photo_x = 60
-        photo_y = y_start - 100
-        if member.photo:
-            try:
-                photo_image = ImageReader(member.photo.path)
-                p.drawImage(photo_image, photo_x, photo_y, width=80, height=100)
-            except:
-                # Placeholder foto
-                p.setFillColorRGB(*secondary_color)
-                p.rect(photo_x, photo_y, 80, 100, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica", 10)
-                p.drawCentredString(photo_x + 40, photo_y + 50, "FOTO")
-        
-        # Informazioni membro
-        info_x = 160
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(info_x, y_start - 20, f"{member.first_name} {member.last_name}")
-        
-        p.setFont("Helvetica", 12)
-        p.drawString(info_x, y_start - 40, f"ID: {member.uuid}")
-        p.drawString(info_x, y_start - 60, f"Email: {member.email}")
-        p.drawString(info_x, y_start - 80, f"Telefono: {member.phone}")
-        
-        # Data inizio abbonamento
-        if member.subscription_start:
-            p.drawString(info_x, y_start - 100, f"Abbonamento dal: {member.subscription_start.strftime('%d/%m/%Y')}")
-        
-        # Certificato medico
-        cert_status = "✓ Presente" if member.medical_certificate_end else "✗ Non presente"
-        cert_color = (0, 0.6, 0) if member.medical_certificate_end else (0.8, 0, 0)
-        p.setFillColorRGB(*cert_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(info_x, y_start - 120, f"Certificato Medico: {cert_status}")
-        
-        # Data scadenza abbonamento
-        if member.subscription_end:
-            p.setFillColorRGB(*text_color)
-            p.setFont("Helvetica", 12)
-            p.drawString(info_x, y_start - 140, f"Abbonamento valido fino al: {member.subscription_end.strftime('%d/%m/%Y')}")
-        
-        # Sezione QR Code
-        qr_section_y = y_start - 200
-        
-        # Titolo sezione QR
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 16)
-        p.drawCentredString(width/2, qr_section_y, "CODICE QR PER CHECK-IN SALA")
-        
-        # QR Code grande centrato
-        if member.qr_code_image:
-            qr_size = 250
-            qr_x = (width - qr_size) / 2
-            qr_y = qr_section_y - qr_size - 30
-            
-            try:
-                qr_image = ImageReader(member.qr_code_image.path)
-                p.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
-                
-                # Cornice QR
-                p.setStrokeColorRGB(*primary_color)
-                p.setLineWidth(3)
-                p.rect(qr_x - 5, qr_y - 5, qr_size + 10, qr_size + 10, fill=False, stroke=True)
-            except:
-                # Placeholder QR
-                p.setFillColorRGB(*secondary_color)
-                p.rect(qr_x, qr_y, qr_size, qr_size, fill=True, stroke=True)
-                p.setFillColorRGB(*text_color)
-                p.setFont("Helvetica-Bold", 16)
-                p.drawCentredString(qr_x + qr_size/2, qr_y + qr_size/2, "QR CODE")
-        
-        # UUID sotto il QR
-        p.setFillColorRGB(*text_color)
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, qr_y - 20, f"ID: {member.uuid}")
-        
-        # Footer
-        footer_y = 50
-        p.setFillColorRGB(*primary_color)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(width/2, footer_y + 20, "LEVEL - Sistema di Gestione Sala")
-        
-        p.setFont("Helvetica", 10)
-        p.drawCentredString(width/2, footer_y, "Presenta questo QR code per l'accesso alla sala")
-        
-        # Data di generazione
-        from datetime import datetime
-        p.setFont("Helvetica", 8)
-        p.drawString(40, 20, f"Generato il: {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
-        
-        p.showPage()
-        p.save()
-        
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        # Allega la tessera PDF
-        email.attach(
-            filename=f"tessera_sala_{member.last_name}_{member.first_name}.pdf",
-            content=pdf_data,
-            mimetype='application/pdf'
-        )
-
-        email.send(fail_silently=False)
-        messages.success(request, f"Email inviata a {member.email} con QR code e tessera PDF.")
-    except Exception as exc:
-        messages.error(request, f"Errore nell'invio dell'email: {exc}")
-
-    return redirect(reverse('admin:gym_salamember_change', args=[member.id]))
+    return _queue_email(request, member, 'admin:gym_salamember_change')
 
 @staff_member_required
 def take_sala_photo(request, member_id):
     """Pagina per scattare foto ai membri di sala"""
     member = get_object_or_404(SalaMember, id=member_id)
-    return render(request, 'gym/take_sala_photo.html', {'member': member})
+    return _render_take_photo(request, member, 'sala', 'admin:gym_salamember_change')
 
 @staff_member_required
 def save_sala_photo(request, member_id):
-    """Salva la foto scattata per il membro di sala"""
-    if request.method == 'POST':
-        member = get_object_or_404(SalaMember, id=member_id)
-        
-        try:
-            # Ottieni l'immagine dal form
-            image_data = request.POST.get('image_data')
-            if not image_data:
-                return JsonResponse({'success': False, 'message': 'Nessuna immagine ricevuta'})
-            
-            # Rimuovi il prefisso data:image/png;base64,
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            # Decodifica l'immagine base64
-            image_bytes = base64.b64decode(image_data)
-            
-            # Crea un oggetto Image da BytesIO
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Converti in RGB se necessario
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Salva l'immagine
-            buffer = io.BytesIO()
-            image.save(buffer, format='JPEG', quality=85)
-            buffer.seek(0)
-            
-            # Salva nel campo photo del membro
-            from django.core.files import File
-            member.photo.save(f'sala_photo_{member.uuid}.jpg', File(buffer), save=True)
-            
-            return JsonResponse({'success': True, 'message': 'Foto salvata con successo!'})
-            
-        except Exception as e:
-            return JsonResponse({'success': False, 'message': f'Errore nel salvare la foto: {str(e)}'})
-    
-    return JsonResponse({'success': False, 'message': 'Metodo non consentito'})
\ No newline at end of file
+    """Salva la foto inviata come data URL per il membro di sala (client precedenti a upload_photo)"""
+    return _save_data_url_photo(request, SalaMember, member_id)
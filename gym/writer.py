@@ -0,0 +1,67 @@
+"""
+Scrittore unico per il registro accessi.
+
+SQLite ammette un solo scrittore alla volta: con molti kiosk i thread del server
+si contendono il lock e, oltre il timeout, ricevono "database is locked". Con
+``GYM_SINGLE_WRITER`` attivo le scritture di check-in, check-out e
+sincronizzazione passano tutte da un thread dedicato con la propria connessione,
+in coda: nessuna contesa sul lock fra i thread del processo, e i lettori (admin,
+report) in WAL non bloccano mai lo scrittore.
+
+La funzione passata a ``run()`` gira nel thread scrittore: non partecipa a una
+eventuale transazione aperta dal chiamante, quindi va usata solo fuori da
+``transaction.atomic()``. Le query che esegue vengono comunque contate nella
+scansione in corso (``gym.tracing``).
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import tracing
+
+_executor = None
+_executor_lock = threading.Lock()
+_writer_thread = threading.local()
+
+
+def enabled():
+    return getattr(settings, 'GYM_SINGLE_WRITER', False)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gym-writer')
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    _writer_thread.active = True
+    # Come a inizio richiesta: scarta la connessione se scaduta o inutilizzabile
+    close_old_connections()
+    # Connessione del thread scrittore: le sue query vanno alla scansione del chiamante
+    with tracing.count_queries():
+        return fn(*args, **kwargs)
+
+
+def run(fn, *args, **kwargs):
+    """Esegue ``fn`` nel thread scrittore e ne restituisce il risultato (o rilancia l'eccezione)."""
+    if not enabled() or getattr(_writer_thread, 'active', False):
+        return fn(*args, **kwargs)
+    timeout = getattr(settings, 'GYM_SINGLE_WRITER_TIMEOUT', 30)
+    # Il contesto del chiamante porta con sé la scansione tracciata in corso
+    context = contextvars.copy_context()
+    return _get_executor().submit(context.run, _call, fn, args, kwargs).result(timeout=timeout)
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None